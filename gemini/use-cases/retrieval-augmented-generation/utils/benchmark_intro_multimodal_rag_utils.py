@@ -0,0 +1,701 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks for intro_multimodal_rag_utils, run against local fake models.
+
+Measures chunking, ingestion throughput, similarity-search latency and memory
+without calling Vertex AI (see `set_fake_model_backend`). Results can be saved
+as JSON and compared with a previous run to catch regressions in CI:
+
+    python benchmark_intro_multimodal_rag_utils.py --json results.json
+    python benchmark_intro_multimodal_rag_utils.py --baseline results.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import PIL.Image
+import fitz
+from google.api_core.exceptions import ResourceExhausted
+import intro_multimodal_rag_utils as rag_utils
+import numpy as np
+import pandas as pd
+from vertexai.vision_models import Image as vision_model_Image
+
+WORDS = (
+    "revenue cloud growth margin quarter operating income customers segment "
+    "infrastructure services advertising network devices costs expenses results "
+    "capital expenditures guidance outlook dividend shares employees"
+).split()
+
+
+# Local fake models, so the benchmarks don't call Vertex AI
+
+
+class FakeModel:
+    """
+    Base class of the fake models: simulates the latency and the quota errors of a remote model.
+
+    Outputs are deterministic functions of the inputs and `seed`. Errors are drawn from a
+    random generator seeded with `seed`, so a run with the same calls fails the same way.
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        """
+        Args:
+            latency: Seconds spent in every call.
+            error_rate: Probability of a call failing with `ResourceExhausted`.
+            seed: The seed of the outputs and errors.
+        """
+
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.calls = 0
+        self.errors = 0
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def _should_fail(self) -> bool:
+        with self.lock:
+            self.calls += 1
+            failed = self.random.random() < self.error_rate
+            self.errors += failed
+            return failed
+
+    def simulate_call(self) -> None:
+        """
+        Waits for `latency` seconds, then raises `ResourceExhausted` with probability `error_rate`.
+        """
+
+        if self.latency:
+            time.sleep(self.latency)
+        if self._should_fail():
+            raise ResourceExhausted(f"Simulated quota error of {type(self).__name__}.")
+
+    async def simulate_call_async(self) -> None:
+        """
+        Asynchronous version of `simulate_call`.
+        """
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._should_fail():
+            raise ResourceExhausted(f"Simulated quota error of {type(self).__name__}.")
+
+    def get_random_vector(self, content: bytes, dimension: int) -> list:
+        """
+        Returns a unit vector derived from the hash of `content`.
+        """
+
+        digest = hashlib.sha256(f"{self.seed}:".encode("utf-8") + content).digest()
+        vector = np.random.default_rng(list(digest)).standard_normal(dimension)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+class FakeTextEmbeddingModel(FakeModel):
+    """
+    Local stand-in for `TextEmbeddingModel`. Texts are embedded by feature hashing of their
+    words, so texts sharing words get similar embeddings.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        dimension: int = rag_utils.TEXT_EMBEDDING_DIMENSION,
+    ):
+        super().__init__(latency, error_rate, seed)
+        self.dimension = dimension
+
+    def get_text_embedding(self, text: str) -> list:
+        """
+        Returns the embedding of a text, without simulating a call.
+        """
+
+        vector = np.zeros(self.dimension)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(f"{self.seed}:{word}".encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimension
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return self.get_random_vector(text.encode("utf-8"), self.dimension)
+        return (vector / norm).tolist()
+
+    def get_embeddings(self, texts: List[str], **kwargs: Any) -> List[Any]:
+        self.simulate_call()
+        return [
+            types.SimpleNamespace(values=self.get_text_embedding(text))
+            for text in texts
+        ]
+
+    async def get_embeddings_async(self, texts: List[str], **kwargs: Any) -> List[Any]:
+        await self.simulate_call_async()
+        return [
+            types.SimpleNamespace(values=self.get_text_embedding(text))
+            for text in texts
+        ]
+
+
+class FakeMultiModalEmbeddingModel(FakeModel):
+    """
+    Local stand-in for `MultiModalEmbeddingModel`. Images are embedded as a random
+    vector derived from the hash of their bytes.
+    """
+
+    def get_embeddings(
+        self,
+        image: Optional[vision_model_Image] = None,
+        contextual_text: Optional[str] = None,
+        dimension: int = 1408,
+        **kwargs: Any,
+    ) -> Any:
+        self.simulate_call()
+        return types.SimpleNamespace(
+            image_embedding=(
+                None
+                if image is None
+                else self.get_random_vector(
+                    getattr(image, "_image_bytes", None) or b"", dimension
+                )
+            ),
+            text_embedding=(
+                None
+                if contextual_text is None
+                else self.get_random_vector(contextual_text.encode("utf-8"), dimension)
+            ),
+        )
+
+
+class FakeGenerativeModel(FakeModel):
+    """
+    Local stand-in for `GenerativeModel`. The response describes the hash of the input
+    images and is streamed in `chunks` chunks.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        chunks: int = 3,
+    ):
+        super().__init__(latency, error_rate, seed)
+        self.chunks = chunks
+
+    def get_response_chunks(self, contents: List[Any]) -> List[Any]:
+        """
+        Returns the response chunks to a list of inputs, without simulating a call.
+        """
+
+        prompt_words = 0
+        image_hashes = []
+        for part in contents if isinstance(contents, list) else [contents]:
+            if isinstance(part, str):
+                prompt_words += len(part.split())
+            else:
+                data = getattr(part, "data", None) or b""
+                image_hashes.append(hashlib.sha256(data).hexdigest()[:12])
+
+        description = (
+            f"A synthetic description of the images {' '.join(image_hashes)} "
+            f"generated for a prompt of {prompt_words} words."
+        )
+        words = description.split(" ")
+        prompt_token_count = prompt_words + 258 * len(image_hashes)
+
+        chunk_size = max(1, math.ceil(len(words) / self.chunks))
+        response_chunks = []
+        for start in range(0, len(words), chunk_size):
+            end = min(start + chunk_size, len(words))
+            response_chunks.append(
+                types.SimpleNamespace(
+                    text=" ".join(words[start:end]) + (" " if end < len(words) else ""),
+                    usage_metadata=types.SimpleNamespace(
+                        prompt_token_count=prompt_token_count,
+                        candidates_token_count=end,
+                        total_token_count=prompt_token_count + end,
+                    ),
+                )
+            )
+        return response_chunks
+
+    def generate_content(
+        self, contents: List[Any], stream: bool = False, **kwargs: Any
+    ) -> Any:
+        self.simulate_call()
+        response_chunks = self.get_response_chunks(contents)
+        if stream:
+            return iter(response_chunks)
+        return types.SimpleNamespace(
+            text="".join(chunk.text for chunk in response_chunks),
+            usage_metadata=response_chunks[-1].usage_metadata,
+        )
+
+    async def generate_content_async(
+        self, contents: List[Any], stream: bool = False, **kwargs: Any
+    ) -> Any:
+        await self.simulate_call_async()
+        response_chunks = self.get_response_chunks(contents)
+        if not stream:
+            return types.SimpleNamespace(
+                text="".join(chunk.text for chunk in response_chunks),
+                usage_metadata=response_chunks[-1].usage_metadata,
+            )
+
+        async def stream_chunks() -> AsyncIterator[Any]:
+            for chunk in response_chunks:
+                yield chunk
+
+        return stream_chunks()
+
+
+def set_fake_model_backend(
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    seed: int = 0,
+    dimension: int = rag_utils.TEXT_EMBEDDING_DIMENSION,
+) -> FakeGenerativeModel:
+    """
+    Replaces the embedding models of `intro_multimodal_rag_utils` with local fakes
+    (see `FakeModel`). Call `set_text_embedding_model(None)` and
+    `set_multimodal_embedding_model(None)` to restore the Vertex AI models.
+
+    Args:
+        latency: Seconds spent in every model call.
+        error_rate: Probability of a model call failing with `ResourceExhausted`.
+        seed: The seed of the outputs and errors.
+        dimension: The dimension of the text embeddings.
+
+    Returns:
+        A FakeGenerativeModel with the same settings, to pass to `get_document_metadata`
+        instead of the Gemini model.
+    """
+
+    rag_utils.set_text_embedding_model(
+        FakeTextEmbeddingModel(latency, error_rate, seed, dimension)
+    )
+    rag_utils.set_multimodal_embedding_model(
+        FakeMultiModalEmbeddingModel(latency, error_rate, seed)
+    )
+    return FakeGenerativeModel(latency, error_rate, seed)
+
+
+def get_latency_stats(latencies: List[float]) -> Dict[str, float]:
+    """
+    Returns the median and p95 of a list of latencies, in milliseconds.
+    """
+
+    return {
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+    }
+
+
+def get_random_text(rng: np.random.Generator, words: int) -> str:
+    """
+    Returns a text made of random words.
+    """
+
+    return " ".join(rng.choice(WORDS, words))
+
+
+def create_synthetic_pdfs(
+    folder: str, files: int, pages: int, images_per_page: int, seed: int = 0
+) -> None:
+    """
+    Writes PDF files with random text and images, including a logo repeated on every page.
+
+    Args:
+        folder: The directory to write to.
+        files: The number of PDF files.
+        pages: The number of pages per file.
+        images_per_page: The number of distinct images per page, in addition to the logo.
+        seed: The random seed.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    def get_png_bytes(pixels: np.ndarray) -> bytes:
+        buffer = io.BytesIO()
+        PIL.Image.fromarray(pixels.astype(np.uint8)).save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    logo = get_png_bytes(
+        np.tile(np.linspace(0, 255, 64), (64, 1))[..., None] * [1, 0.5, 0]
+    )
+
+    for file_number in range(files):
+        with fitz.open() as doc:
+            for _ in range(pages):
+                page = doc.new_page()
+                page.insert_textbox(
+                    fitz.Rect(50, 120, 550, 800), get_random_text(rng, 400), fontsize=8
+                )
+                page.insert_image(fitz.Rect(50, 20, 114, 84), stream=logo)
+                for image_number in range(images_per_page):
+                    x = 130 + image_number * 90
+                    page.insert_image(
+                        fitz.Rect(x, 20, x + 80, 100),
+                        stream=get_png_bytes(rng.integers(0, 256, (80, 80, 3))),
+                    )
+            doc.save(os.path.join(folder, f"document_{file_number}.pdf"))
+
+
+def benchmark_chunking(
+    text_size: int = 1024 * 1024, repeats: int = 5
+) -> Dict[str, Any]:
+    """
+    Measures the throughput of `get_text_overlapping_chunk`.
+    """
+
+    text = get_random_text(np.random.default_rng(0), text_size // 6)[:text_size]
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rag_utils.get_text_overlapping_chunk(text, character_limit=1000, overlap=100)
+        durations.append(time.perf_counter() - start)
+
+    return {"mb_per_s": text_size / 1024**2 / min(durations)}
+
+
+def benchmark_ingestion(
+    pdf_folder: str,
+    image_save_dir: str,
+    latency: float,
+    error_rate: float,
+    variants: Dict[str, Callable[..., Any]],
+) -> Dict[str, Any]:
+    """
+    Measures the throughput and peak Python memory of ingestion variants.
+
+    Args:
+        pdf_folder: The folder of the PDF files to ingest.
+        image_save_dir: The directory where extracted images are saved.
+        latency: Seconds spent in every fake model call.
+        error_rate: Probability of a fake model call failing with `ResourceExhausted`.
+        variants: Functions ingesting the folder, by name. They are called with the fake
+                  Gemini model, the PDF folder and the image directory.
+
+    Returns:
+        The results of each variant.
+    """
+
+    pages = 0
+    for file_name in os.listdir(pdf_folder):
+        with fitz.open(os.path.join(pdf_folder, file_name)) as doc:
+            pages += len(doc)
+
+    results = {}
+
+    for name, ingest in variants.items():
+        generative_model = set_fake_model_backend(latency, error_rate)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            text_metadata_df, image_metadata_df = ingest(
+                generative_model, pdf_folder, image_save_dir
+            )
+        duration = time.perf_counter() - start
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[name] = {
+            "duration_s": duration,
+            "pages_per_s": pages / duration,
+            "chunks": len(text_metadata_df),
+            "images": len(image_metadata_df),
+            "gemini_calls": generative_model.calls,
+            "peak_python_memory_mb": peak_memory / 1024**2,
+        }
+
+    return results
+
+
+def get_synthetic_text_metadata_df(
+    rows: int, dimension: int, seed: int = 0
+) -> pd.DataFrame:
+    """
+    Builds a text metadata DataFrame with clustered random chunk embeddings.
+    The embedding cells are views into a single float32 matrix, as after `load_metadata_df`.
+    """
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, rows // 500), dimension)).astype(np.float32)
+
+    embeddings: np.ndarray = np.empty((rows, dimension), dtype=np.float32)
+    for start in range(0, rows, 65536):
+        end = min(start + 65536, rows)
+        block = centers[rng.integers(0, len(centers), end - start)]
+        block += 0.5 * rng.standard_normal(block.shape, dtype=np.float32)
+        embeddings[start:end] = block / np.linalg.norm(block, axis=1, keepdims=True)
+
+    text_metadata_df = pd.DataFrame(
+        {
+            "file_name": [f"document_{i // 1000}.pdf" for i in range(rows)],
+            "page_num": np.arange(rows) // 10 % 100 + 1,
+            "chunk_number": np.arange(rows) % 10 + 1,
+            "chunk_text": [f"chunk {i}" for i in range(rows)],
+            "text_embedding_chunk": list(embeddings),
+        }
+    )
+    rag_utils.set_embedding_search_index(
+        text_metadata_df,
+        "text_embedding_chunk",
+        rag_utils.EmbeddingSearchIndex(embeddings),
+    )
+    return text_metadata_df
+
+
+def benchmark_search(
+    rows: int,
+    dimension: int,
+    queries: int,
+    top_n: int,
+    index_types: List[str],
+) -> Dict[str, Any]:
+    """
+    Measures the similarity-search latency, recall and memory of each index type.
+
+    Args:
+        rows: The number of rows of the synthetic text metadata DataFrame.
+        dimension: The dimension of the embeddings.
+        queries: The number of queries.
+        top_n: The number of results per query.
+        index_types: Any of "exact", "ivf", "float16" and "int8".
+
+    Returns:
+        The results of each index type.
+    """
+
+    set_fake_model_backend(dimension=dimension)
+    text_metadata_df = get_synthetic_text_metadata_df(rows, dimension)
+    exact_search_index = rag_utils.get_embedding_search_index(
+        text_metadata_df, "text_embedding_chunk"
+    )
+
+    rng = np.random.default_rng(1)
+    query_embeddings = exact_search_index.embeddings[rng.integers(0, rows, queries)]
+    query_embeddings = query_embeddings + 0.3 * rng.standard_normal(
+        query_embeddings.shape, dtype=np.float32
+    )
+    query_embeddings /= np.linalg.norm(query_embeddings, axis=1, keepdims=True)
+    query_texts = [get_random_text(rng, 8) for _ in range(queries)]
+
+    results: Dict[str, Any] = {}
+    for index_type in index_types:
+        start = time.perf_counter()
+        if index_type == "exact":
+            search_index: Any = exact_search_index
+            memory = exact_search_index.embeddings.nbytes
+        elif index_type == "ivf":
+            search_index = rag_utils.IVFFlatIndex.build(exact_search_index.embeddings)
+            memory = exact_search_index.embeddings.nbytes + sum(
+                positions.nbytes for positions in search_index.lists
+            )
+        else:
+            search_index = rag_utils.QuantizedEmbeddingIndex(
+                exact_search_index.embeddings, mode=index_type
+            )
+            memory = search_index.get_memory_usage()
+        build_duration = time.perf_counter() - start
+
+        rag_utils.set_embedding_search_index(
+            text_metadata_df, "text_embedding_chunk", search_index
+        )
+
+        # End-to-end latency, including the (fake) query embedding and the result dictionary
+        latencies = []
+        for query_text in query_texts:
+            start = time.perf_counter()
+            rag_utils.get_similar_text_from_query(
+                query_text,
+                text_metadata_df,
+                column_name="text_embedding_chunk",
+                top_n=top_n,
+            )
+            latencies.append(time.perf_counter() - start)
+
+        recall = rag_utils.evaluate_search_recall(
+            search_index, exact_search_index, query_embeddings, top_n
+        )
+        results[index_type] = {
+            "build_s": build_duration,
+            "memory_mb": memory / 1024**2,
+            f"recall@{top_n}": recall[f"recall@{top_n}"],
+            **get_latency_stats(latencies),
+        }
+
+    return results
+
+
+def find_regressions(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, path: str = ""
+) -> List[str]:
+    """
+    Compares two benchmark results. Durations, latencies and memory (keys ending in "_s",
+    "_ms" or "_mb") are lower-is-better, throughputs ("_per_s") and recalls higher-is-better.
+
+    Returns:
+        A description of every metric worse than the baseline by more than `tolerance`.
+    """
+
+    regressions = []
+    for key, value in results.items():
+        baseline_value = baseline.get(key)
+        if isinstance(value, dict) and isinstance(baseline_value, dict):
+            regressions += find_regressions(
+                value, baseline_value, tolerance, f"{path}{key}."
+            )
+        elif isinstance(value, (int, float)) and isinstance(
+            baseline_value, (int, float)
+        ):
+            if key.endswith("_per_s") or key.startswith("recall"):
+                regressed = value < baseline_value * (1 - tolerance)
+            elif key.endswith(("_s", "_ms", "_mb")):
+                regressed = value > baseline_value * (1 + tolerance)
+            else:
+                regressed = False
+            if regressed:
+                regressions.append(f"{path}{key}: {baseline_value:.4g} -> {value:.4g}")
+
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000, 1_000_000],
+        help="Sizes of the DataFrames searched.",
+    )
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument(
+        "--indexes",
+        nargs="+",
+        default=["exact", "ivf", "float16", "int8"],
+        choices=["exact", "ivf", "float16", "int8"],
+    )
+    parser.add_argument("--files", type=int, default=4, help="PDF files to ingest.")
+    parser.add_argument("--pages", type=int, default=10, help="Pages per PDF file.")
+    parser.add_argument("--images-per-page", type=int, default=2)
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="Seconds per fake model call."
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Probability of a fake model call failing with ResourceExhausted.",
+    )
+    parser.add_argument("--json", help="Writes the results to this file.")
+    parser.add_argument(
+        "--baseline", help="Fails if the results regressed from this JSON file."
+    )
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    # Retries of the simulated quota errors shouldn't dominate the measurements
+    rag_utils.MODEL_INITIAL_BACKOFF = 0.01
+
+    results: Dict[str, Any] = {"chunking": benchmark_chunking()}
+    print("chunking:", results["chunking"])
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        pdf_folder = os.path.join(work_dir, "pdfs")
+        os.makedirs(pdf_folder)
+        create_synthetic_pdfs(pdf_folder, args.files, args.pages, args.images_per_page)
+
+        def ingest_async(
+            generative_model: Any, pdf_folder: str, image_save_dir: str
+        ) -> Any:
+            return asyncio.run(
+                rag_utils.get_document_metadata_async(
+                    generative_model, pdf_folder, image_save_dir, "Describe the image."
+                )
+            )
+
+        results["ingestion"] = benchmark_ingestion(
+            pdf_folder,
+            os.path.join(work_dir, "images"),
+            args.latency,
+            args.error_rate,
+            {
+                "serial": lambda *a: rag_utils.get_document_metadata(
+                    *a, "Describe the image."
+                ),
+                "threads_8": lambda *a: rag_utils.get_document_metadata(
+                    *a, "Describe the image.", max_workers=8
+                ),
+                "async_16": ingest_async,
+            },
+        )
+        for name, variant_results in results["ingestion"].items():
+            print(f"ingestion {name}:", variant_results)
+
+    results["search"] = {}
+    for rows in args.rows:
+        results["search"][str(rows)] = benchmark_search(
+            rows, args.dimension, args.queries, args.top_n, args.indexes
+        )
+        for index_type, index_results in results["search"][str(rows)].items():
+            print(f"search {rows} rows {index_type}:", index_results)
+
+    # Peak resident memory of the whole run (kilobytes on Linux)
+    results["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print("max_rss_mb:", results["max_rss_mb"])
+
+    rag_utils.set_text_embedding_model(None)
+    rag_utils.set_multimodal_embedding_model(None)
+
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(
+                results, json.load(baseline_file), args.tolerance
+            )
+        if regressions:
+            print("Regressions:", *regressions, sep="\n  ")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
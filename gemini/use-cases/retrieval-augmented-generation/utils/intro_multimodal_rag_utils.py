@@ -1,12 +1,48 @@
+import asyncio
+from collections import Counter, deque
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+import contextvars
+import functools
 import glob
+import hashlib
+import io
+import json
+import math
 import os
+import random
+import re
+import shutil
+import sqlite3
+import threading
 import time
-from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import weakref
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Tuple,
+    Union,
+)
 
 from IPython.display import display
 import PIL
+import PIL.Image
 from colorama import Fore, Style
 import fitz
+from google.api_core.exceptions import ResourceExhausted
 import numpy as np
 import pandas as pd
 from vertexai.generative_models import (
@@ -19,10 +55,829 @@ from vertexai.language_models import TextEmbeddingModel
 from vertexai.vision_models import Image as vision_model_Image
 from vertexai.vision_models import MultiModalEmbeddingModel
 
-text_embedding_model = TextEmbeddingModel.from_pretrained("textembedding-gecko@latest")
-multimodal_embedding_model = MultiModalEmbeddingModel.from_pretrained(
-    "multimodalembedding@001"
-)
+TEXT_EMBEDDING_MODEL_NAME = "textembedding-gecko@latest"
+MULTIMODAL_EMBEDDING_MODEL_NAME = "multimodalembedding@001"
+
+# Models are created on first use (see `get_text_embedding_model`), so importing
+# this module makes no network calls and doesn't need credentials
+_models: Dict[str, Any] = {}
+_models_lock = threading.Lock()
+
+
+def _get_model(name: str, create_model: Callable[[], Any]) -> Any:
+    # A model assigned to the module attribute (`module.text_embedding_model = model`)
+    # takes precedence, as it did when the models were created at import time
+    model = globals().get(name)
+    if model is not None:
+        return model
+
+    model = _models.get(name)
+    if model is None:
+        with _models_lock:
+            model = _models.get(name)
+            if model is None:
+                model = _models[name] = create_model()
+    return model
+
+
+def get_text_embedding_model() -> TextEmbeddingModel:
+    """
+    Returns the process-wide text embedding model, creating it on first use.
+    A model assigned to the module's `text_embedding_model` attribute is returned instead.
+    """
+
+    return _get_model(
+        "text_embedding_model",
+        lambda: TextEmbeddingModel.from_pretrained(TEXT_EMBEDDING_MODEL_NAME),
+    )
+
+
+def get_multimodal_embedding_model() -> MultiModalEmbeddingModel:
+    """
+    Returns the process-wide multimodal embedding model, creating it on first use.
+    A model assigned to the module's `multimodal_embedding_model` attribute is returned instead.
+    """
+
+    return _get_model(
+        "multimodal_embedding_model",
+        lambda: MultiModalEmbeddingModel.from_pretrained(
+            MULTIMODAL_EMBEDDING_MODEL_NAME
+        ),
+    )
+
+
+def set_text_embedding_model(model: Optional[TextEmbeddingModel]) -> None:
+    """
+    Overrides the text embedding model used by this module (e.g. with a fake in tests),
+    replacing any model assigned to the `text_embedding_model` attribute.
+    Passing None restores the default model, created on next use.
+    """
+
+    with _models_lock:
+        globals().pop("text_embedding_model", None)
+        if model is None:
+            _models.pop("text_embedding_model", None)
+        else:
+            _models["text_embedding_model"] = model
+
+
+def set_multimodal_embedding_model(model: Optional[MultiModalEmbeddingModel]) -> None:
+    """
+    Overrides the multimodal embedding model used by this module (e.g. with a fake in tests),
+    replacing any model assigned to the `multimodal_embedding_model` attribute.
+    Passing None restores the default model, created on next use.
+    """
+
+    with _models_lock:
+        globals().pop("multimodal_embedding_model", None)
+        if model is None:
+            _models.pop("multimodal_embedding_model", None)
+        else:
+            _models["multimodal_embedding_model"] = model
+
+
+def __getattr__(name: str) -> Any:
+    # Keeps `text_embedding_model` and `multimodal_embedding_model` available as module attributes
+    if name == "text_embedding_model":
+        return get_text_embedding_model()
+    if name == "multimodal_embedding_model":
+        return get_multimodal_embedding_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Per-request limits of the text embedding model
+TEXT_EMBEDDING_MAX_BATCH_SIZE = 250
+TEXT_EMBEDDING_MAX_BATCH_TOKENS = 20000
+# Conservative estimate used to count tokens without calling the tokenizer
+TEXT_EMBEDDING_CHARS_PER_TOKEN = 3
+TEXT_EMBEDDING_DIMENSION = 768
+
+# Chunking of the page text during ingestion (see `iter_pdf_pages`)
+TEXT_CHUNK_CHARACTER_LIMIT = 1000
+TEXT_CHUNK_OVERLAP = 100
+
+# Retries of model calls failing with ResourceExhausted (quota errors)
+MODEL_MAX_RETRIES = 5
+MODEL_INITIAL_BACKOFF = 2.0
+
+
+# Functions for rate limiting model calls
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket limiting the number of requests per minute sent to a model.
+
+    The rate is adaptive: it is halved every time the model reports `ResourceExhausted`
+    and recovers additively on each successful call, up to the configured limit.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        """
+        Args:
+            requests_per_minute: Maximum number of requests per minute.
+            burst: Maximum number of requests that can be sent back to back.
+        """
+
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute must be positive.")
+
+        self.max_rate = requests_per_minute / 60.0
+        self.min_rate = self.max_rate / 16
+        self.rate = self.max_rate
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def acquire(self) -> None:
+        """
+        Blocks until a request can be sent.
+        """
+
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+    async def acquire_async(self) -> None:
+        """
+        Waits, without blocking the event loop, until a request can be sent.
+        """
+
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait_time)
+
+    def on_success(self) -> None:
+        """
+        Slowly restores the rate after a successful request.
+        """
+
+        with self.lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def on_resource_exhausted(self) -> None:
+        """
+        Halves the rate and drains the bucket after a quota error.
+        """
+
+        with self.lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+
+# Rate limiters per model type, see `set_requests_per_minute`
+MODEL_TYPES = ("text_embedding", "multimodal_embedding", "gemini")
+rate_limiters: Dict[str, RateLimiter] = {}
+
+
+def set_requests_per_minute(
+    model_type: str, requests_per_minute: Optional[float]
+) -> None:
+    """
+    Limits the number of requests per minute sent to a model by the functions of this module.
+
+    Args:
+        model_type: One of "text_embedding", "multimodal_embedding" or "gemini".
+        requests_per_minute: Maximum number of requests per minute, or None to remove the limit.
+
+    Raises:
+        ValueError: If `model_type` is unknown.
+    """
+
+    if model_type not in MODEL_TYPES:
+        raise ValueError(
+            f"Unknown model type '{model_type}', expected one of {MODEL_TYPES}."
+        )
+
+    if requests_per_minute is None:
+        rate_limiters.pop(model_type, None)
+    else:
+        rate_limiters[model_type] = RateLimiter(requests_per_minute)
+
+
+def call_model(
+    model_type: str, function: Callable[..., Any], *args: Any, **kwargs: Any
+) -> Any:
+    """
+    Calls a model through its rate limiter (if any), retrying on `ResourceExhausted`.
+
+    Retries use exponential backoff with jitter, starting at `MODEL_INITIAL_BACKOFF` seconds,
+    and also lower the rate of the model's limiter until calls succeed again.
+
+    Args:
+        model_type: One of "text_embedding", "multimodal_embedding" or "gemini".
+        function: The function sending the request.
+        *args, **kwargs: Arguments passed to `function`.
+
+    Returns:
+        The return value of `function`.
+
+    Raises:
+        ResourceExhausted: If the call still fails after `MODEL_MAX_RETRIES` retries.
+    """
+
+    rate_limiter = rate_limiters.get(model_type)
+    backoff = MODEL_INITIAL_BACKOFF
+
+    for attempt in range(MODEL_MAX_RETRIES + 1):
+        if rate_limiter:
+            rate_limiter.acquire()
+
+        try:
+            result = function(*args, **kwargs)
+        except ResourceExhausted:
+            if attempt == MODEL_MAX_RETRIES:
+                raise
+            if rate_limiter:
+                rate_limiter.on_resource_exhausted()
+            print(f"Quota exceeded for {model_type} model, retrying in {backoff} sec.")
+            time.sleep(backoff * random.uniform(0.5, 1.5))
+            backoff *= 2
+            continue
+
+        if rate_limiter:
+            rate_limiter.on_success()
+        return result
+
+
+# Concurrency budget of the asynchronous model calls, see `get_document_metadata_async`
+model_request_semaphore: contextvars.ContextVar[
+    Optional[asyncio.Semaphore]
+] = contextvars.ContextVar("model_request_semaphore", default=None)
+
+
+async def call_model_async(
+    model_type: str, function: Callable[..., Any], *args: Any, **kwargs: Any
+) -> Any:
+    """
+    Asynchronous version of `call_model`: awaits a coroutine function through the model's
+    rate limiter (if any), retrying on `ResourceExhausted`.
+
+    While `model_request_semaphore` is set, each request also holds the semaphore. The
+    rate limiter token is taken once the semaphore is acquired, so tokens are not spent
+    by requests still waiting for the semaphore.
+
+    Args:
+        model_type: One of "text_embedding", "multimodal_embedding" or "gemini".
+        function: The coroutine function sending the request, or a regular function,
+                  which is then run in the event loop's default executor.
+        *args, **kwargs: Arguments passed to `function`.
+
+    Returns:
+        The return value of `function`.
+
+    Raises:
+        ResourceExhausted: If the call still fails after `MODEL_MAX_RETRIES` retries.
+    """
+
+    rate_limiter = rate_limiters.get(model_type)
+    semaphore = model_request_semaphore.get()
+    backoff = MODEL_INITIAL_BACKOFF
+
+    for attempt in range(MODEL_MAX_RETRIES + 1):
+        try:
+            if semaphore is not None:
+                await semaphore.acquire()
+            try:
+                if rate_limiter:
+                    await rate_limiter.acquire_async()
+
+                if asyncio.iscoroutinefunction(function):
+                    result = await function(*args, **kwargs)
+                else:
+                    result = await asyncio.get_running_loop().run_in_executor(
+                        None, functools.partial(function, *args, **kwargs)
+                    )
+            finally:
+                if semaphore is not None:
+                    semaphore.release()
+        except ResourceExhausted:
+            if attempt == MODEL_MAX_RETRIES:
+                raise
+            if rate_limiter:
+                rate_limiter.on_resource_exhausted()
+            print(f"Quota exceeded for {model_type} model, retrying in {backoff} sec.")
+            await asyncio.sleep(backoff * random.uniform(0.5, 1.5))
+            backoff *= 2
+            continue
+
+        if rate_limiter:
+            rate_limiter.on_success()
+        return result
+
+
+# Functions for caching embeddings
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding cache stored in a single SQLite file.
+
+    Entries are keyed by model name, embedding dimension and a SHA-256 hash of the embedded
+    content, so the same text or image is only embedded once across runs and notebook restarts.
+    The least recently used entries are evicted once the stored embeddings exceed `max_size_bytes`.
+    """
+
+    # Subclasses can store other values in their own table of the same file
+    table_name = "embeddings"
+    value_column = "embedding"
+
+    def __init__(self, path: str, max_size_bytes: int = 1024**3):
+        """
+        Args:
+            path: The path of the SQLite database file. It is created if it doesn't exist.
+            max_size_bytes: Maximum total size of the stored embeddings.
+        """
+
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table_name} ("
+            f"key TEXT PRIMARY KEY, {self.value_column} BLOB NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        self.connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table_name}_last_used "
+            f"ON {self.table_name} (last_used)"
+        )
+        self.size_bytes = self.connection.execute(
+            f"SELECT COALESCE(SUM(LENGTH({self.value_column})), 0) "
+            f"FROM {self.table_name}"
+        ).fetchone()[0]
+
+    @staticmethod
+    def encode(value: Any) -> bytes:
+        """
+        Serializes a cached value (an embedding) to bytes.
+        """
+
+        return np.asarray(value, dtype=np.float64).tobytes()
+
+    @staticmethod
+    def decode(data: bytes) -> Any:
+        """
+        Deserializes a cached value (an embedding) from bytes.
+        """
+
+        return np.frombuffer(data, dtype=np.float64).tolist()
+
+    @staticmethod
+    def get_key(model_name: str, dimension: int, content: bytes) -> str:
+        """
+        Builds the cache key of an embedding.
+
+        Args:
+            model_name: The name of the embedding model.
+            dimension: The dimension of the embedding.
+            content: The embedded content (encoded text or image bytes).
+
+        Returns:
+            The cache key as a string.
+        """
+
+        return f"{model_name}:{dimension}:{hashlib.sha256(content).hexdigest()}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, list]:
+        """
+        Looks up several embeddings and marks them as recently used.
+
+        Args:
+            keys: The cache keys.
+
+        Returns:
+            A dictionary mapping the keys found in the cache to their embeddings.
+        """
+
+        found: Dict[str, list] = {}
+        unique_keys = list(dict.fromkeys(keys))
+
+        with self.lock:
+            # Stay below SQLite's limit on the number of query parameters
+            for start in range(0, len(unique_keys), 500):
+                end = start + 500
+                batch = unique_keys[start:end]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.connection.execute(
+                    f"SELECT key, {self.value_column} FROM {self.table_name} "
+                    f"WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                found.update((key, self.decode(value)) for key, value in rows)
+
+            if found:
+                now = time.time()
+                self.connection.executemany(
+                    f"UPDATE {self.table_name} SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+
+            self.hits += sum(key in found for key in keys)
+            self.misses += sum(key not in found for key in keys)
+
+        return found
+
+    def get(self, key: str) -> Optional[list]:
+        """
+        Looks up a single embedding.
+
+        Args:
+            key: The cache key.
+
+        Returns:
+            The embedding, or None if it is not cached.
+        """
+
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, list]) -> None:
+        """
+        Stores several embeddings, evicting the least recently used ones if needed.
+
+        Args:
+            items: A dictionary mapping cache keys to embeddings.
+        """
+
+        if not items:
+            return
+
+        now = time.time()
+        rows = [(key, self.encode(value), now) for key, value in items.items()]
+
+        with self.lock:
+            self.connection.execute("BEGIN")
+            for key, value, last_used in rows:
+                previous = self.connection.execute(
+                    f"SELECT LENGTH({self.value_column}) FROM {self.table_name} "
+                    "WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                self.size_bytes += len(value) - (previous[0] if previous else 0)
+                self.connection.execute(
+                    f"INSERT OR REPLACE INTO {self.table_name} VALUES (?, ?, ?)",
+                    (key, value, last_used),
+                )
+            self._evict()
+            self.connection.execute("COMMIT")
+
+    def put(self, key: str, embedding: list) -> None:
+        """
+        Stores a single embedding.
+
+        Args:
+            key: The cache key.
+            embedding: The embedding.
+        """
+
+        self.put_many({key: embedding})
+
+    def _evict(self) -> None:
+        while self.size_bytes > self.max_size_bytes:
+            rows = self.connection.execute(
+                f"SELECT key, LENGTH({self.value_column}) FROM {self.table_name} "
+                "ORDER BY last_used LIMIT 100"
+            ).fetchall()
+            if not rows:
+                self.size_bytes = 0
+                return
+
+            evicted_keys = []
+            for key, size in rows:
+                if self.size_bytes <= self.max_size_bytes:
+                    break
+                evicted_keys.append((key,))
+                self.size_bytes -= size
+
+            self.connection.executemany(
+                f"DELETE FROM {self.table_name} WHERE key = ?", evicted_keys
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Returns the hit/miss counters of this session and the current size of the cache.
+        """
+
+        with self.lock:
+            entries = self.connection.execute(
+                f"SELECT COUNT(*) FROM {self.table_name}"
+            ).fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "size_bytes": self.size_bytes,
+            }
+
+    def clear(self) -> None:
+        """
+        Removes every cached embedding and resets the counters.
+        """
+
+        with self.lock:
+            self.connection.execute(f"DELETE FROM {self.table_name}")
+            self.size_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def close(self) -> None:
+        """
+        Closes the SQLite connection.
+        """
+
+        self.connection.close()
+
+
+# Cache used by the embedding functions of this module, see `set_embedding_cache`
+embedding_cache: Optional[EmbeddingCache] = None
+
+
+def set_embedding_cache(
+    path: Optional[str], max_size_bytes: int = 1024**3
+) -> Optional[EmbeddingCache]:
+    """
+    Enables (or disables) the persistent embedding cache used by the embedding functions.
+
+    The default text embedding model is an "@latest" alias, whose embeddings are not
+    cached (see `get_model_embedding_cache`): to cache text embeddings as well, set a
+    pinned version, e.g.
+    `set_text_embedding_model(TextEmbeddingModel.from_pretrained("textembedding-gecko@003"))`.
+
+    Args:
+        path: The path of the SQLite database file, or None to disable the cache.
+        max_size_bytes: Maximum total size of the stored embeddings.
+
+    Returns:
+        The new EmbeddingCache, or None if the cache was disabled.
+    """
+
+    global embedding_cache
+
+    if embedding_cache is not None:
+        embedding_cache.close()
+
+    embedding_cache = EmbeddingCache(path, max_size_bytes) if path else None
+    return embedding_cache
+
+
+def get_model_embedding_cache(model: Any) -> Tuple[Optional[EmbeddingCache], str]:
+    """
+    Returns the embedding cache to use for the embeddings of a model, with the model name
+    to build the cache keys from (see `EmbeddingCache.get_key`).
+
+    Only models with a resolved, pinned name are cached: models without a name (e.g. the
+    fakes of `benchmark_intro_multimodal_rag_utils`) and "@latest" aliases, whose
+    embeddings change when the alias moves, are never cached.
+
+    Args:
+        model: The embedding model in use.
+
+    Returns:
+        A tuple containing the embedding cache, or None if the model's embeddings must not
+        be cached, and the model name.
+    """
+
+    model_name = getattr(model, "_model_id", None) or getattr(
+        model, "_model_resource_name", None
+    )
+    if (
+        embedding_cache is None
+        or not isinstance(model_name, str)
+        or model_name.endswith("@latest")
+    ):
+        return None, ""
+
+    return embedding_cache, model_name
+
+
+def get_text_embedding_cache_key(text: str, model_name: str) -> str:
+    """
+    Builds the embedding cache key of a text embedded with the text embedding model
+    named `model_name` (see `get_model_embedding_cache`).
+    """
+
+    return EmbeddingCache.get_key(
+        model_name, TEXT_EMBEDDING_DIMENSION, text.encode("utf-8")
+    )
+
+
+def get_image_embedding_cache_key(
+    image_bytes: bytes, text: Optional[str], embedding_size: int, model_name: str
+) -> str:
+    """
+    Builds the embedding cache key of an image (and its contextual text) embedded with
+    the multimodal embedding model named `model_name` (see `get_model_embedding_cache`).
+    """
+
+    return EmbeddingCache.get_key(
+        model_name,
+        embedding_size,
+        image_bytes + b"\0" + (text or "").encode("utf-8"),
+    )
+
+
+# Functions for caching Gemini image descriptions
+
+
+class ImageDescriptionCache(EmbeddingCache):
+    """
+    Persistent cache of Gemini image descriptions, with the same storage and LRU eviction
+    as EmbeddingCache. It can share the SQLite file of an EmbeddingCache.
+
+    Entries are keyed by a SHA-256 hash of the image bytes, the prompt, the model name
+    and the generation settings, so any change of those produces a new description.
+    """
+
+    table_name = "image_descriptions"
+    value_column = "description"
+
+    def __init__(self, path: str, max_size_bytes: int = 256 * 1024**2):
+        """
+        Args:
+            path: The path of the SQLite database file. It is created if it doesn't exist.
+            max_size_bytes: Maximum total size of the stored descriptions.
+        """
+
+        super().__init__(path, max_size_bytes)
+
+    @staticmethod
+    def encode(value: Any) -> bytes:
+        return value.encode("utf-8")
+
+    @staticmethod
+    def decode(data: bytes) -> Any:
+        return bytes(data).decode("utf-8")
+
+    @staticmethod
+    def get_description_key(
+        generative_multimodal_model: Any,
+        image_bytes: bytes,
+        image_description_prompt: str,
+        generation_config: Optional[GenerationConfig] = None,
+        safety_settings: Optional[dict] = None,
+    ) -> str:
+        """
+        Builds the cache key of an image description.
+
+        Args:
+            generative_multimodal_model: The Gemini model describing the image.
+            image_bytes: The encoded image.
+            image_description_prompt: The prompt sent with the image.
+            generation_config: The generation config of the request.
+            safety_settings: The safety settings of the request.
+
+        Returns:
+            The cache key as a string.
+        """
+
+        model_name = (
+            getattr(generative_multimodal_model, "_model_name", None)
+            or type(generative_multimodal_model).__name__
+        )
+        generation_config_value: Any = generation_config
+        if generation_config is not None and hasattr(generation_config, "to_dict"):
+            generation_config_value = generation_config.to_dict()
+        settings = json.dumps(
+            {
+                "prompt": image_description_prompt,
+                "generation_config": generation_config_value,
+                "safety_settings": {
+                    str(category): str(threshold)
+                    for category, threshold in (safety_settings or {}).items()
+                },
+            },
+            sort_keys=True,
+            default=str,
+        )
+        settings_hash = hashlib.sha256(settings.encode("utf-8")).hexdigest()
+
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+
+        return f"{model_name}:{image_hash}:{settings_hash}"
+
+
+# Cache used by `get_image_metadata`, see `set_image_description_cache`
+image_description_cache: Optional[ImageDescriptionCache] = None
+
+
+def set_image_description_cache(
+    path: Optional[str], max_size_bytes: int = 256 * 1024**2
+) -> Optional[ImageDescriptionCache]:
+    """
+    Enables (or disables) the persistent cache of Gemini image descriptions.
+
+    Args:
+        path: The path of the SQLite database file, or None to disable the cache.
+              It can be the same file as the embedding cache.
+        max_size_bytes: Maximum total size of the stored descriptions.
+
+    Returns:
+        The new ImageDescriptionCache, or None if the cache was disabled.
+    """
+
+    global image_description_cache
+
+    if image_description_cache is not None:
+        image_description_cache.close()
+
+    image_description_cache = (
+        ImageDescriptionCache(path, max_size_bytes) if path else None
+    )
+    return image_description_cache
+
+
+def is_successful_gemini_response(response: str, metrics: Dict[str, Any]) -> bool:
+    """
+    Tells whether a Gemini response is worth caching: it is not empty and none of
+    its chunks failed or was blocked (see the metrics of `stream_gemini_response`).
+    """
+
+    return bool(response.strip()) and metrics.get("failed_chunks") == 0
+
+
+def get_image_description(
+    generative_multimodal_model: Any,
+    image_for_gemini: Image,
+    image_description_prompt: str,
+    generation_config: Optional[GenerationConfig] = None,
+    safety_settings: Optional[dict] = None,
+) -> str:
+    """
+    Describes an image with Gemini, through the image description cache when it is enabled.
+
+    Args:
+        generative_multimodal_model: The Gemini model used to describe the image.
+        image_for_gemini: The Gemini Image object.
+        image_description_prompt: A prompt to guide Gemini for generating image descriptions.
+        generation_config: The generation config of the request.
+        safety_settings: The safety settings of the request.
+
+    Returns:
+        The image description.
+    """
+
+    cache = image_description_cache
+    cache_key = None
+    if cache is not None:
+        cache_key = ImageDescriptionCache.get_description_key(
+            generative_multimodal_model,
+            image_for_gemini.data,
+            image_description_prompt,
+            generation_config,
+            safety_settings,
+        )
+        cached_description: Any = cache.get(cache_key)
+        if cached_description is not None:
+            return cached_description
+
+    metrics: Dict[str, Any] = {}
+    description = call_model(
+        "gemini",
+        get_gemini_response,
+        generative_multimodal_model,
+        model_input=[image_description_prompt, image_for_gemini],
+        generation_config=generation_config,
+        safety_settings=safety_settings,
+        metrics=metrics,
+        stream=True,
+    )
+
+    if (
+        cache is not None
+        and cache_key is not None
+        and is_successful_gemini_response(description, metrics)
+    ):
+        cache.put(cache_key, description)
+
+    return description
 
 
 # Functions for getting text and image embeddings
@@ -45,8 +900,19 @@ def get_text_embedding_from_text_embedding_model(
                                The format (list or NumPy array) depends on the
                                value of the 'return_array' parameter.
     """
-    embeddings = text_embedding_model.get_embeddings([text])
-    text_embedding = [embedding.values for embedding in embeddings][0]
+    text_embedding = None
+    model = get_text_embedding_model()
+    cache, model_name = get_model_embedding_cache(model)
+    if cache is not None:
+        cache_key = get_text_embedding_cache_key(text, model_name)
+        text_embedding = cache.get(cache_key)
+
+    if text_embedding is None:
+        embeddings = call_model("text_embedding", model.get_embeddings, [text])
+        text_embedding = [embedding.values for embedding in embeddings][0]
+
+        if cache is not None:
+            cache.put(cache_key, text_embedding)
 
     if return_array:
         return np.fromiter(text_embedding, dtype=float)
@@ -55,17 +921,136 @@ def get_text_embedding_from_text_embedding_model(
     return text_embedding
 
 
+def get_text_embedding_batches(
+    texts: List[str],
+    max_batch_size: int = TEXT_EMBEDDING_MAX_BATCH_SIZE,
+    max_batch_tokens: int = TEXT_EMBEDDING_MAX_BATCH_TOKENS,
+) -> List[List[str]]:
+    """
+    Packs texts into consecutive batches that fit the per-request limits of the text embedding model.
+
+    Args:
+        texts: The input text strings, in order.
+        max_batch_size: Maximum number of texts per request.
+        max_batch_tokens: Maximum (estimated) number of tokens per request.
+                          A single text above the limit is sent on its own.
+
+    Returns:
+        A list of batches. Concatenating the batches gives back `texts` in the original order.
+    """
+
+    batches: List[List[str]] = []
+    batch: List[str] = []
+    batch_tokens = 0
+
+    for text in texts:
+        text_tokens = math.ceil(len(text) / TEXT_EMBEDDING_CHARS_PER_TOKEN)
+
+        if batch and (
+            len(batch) >= max_batch_size
+            or batch_tokens + text_tokens > max_batch_tokens
+        ):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+
+        batch.append(text)
+        batch_tokens += text_tokens
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def get_text_embeddings_from_text_embedding_model(
+    texts: List[str],
+    return_array: Optional[bool] = False,
+    max_batch_size: int = TEXT_EMBEDDING_MAX_BATCH_SIZE,
+    max_batch_tokens: int = TEXT_EMBEDDING_MAX_BATCH_TOKENS,
+    max_workers: int = 4,
+) -> list:
+    """
+    Generates text embeddings for many texts with as few requests as possible.
+
+    Texts are packed into batches that fit the model's per-request limits
+    (see `get_text_embedding_batches`) and up to `max_workers` batches are sent concurrently.
+
+    Args:
+        texts: The input text strings to be embedded.
+        return_array: If True, returns each embedding as a NumPy array.
+                      If False, returns each embedding as a list. (Default: False)
+        max_batch_size: Maximum number of texts per request.
+        max_batch_tokens: Maximum (estimated) number of tokens per request.
+        max_workers: Maximum number of requests in flight at the same time.
+
+    Returns:
+        list: One embedding per input text, in the same order as `texts`.
+    """
+
+    cached_embeddings: Dict[str, list] = {}
+    model = get_text_embedding_model()
+    cache, model_name = get_model_embedding_cache(model)
+    if cache is not None:
+        cache_keys = [get_text_embedding_cache_key(text, model_name) for text in texts]
+        cached_embeddings = cache.get_many(cache_keys)
+        # Only embed the texts missing from the cache, once each
+        texts_to_embed = list(
+            dict.fromkeys(
+                text
+                for text, cache_key in zip(texts, cache_keys)
+                if cache_key not in cached_embeddings
+            )
+        )
+    else:
+        texts_to_embed = texts
+
+    batches = get_text_embedding_batches(
+        texts_to_embed, max_batch_size, max_batch_tokens
+    )
+
+    def embed_batch(batch: List[str]) -> List[list]:
+        embeddings = call_model("text_embedding", model.get_embeddings, batch)
+        return [embedding.values for embedding in embeddings]
+
+    if len(batches) <= 1 or max_workers <= 1:
+        batch_embeddings = [embed_batch(batch) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+            # map() yields results in the order of the batches
+            batch_embeddings = list(executor.map(embed_batch, batches))
+
+    text_embeddings = [
+        embedding for embeddings in batch_embeddings for embedding in embeddings
+    ]
+
+    if cache is not None:
+        new_embeddings = {
+            get_text_embedding_cache_key(text, model_name): embedding
+            for text, embedding in zip(texts_to_embed, text_embeddings)
+        }
+        cache.put_many(new_embeddings)
+        cached_embeddings.update(new_embeddings)
+        text_embeddings = [cached_embeddings[cache_key] for cache_key in cache_keys]
+
+    if return_array:
+        return [np.fromiter(embedding, dtype=float) for embedding in text_embeddings]
+
+    return text_embeddings
+
+
 def get_image_embedding_from_multimodal_embedding_model(
     image_uri: str,
     embedding_size: int = 512,
     text: Optional[str] = None,
     return_array: Optional[bool] = False,
+    image_bytes: Optional[bytes] = None,
 ) -> list:
     """Extracts an image embedding from a multimodal embedding model.
     The function can optionally utilize contextual text to refine the embedding.
 
     Args:
         image_uri (str): The URI (Uniform Resource Identifier) of the image to process.
+        image_bytes (Optional[bytes]): The encoded image. If set, it is used instead of reading `image_uri`.
         text (Optional[str]): Optional contextual text to guide the embedding generation. Defaults to "".
         embedding_size (int): The desired dimensionality of the output embedding. Defaults to 512.
         return_array (Optional[bool]): If True, returns the embedding as a NumPy array.
@@ -74,15 +1059,42 @@ def get_image_embedding_from_multimodal_embedding_model(
     Returns:
         list: A list containing the image embedding values. If `return_array` is True, returns a NumPy array instead.
     """
-    image = vision_model_Image.load_from_file(image_uri)
-    embeddings = multimodal_embedding_model.get_embeddings(
-        image=image, contextual_text=text, dimension=embedding_size
-    )  # 128, 256, 512, 1408
+    image_embedding = None
+    cache_key = None
+    model = get_multimodal_embedding_model()
+    cache, model_name = get_model_embedding_cache(model)
+    if image_bytes is None and cache is not None and os.path.isfile(image_uri):
+        # Read the bytes once, to hash them and to send them to the model
+        with open(image_uri, "rb") as image_file:
+            image_bytes = image_file.read()
+
+    if image_bytes is not None:
+        image = vision_model_Image(image_bytes)
+        if cache is not None:
+            cache_key = get_image_embedding_cache_key(
+                image_bytes, text, embedding_size, model_name
+            )
+            image_embedding = cache.get(cache_key)
+    else:
+        image = vision_model_Image.load_from_file(image_uri)
+
+    if image_embedding is None:
+        embeddings = call_model(
+            "multimodal_embedding",
+            model.get_embeddings,
+            image=image,
+            contextual_text=text,
+            dimension=embedding_size,
+        )  # 128, 256, 512, 1408
+        image_embedding = embeddings.image_embedding
+
+        if cache is not None and cache_key is not None:
+            cache.put(cache_key, image_embedding)
 
     if return_array:
-        return np.fromiter(embeddings.image_embedding, dtype=float)
+        return np.fromiter(image_embedding, dtype=float)
 
-    return embeddings.image_embedding
+    return image_embedding
 
 
 def get_text_overlapping_chunk(
@@ -129,7 +1141,7 @@ def get_text_overlapping_chunk(
     return chunked_text_dict
 
 
-def get_page_text_embedding(text_data: Union[dict, str]) -> dict:
+def get_page_text_embedding(text_data: Union[dict, str], max_workers: int = 4) -> dict:
     """
     * Generates embeddings for each text chunk using a specified embedding model.
     * Takes a dictionary of text chunks and an embedding size as input.
@@ -138,6 +1150,7 @@ def get_page_text_embedding(text_data: Union[dict, str]) -> dict:
     Args:
         text_data: Either a dictionary of pre-chunked text or the entire page text.
         embedding_size: Size of the embedding vector (defaults to 128).
+        max_workers: Maximum number of concurrent embedding requests when embedding chunks.
 
     Returns:
         A dictionary where keys are chunk numbers or "text_embedding" and values are the corresponding embeddings.
@@ -150,11 +1163,11 @@ def get_page_text_embedding(text_data: Union[dict, str]) -> dict:
         return embeddings_dict
 
     if isinstance(text_data, dict):
-        # Process each chunk
-        for chunk_number, chunk_value in text_data.items():
-            embeddings_dict[
-                chunk_number
-            ] = get_text_embedding_from_text_embedding_model(text=chunk_value)
+        # Process all chunks in batched requests
+        chunk_embeddings = get_text_embeddings_from_text_embedding_model(
+            list(text_data.values()), max_workers=max_workers
+        )
+        embeddings_dict = dict(zip(text_data.keys(), chunk_embeddings))
     else:
         # Process the first 1000 characters of the page text
         embeddings_dict[
@@ -199,11 +1212,37 @@ def get_chunk_text_metadata(
     # Extract text from the page
     text: str = page.get_text().encode("ascii", "ignore").decode("utf-8", "ignore")
 
+    return get_chunk_text_metadata_from_text(text, character_limit, overlap)
+
+
+def get_chunk_text_metadata_from_text(
+    text: str,
+    character_limit: int = 1000,
+    overlap: int = 100,
+    chunked_text_dict: Optional[dict] = None,
+) -> tuple[str, dict, dict, dict]:
+    """
+    Same as `get_chunk_text_metadata`, for text already extracted from a page.
+
+    PyMuPDF objects must not be shared across threads, so concurrent ingestion extracts the
+    page text up front and embeds it with this function.
+
+    Args:
+        text: The extracted page text.
+        character_limit: Maximum characters per chunk (defaults to 1000).
+        overlap: Number of overlapping characters between chunks (defaults to 100).
+        chunked_text_dict: The already chunked text, if any (see `iter_pdf_pages`).
+
+    Returns:
+        The same tuple as `get_chunk_text_metadata`.
+    """
+
     # Get whole-page text embeddings
     page_text_embeddings_dict: dict = get_page_text_embedding(text)
 
     # Chunk the text with the given limit and overlap
-    chunked_text_dict: dict = get_text_overlapping_chunk(text, character_limit, overlap)
+    if chunked_text_dict is None:
+        chunked_text_dict = get_text_overlapping_chunk(text, character_limit, overlap)
 
     # Get embeddings for the chunks
     chunk_embeddings_dict: dict = get_page_text_embedding(chunked_text_dict)
@@ -212,6 +1251,20 @@ def get_chunk_text_metadata(
     return text, page_text_embeddings_dict, chunked_text_dict, chunk_embeddings_dict
 
 
+def write_image_file(image_bytes: bytes, image_name: str) -> None:
+    """
+    Writes encoded image bytes to a file, creating its directory if it doesn't exist.
+
+    Args:
+        image_bytes: The encoded image.
+        image_name: The path of the image file.
+    """
+
+    os.makedirs(os.path.dirname(image_name) or ".", exist_ok=True)
+    with open(image_name, "wb") as image_file:
+        image_file.write(image_bytes)
+
+
 def get_image_for_gemini(
     doc: fitz.Document,
     image: tuple,
@@ -219,10 +1272,16 @@ def get_image_for_gemini(
     image_save_dir: str,
     file_name: str,
     page_num: int,
+    save_image: bool = True,
+    image_writer: Optional[Executor] = None,
+    image_write_futures: Optional[List[Future]] = None,
 ) -> Tuple[Image, str]:
     """
-    Extracts an image from a PDF document, converts it to JPEG format, saves it to a specified directory,
-    and loads it as a PIL Image Object.
+    Extracts an image from a PDF document, converts it to JPEG format in memory, optionally saves it
+    to a specified directory, and wraps the JPEG bytes in a Gemini Image Object.
+
+    The image is encoded only once: the same bytes (`image_for_gemini.data`) can be passed to the
+    multimodal embedding model without reading the saved file back.
 
     Parameters:
     - doc (fitz.Document): The PDF document from which the image is extracted.
@@ -231,6 +1290,10 @@ def get_image_for_gemini(
     - image_save_dir (str): The directory where the image will be saved.
     - file_name (str): The base name for the image file.
     - page_num (int): The page number from which the image is extracted.
+    - save_image (bool): Whether to save the image to `image_save_dir`. Defaults to True.
+    - image_writer (Optional[Executor]): If set, the image is saved asynchronously on this executor.
+    - image_write_futures (Optional[List[Future]]): If set, the Future of the asynchronous write is
+      appended to it, so the caller can check that the image was saved.
 
     Returns:
     - Tuple[Image.Image, str]: A tuple containing the Gemini Image object and the image filename.
@@ -241,36 +1304,347 @@ def get_image_for_gemini(
     pix = fitz.Pixmap(doc, xref)
 
     # Convert the image to JPEG format
-    pix.tobytes("jpeg")
+    image_bytes = pix.tobytes("jpeg")
 
     # Create the image file name
     image_name = f"{image_save_dir}/{file_name}_image_{page_num}_{image_no}_{xref}.jpeg"
 
-    # Create the image save directory if it doesn't exist
-    os.makedirs(image_save_dir, exist_ok=True)
-
     # Save the image to the specified location
-    pix.save(image_name)
+    if save_image:
+        if image_writer is not None:
+            image_write_future = image_writer.submit(
+                write_image_file, image_bytes, image_name
+            )
+            if image_write_futures is not None:
+                image_write_futures.append(image_write_future)
+        else:
+            write_image_file(image_bytes, image_name)
 
-    # Load the saved image as a Gemini Image Object
-    image_for_gemini = Image.load_from_file(image_name)
+    # Wrap the JPEG bytes in a Gemini Image Object
+    image_for_gemini = Image.from_bytes(image_bytes)
 
     return image_for_gemini, image_name
 
 
+class ImageDeduplicator:
+    """
+    Finds images seen earlier during ingestion, so their description and embeddings can be reused.
+
+    Repeats of the same image object (xref) within a document, and images with exactly the same
+    bytes, are found directly. With `near_duplicates=True`, other images are compared with a
+    64-bit difference hash (dHash) plus an 8x8 color thumbnail: two images are near-identical
+    when their hashes differ by at most `max_hash_distance` bits and their thumbnails by at most
+    `max_color_difference` on average. The thumbnail check keeps flat images of different colors
+    (which all have the same dHash) apart, but charts, tables and text figures that only differ
+    in their details can still match, so near-duplicate matching is off by default.
+    """
+
+    def __init__(
+        self,
+        near_duplicates: bool = False,
+        max_hash_distance: int = 4,
+        max_color_difference: float = 8.0,
+    ):
+        """
+        Args:
+            near_duplicates: Whether to also match near-identical images, not only exact copies.
+            max_hash_distance: Maximum number of differing dHash bits between near-identical images.
+            max_color_difference: Maximum mean absolute difference (0-255) between their thumbnails.
+        """
+
+        self.near_duplicates = near_duplicates
+        self.max_hash_distance = max_hash_distance
+        self.max_color_difference = max_color_difference
+        self.xref_values: Dict[Tuple[str, int], Any] = {}
+        self.content_values: Dict[str, Any] = {}
+        # Grown by doubling their capacity, only the first `len(self.hash_values)` rows are set
+        self.hashes: np.ndarray = np.empty(16, dtype=np.uint64)
+        self.thumbnails: np.ndarray = np.empty((16, 192), dtype=np.float32)
+        self.hash_values: List[Any] = []
+
+    @staticmethod
+    def get_perceptual_hash(image_bytes: bytes) -> Tuple[int, np.ndarray]:
+        """
+        Computes the dHash and the flattened 8x8 RGB thumbnail of an encoded image.
+        """
+
+        with PIL.Image.open(io.BytesIO(image_bytes)) as image:
+            image = image.convert("RGB")
+            pixels = np.asarray(image.convert("L").resize((9, 8)), dtype=np.int16)
+            thumbnail = np.asarray(image.resize((8, 8)), dtype=np.float32).reshape(-1)
+
+        bits = (pixels[:, 1:] > pixels[:, :-1]).reshape(-1)
+        return int(np.packbits(bits).view(">u8")[0]), thumbnail
+
+    def find(self, file_name: str, xref: int, image_bytes: bytes) -> Optional[Any]:
+        """
+        Looks up the value stored for a previously seen copy of an image.
+
+        Args:
+            file_name: The name of the PDF file.
+            xref: The xref of the image in the PDF file.
+            image_bytes: The encoded image.
+
+        Returns:
+            The stored value, or None if the image wasn't seen before.
+        """
+
+        value = self.xref_values.get((file_name, xref))
+        if value is None:
+            value = self.content_values.get(hashlib.sha256(image_bytes).hexdigest())
+        if value is not None or not self.near_duplicates or len(self.hash_values) == 0:
+            if value is not None:
+                self.xref_values[(file_name, xref)] = value
+            return value
+
+        count = len(self.hash_values)
+        image_hash, thumbnail = self.get_perceptual_hash(image_bytes)
+        differing_bits = np.unpackbits(
+            (self.hashes[:count] ^ np.uint64(image_hash)).view(np.uint8).reshape(-1, 8),
+            axis=1,
+        ).sum(axis=1)
+        color_differences = np.abs(self.thumbnails[:count] - thumbnail).mean(axis=1)
+        matches = np.flatnonzero(
+            (differing_bits <= self.max_hash_distance)
+            & (color_differences <= self.max_color_difference)
+        )
+
+        if len(matches) == 0:
+            return None
+
+        value = self.hash_values[matches[0]]
+        self.xref_values[(file_name, xref)] = value
+        return value
+
+    def add(self, file_name: str, xref: int, image_bytes: bytes, value: Any) -> None:
+        """
+        Stores the value of a newly seen image.
+
+        Args:
+            file_name: The name of the PDF file.
+            xref: The xref of the image in the PDF file.
+            image_bytes: The encoded image.
+            value: The value to return for later copies of the image.
+        """
+
+        self.xref_values[(file_name, xref)] = value
+        self.content_values.setdefault(hashlib.sha256(image_bytes).hexdigest(), value)
+
+        if not self.near_duplicates:
+            return
+
+        count = len(self.hash_values)
+        if count == len(self.hashes):
+            self.hashes = np.resize(self.hashes, 2 * count)
+            self.thumbnails = np.resize(self.thumbnails, (2 * count, 192))
+
+        image_hash, thumbnail = self.get_perceptual_hash(image_bytes)
+        self.hashes[count] = image_hash
+        self.thumbnails[count] = thumbnail
+        self.hash_values.append(value)
+
+
+GEMINI_SAFETY_SETTINGS = {
+    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+}
+
+# Metrics of the most recent Gemini calls, see `get_gemini_latency_stats`
+gemini_response_metrics: Deque[Dict[str, Any]] = deque(maxlen=1000)
+
+
+def get_gemini_chunk_text(chunk: Any, metrics: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Returns the text of a Gemini response chunk, or "Exception occurred" if it has none
+    (e.g. when the chunk was blocked by the safety filters). Such chunks are counted in
+    the "failed_chunks" entry of `metrics`.
+    """
+
+    try:
+        return chunk.text
+    except Exception as e:
+        print(
+            "Exception occurred while calling gemini. Something is wrong. Lower the safety thresholds [safety_settings: BLOCK_NONE ] if not already done. -----",
+            e,
+        )
+        if metrics is not None:
+            metrics["failed_chunks"] += 1
+        return "Exception occurred"
+
+
+def update_gemini_response_metrics(
+    metrics: Dict[str, Any], chunk: Any, start_time: float
+) -> None:
+    """
+    Updates the metrics of a Gemini call with a newly received response chunk.
+
+    Args:
+        metrics: The metrics of the call.
+        chunk: The response chunk.
+        start_time: The `time.perf_counter()` value when the request was sent.
+    """
+
+    if metrics["time_to_first_token"] is None:
+        metrics["time_to_first_token"] = time.perf_counter() - start_time
+    metrics["chunks"] += 1
+
+    # The usage metadata is cumulative: the last chunk has the totals
+    usage_metadata = getattr(chunk, "usage_metadata", None)
+    for count in ("prompt_token_count", "candidates_token_count", "total_token_count"):
+        value = getattr(usage_metadata, count, None)
+        if value:
+            metrics[count] = value
+
+
+def stream_gemini_response(
+    generative_multimodal_model: Any,
+    model_input: List[str],
+    generation_config: Optional[GenerationConfig] = GenerationConfig(
+        temperature=0.2, max_output_tokens=2048
+    ),
+    safety_settings: Optional[dict] = GEMINI_SAFETY_SETTINGS,
+    metrics: Optional[Dict[str, Any]] = None,
+    stream: bool = True,
+) -> Iterator[str]:
+    """
+    Generates text in response to a list of model inputs, yielding the text chunks as they arrive.
+
+    Args:
+        generative_multimodal_model: The Gemini model.
+        model_input: A list of strings (and images) representing the inputs to the model.
+        generation_config: The generation config.
+        safety_settings: The safety settings.
+        metrics: Optional dictionary filled with the call's metrics: "time_to_first_token" and
+                 "total_latency" (in seconds), "chunks", "failed_chunks" (chunks without text,
+                 see `get_gemini_chunk_text`), and the token counts reported by the model
+                 ("prompt_token_count", "candidates_token_count" and "total_token_count").
+                 The metrics are also appended to `gemini_response_metrics`.
+        stream: Whether to ask the model for a streamed response (defaults to True).
+
+    Yields:
+        The text chunks of the response.
+    """
+
+    if metrics is None:
+        metrics = {}
+    metrics.update(
+        time_to_first_token=None,
+        total_latency=None,
+        chunks=0,
+        failed_chunks=0,
+        prompt_token_count=None,
+        candidates_token_count=None,
+        total_token_count=None,
+    )
+
+    start_time = time.perf_counter()
+    response = generative_multimodal_model.generate_content(
+        model_input,
+        generation_config=generation_config,
+        stream=stream,
+        safety_settings=safety_settings,
+    )
+
+    try:
+        for chunk in response if stream else [response]:
+            update_gemini_response_metrics(metrics, chunk, start_time)
+            yield get_gemini_chunk_text(chunk, metrics)
+    finally:
+        metrics["total_latency"] = time.perf_counter() - start_time
+        gemini_response_metrics.append(dict(metrics))
+
+
+async def stream_gemini_response_async(
+    generative_multimodal_model: Any,
+    model_input: List[str],
+    generation_config: Optional[GenerationConfig] = GenerationConfig(
+        temperature=0.2, max_output_tokens=2048
+    ),
+    safety_settings: Optional[dict] = GEMINI_SAFETY_SETTINGS,
+    metrics: Optional[Dict[str, Any]] = None,
+    stream: bool = True,
+) -> AsyncIterator[str]:
+    """
+    Asynchronous version of `stream_gemini_response`, built on `generate_content_async`.
+
+    Args:
+        generative_multimodal_model: The Gemini model.
+        model_input: A list of strings (and images) representing the inputs to the model.
+        generation_config: The generation config.
+        safety_settings: The safety settings.
+        metrics: Optional dictionary filled with the call's metrics, see `stream_gemini_response`.
+        stream: Whether to ask the model for a streamed response (defaults to True).
+
+    Yields:
+        The text chunks of the response.
+    """
+
+    if metrics is None:
+        metrics = {}
+    metrics.update(
+        time_to_first_token=None,
+        total_latency=None,
+        chunks=0,
+        failed_chunks=0,
+        prompt_token_count=None,
+        candidates_token_count=None,
+        total_token_count=None,
+    )
+
+    start_time = time.perf_counter()
+    response = await generative_multimodal_model.generate_content_async(
+        model_input,
+        generation_config=generation_config,
+        stream=stream,
+        safety_settings=safety_settings,
+    )
+
+    try:
+        if stream:
+            async for chunk in response:
+                update_gemini_response_metrics(metrics, chunk, start_time)
+                yield get_gemini_chunk_text(chunk, metrics)
+        else:
+            update_gemini_response_metrics(metrics, response, start_time)
+            yield get_gemini_chunk_text(response, metrics)
+    finally:
+        metrics["total_latency"] = time.perf_counter() - start_time
+        gemini_response_metrics.append(dict(metrics))
+
+
+def get_gemini_latency_stats() -> Dict[str, Any]:
+    """
+    Summarizes the metrics of the most recent Gemini calls (see `gemini_response_metrics`).
+
+    Returns:
+        A dictionary with the number of calls, the median and p95 time-to-first-token and
+        total latency (in seconds), and the total token counts.
+    """
+
+    stats: Dict[str, Any] = {"calls": len(gemini_response_metrics)}
+
+    for metric in ("time_to_first_token", "total_latency"):
+        values = [m[metric] for m in gemini_response_metrics if m[metric] is not None]
+        stats[f"{metric}_p50"] = float(np.percentile(values, 50)) if values else None
+        stats[f"{metric}_p95"] = float(np.percentile(values, 95)) if values else None
+
+    for count in ("prompt_token_count", "candidates_token_count", "total_token_count"):
+        stats[count] = sum(m[count] or 0 for m in gemini_response_metrics)
+
+    return stats
+
+
 def get_gemini_response(
-    generative_multimodal_model,
+    generative_multimodal_model: Any,
     model_input: List[str],
     stream: bool = True,
     generation_config: Optional[GenerationConfig] = GenerationConfig(
         temperature=0.2, max_output_tokens=2048
     ),
-    safety_settings: Optional[dict] = {
-        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-    },
+    safety_settings: Optional[dict] = GEMINI_SAFETY_SETTINGS,
+    metrics: Optional[Dict[str, Any]] = None,
 ) -> str:
     """
     This function generates text in response to a list of model inputs.
@@ -278,31 +1652,52 @@ def get_gemini_response(
     Args:
         model_input: A list of strings representing the inputs to the model.
         stream: Whether to generate the response in a streaming fashion (returning chunks of text at a time) or all at once. Defaults to False.
+        metrics: Optional dictionary filled with the call's metrics, see `stream_gemini_response`.
 
     Returns:
         The generated text as a string.
     """
-    response = generative_multimodal_model.generate_content(
-        model_input,
-        generation_config=generation_config,
-        stream=stream,
-        safety_settings=safety_settings,
+
+    return "".join(
+        stream_gemini_response(
+            generative_multimodal_model,
+            model_input,
+            generation_config=generation_config,
+            safety_settings=safety_settings,
+            metrics=metrics,
+            stream=stream,
+        )
     )
-    response_list = []
 
-    for chunk in response:
-        try:
-            response_list.append(chunk.text)
-        except Exception as e:
-            print(
-                "Exception occurred while calling gemini. Something is wrong. Lower the safety thresholds [safety_settings: BLOCK_NONE ] if not already done. -----",
-                e,
-            )
-            response_list.append("Exception occurred")
-            continue
-    response = "".join(response_list)
 
-    return response
+async def get_gemini_response_async(
+    generative_multimodal_model: Any,
+    model_input: List[str],
+    generation_config: Optional[GenerationConfig] = GenerationConfig(
+        temperature=0.2, max_output_tokens=2048
+    ),
+    safety_settings: Optional[dict] = GEMINI_SAFETY_SETTINGS,
+    metrics: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Asynchronous version of `get_gemini_response`, see `stream_gemini_response_async`.
+
+    Returns:
+        The generated text as a string.
+    """
+
+    return "".join(
+        [
+            chunk
+            async for chunk in stream_gemini_response_async(
+                generative_multimodal_model,
+                model_input,
+                generation_config=generation_config,
+                safety_settings=safety_settings,
+                metrics=metrics,
+            )
+        ]
+    )
 
 
 def get_text_metadata_df(
@@ -386,199 +1781,3342 @@ def get_image_metadata_df(
     return return_df
 
 
-def get_document_metadata(
-    generative_multimodal_model,
-    pdf_folder_path: str,
-    image_save_dir: str,
+# Columns of the text metadata DataFrame that have one value per page
+PAGE_KEY_COLUMNS = ["file_name", "page_num"]
+PAGE_COLUMNS = ["text", "text_embedding_page"]
+
+
+def get_pages_and_chunks_df(
+    text_metadata_df: pd.DataFrame,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Splits a text metadata DataFrame, which repeats the page text and page embedding
+    on every chunk row, into a pages table and a chunks table.
+
+    Args:
+        text_metadata_df: The text metadata DataFrame returned by `get_document_metadata`.
+
+    Returns:
+        A tuple containing the pages DataFrame (one row per (file_name, page_num), with the
+        page text and embedding) and the chunks DataFrame (one row per chunk, referencing
+        its page by (file_name, page_num)).
+    """
+
+    if len(text_metadata_df) == 0:
+        return (
+            pd.DataFrame(columns=PAGE_KEY_COLUMNS + PAGE_COLUMNS),
+            text_metadata_df.drop(
+                columns=[c for c in PAGE_COLUMNS if c in text_metadata_df.columns]
+            ),
+        )
+
+    pages_df = text_metadata_df.drop_duplicates(subset=PAGE_KEY_COLUMNS)[
+        PAGE_KEY_COLUMNS + PAGE_COLUMNS
+    ].reset_index(drop=True)
+    chunks_df = text_metadata_df.drop(columns=PAGE_COLUMNS).reset_index(drop=True)
+
+    return pages_df, chunks_df
+
+
+def get_text_metadata_df_from_pages(
+    pages_df: pd.DataFrame, chunks_df: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Joins the tables returned by `get_pages_and_chunks_df` back into a text metadata DataFrame.
+
+    The page columns only hold references to the pages table values: the page text and
+    embedding are not copied for every chunk. The search indexes registered for the chunks
+    DataFrame are registered for the joined DataFrame too.
+
+    Args:
+        pages_df: The pages DataFrame.
+        chunks_df: The chunks DataFrame.
+
+    Returns:
+        A text metadata DataFrame with the columns and row order of `get_document_metadata`'s.
+    """
+
+    if len(chunks_df) == 0:
+        return chunks_df.reset_index(drop=True)
+
+    page_positions = pd.MultiIndex.from_frame(pages_df[PAGE_KEY_COLUMNS]).get_indexer(
+        pd.MultiIndex.from_frame(chunks_df[PAGE_KEY_COLUMNS])
+    )
+    if (page_positions < 0).any():
+        raise ValueError("Some chunks reference pages missing from the pages table.")
+
+    text_metadata_df = chunks_df.reset_index(drop=True)
+    for column_number, column in enumerate(PAGE_COLUMNS, start=len(PAGE_KEY_COLUMNS)):
+        text_metadata_df.insert(
+            column_number, column, pages_df[column].to_numpy()[page_positions]
+        )
+
+    # The chunk columns hold the same cells, so the chunks' indexes stay valid
+    _get_cached_search_indexes(text_metadata_df).update(
+        _get_cached_search_indexes(chunks_df)
+    )
+    _get_cached_search_index_cells(text_metadata_df).update(
+        _get_cached_search_index_cells(chunks_df)
+    )
+
+    return text_metadata_df
+
+
+def get_image_metadata(
+    generative_multimodal_model: Any,
+    image_for_gemini: Image,
+    image_name: str,
+    image_number: int,
     image_description_prompt: str,
     embedding_size: int = 128,
     generation_config: Optional[GenerationConfig] = GenerationConfig(
         temperature=0.2, max_output_tokens=2048
     ),
-    safety_settings: Optional[dict] = {
-        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-    },
-    add_sleep_after_page: bool = False,
-    sleep_time_after_page: int = 2,
-) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    safety_settings: Optional[dict] = GEMINI_SAFETY_SETTINGS,
+) -> dict:
+    """
+    Describes an extracted image with Gemini and generates its embeddings.
+
+    Args:
+        generative_multimodal_model: The Gemini model used to describe the image.
+        image_for_gemini: The Gemini Image object.
+        image_name: The path of the saved image.
+        image_number: The image number within the page.
+        image_description_prompt: A prompt to guide Gemini for generating image descriptions.
+        embedding_size: The dimensionality of the image embedding.
+
+    Returns:
+        A dictionary with the image number, path, description, image embedding and description text embedding.
+    """
+
+    response = get_image_description(
+        generative_multimodal_model,
+        image_for_gemini,
+        image_description_prompt,
+        generation_config=generation_config,
+        safety_settings=safety_settings,
+    )
+
+    image_embedding = get_image_embedding_from_multimodal_embedding_model(
+        image_uri=image_name,
+        embedding_size=embedding_size,
+        image_bytes=image_for_gemini.data,
+    )
+
+    image_description_text_embedding = get_text_embedding_from_text_embedding_model(
+        text=response
+    )
+
+    return {
+        "img_num": image_number,
+        "img_path": image_name,
+        "img_desc": response,
+        # "mm_embedding_from_text_desc_and_img": image_embedding_with_description,
+        "mm_embedding_from_img_only": image_embedding,
+        "text_embedding_from_image_description": image_description_text_embedding,
+    }
+
+
+def reuse_image_metadata(future: Future, image_number: int, image_name: str) -> Future:
+    """
+    Derives the metadata of a duplicate image from the metadata of its first copy.
+
+    Args:
+        future: The Future holding the metadata of the first copy (see `get_image_metadata`).
+        image_number: The image number of the duplicate within its page.
+        image_name: The path of the duplicate image.
+
+    Returns:
+        A Future holding the same description and embeddings, with the duplicate's number and path.
+    """
+
+    reused: Future = Future()
+
+    def copy_metadata(source: Future) -> None:
+        if source.exception() is not None:
+            reused.set_exception(source.exception())
+        else:
+            reused.set_result(
+                {**source.result(), "img_num": image_number, "img_path": image_name}
+            )
+
+    future.add_done_callback(copy_metadata)
+    return reused
+
+
+def submit_task(
+    executor: Optional[ThreadPoolExecutor],
+    in_flight: threading.BoundedSemaphore,
+    function: Callable[..., Any],
+    *args: Any,
+    **kwargs: Any,
+) -> Future:
+    """
+    Runs a function on the executor, or immediately when no executor is given.
+
+    At most as many tasks as `in_flight` allows are queued at a time, which bounds
+    the memory held by extracted but not yet processed pages and images.
+
+    Returns:
+        A Future holding the result of the function.
+    """
+
+    if executor is None:
+        future: Future = Future()
+        future.set_result(function(*args, **kwargs))
+        return future
+
+    in_flight.acquire()
+    future = executor.submit(function, *args, **kwargs)
+    future.add_done_callback(lambda _: in_flight.release())
+    return future
+
+
+def iter_pdf_pages(
+    pdf_path: str,
+    image_save_dir: str,
+    save_images: bool = True,
+    image_writer: Optional[Executor] = None,
+    image_write_futures: Optional[List[Future]] = None,
+    character_limit: int = TEXT_CHUNK_CHARACTER_LIMIT,
+    overlap: int = TEXT_CHUNK_OVERLAP,
+) -> Iterator[dict]:
+    """
+    Parses a PDF file page by page: extracts and chunks the text, and extracts the images.
+
+    Args:
+        pdf_path: The path to the PDF document.
+        image_save_dir: The directory where extracted images should be saved.
+        save_images: Whether to save the extracted images to `image_save_dir`.
+        image_writer: If set, images are saved asynchronously on this executor.
+        image_write_futures: If set, the Futures of the asynchronous writes are appended to it.
+        character_limit: Maximum characters per chunk (defaults to 1000).
+        overlap: Number of overlapping characters between chunks (defaults to 100).
+
+    Yields:
+        One dictionary per page with the page "text", the "chunked_text_dict" and the "images",
+        a list of dictionaries with the image "xref", JPEG "image_bytes" and "image_name" (path).
+    """
+
+    file_name = pdf_path.split("/")[-1]
+
+    with fitz.open(pdf_path) as doc:
+        for page_num, page in enumerate(doc):
+            text = page.get_text().encode("ascii", "ignore").decode("utf-8", "ignore")
+
+            images = []
+            for image_no, image in enumerate(page.get_images()):
+                image_for_gemini, image_name = get_image_for_gemini(
+                    doc,
+                    image,
+                    image_no,
+                    image_save_dir,
+                    file_name,
+                    page_num,
+                    save_image=save_images,
+                    image_writer=image_writer,
+                    image_write_futures=image_write_futures,
+                )
+                images.append(
+                    {
+                        "xref": image[0],
+                        "image_bytes": image_for_gemini.data,
+                        "image_name": image_name,
+                    }
+                )
+
+            yield {
+                "text": text,
+                "chunked_text_dict": get_text_overlapping_chunk(
+                    text, character_limit, overlap
+                ),
+                "images": images,
+            }
+
+
+def parse_pdf(
+    pdf_path: str, image_save_dir: str, save_images: bool = True
+) -> List[dict]:
+    """
+    Parses a whole PDF file, see `iter_pdf_pages`. Used by the worker processes of
+    `parse_pdfs_in_processes`, so only plain Python objects are returned.
+    """
+
+    return list(iter_pdf_pages(pdf_path, image_save_dir, save_images))
+
+
+def parse_pdfs_in_processes(
+    pdf_paths: List[str],
+    image_save_dir: str,
+    save_images: bool = True,
+    max_processes: Optional[int] = None,
+) -> Iterator[List[dict]]:
+    """
+    Parses PDF files in a pool of worker processes, see `parse_pdf`.
+
+    At most two files per process are parsed ahead of the consumer, which bounds the memory
+    held by parsed pages and images.
+
+    Args:
+        pdf_paths: The paths to the PDF documents.
+        image_save_dir: The directory where extracted images should be saved.
+        save_images: Whether to save the extracted images to `image_save_dir`.
+        max_processes: Number of worker processes (defaults to the number of CPUs).
+
+    Yields:
+        The parsed pages of each file, in the order of `pdf_paths`.
+    """
+
+    max_processes = max_processes or os.cpu_count() or 1
+    remaining_paths = iter(pdf_paths)
+
+    with ProcessPoolExecutor(max_workers=max_processes) as process_pool:
+        pending: Deque[Future] = deque()
+
+        def submit_next() -> None:
+            pdf_path = next(remaining_paths, None)
+            if pdf_path is not None:
+                pending.append(
+                    process_pool.submit(
+                        parse_pdf, pdf_path, image_save_dir, save_images
+                    )
+                )
+
+        for _ in range(2 * max_processes):
+            submit_next()
+
+        while pending:
+            pages = pending.popleft().result()
+            submit_next()
+            yield pages
+
+
+def run_checkpointed(
+    checkpoint_path: Optional[str],
+    function: Callable[..., Any],
+    *args: Any,
+    **kwargs: Any,
+) -> Any:
+    """
+    Runs a function, reusing its result from a checkpoint if one exists.
+
+    Args:
+        checkpoint_path: The path of the checkpoint (see `save_checkpoint`), or None to disable checkpointing.
+        function: The function to run.
+        *args, **kwargs: Arguments passed to `function`.
+
+    Returns:
+        The (possibly checkpointed) return value of `function`.
+    """
+
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        return load_checkpoint(checkpoint_path)
+
+    result = function(*args, **kwargs)
+
+    if checkpoint_path is not None:
+        save_checkpoint(checkpoint_path, result)
+
+    return result
+
+
+def load_checkpoint(checkpoint_path: str) -> Any:
+    """
+    Loads the result saved in a checkpoint by `save_checkpoint`.
+    """
+
+    def get_records(path: str) -> List[dict]:
+        dataframe = load_metadata_df(path, mmap=False)
+        records = dataframe.to_dict("records")
+        for record in records:
+            for column, value in record.items():
+                # Restore the Python types returned by the models
+                if isinstance(value, np.ndarray):
+                    record[column] = value.tolist()
+                elif isinstance(value, np.integer):
+                    record[column] = int(value)
+        return records
+
+    if not os.path.exists(os.path.join(checkpoint_path, "chunks")):
+        # Image metadata, see `get_image_metadata`
+        return get_records(checkpoint_path)[0]
+
+    # Page text metadata, see `get_chunk_text_metadata_from_text`
+    page = get_records(os.path.join(checkpoint_path, "page"))[0]
+    chunks = get_records(os.path.join(checkpoint_path, "chunks"))
+    return (
+        page.pop("text"),
+        page,
+        {chunk["chunk_number"]: chunk["chunk_text"] for chunk in chunks},
+        {chunk["chunk_number"]: chunk["chunk_embedding"] for chunk in chunks},
+    )
+
+
+def save_checkpoint(checkpoint_path: str, result: Any) -> None:
+    """
+    Saves the result of `get_chunk_text_metadata_from_text` or `get_image_metadata` to a
+    checkpoint directory, as metadata tables (see `save_metadata_df`). Embeddings are
+    saved in float64 so the checkpointed result is identical to the original one.
+    """
+
+    # Write to a temporary directory first so an interrupted run never leaves a partial checkpoint
+    temporary_path = checkpoint_path + ".tmp"
+    shutil.rmtree(temporary_path, ignore_errors=True)
+
+    if isinstance(result, tuple):
+        (
+            text,
+            page_text_embeddings_dict,
+            chunked_text_dict,
+            chunk_embeddings_dict,
+        ) = result
+        save_metadata_df(
+            pd.DataFrame([{"text": text, **page_text_embeddings_dict}]),
+            os.path.join(temporary_path, "page"),
+            dtype=np.float64,
+        )
+        save_metadata_df(
+            pd.DataFrame(
+                {
+                    "chunk_number": list(chunked_text_dict),
+                    "chunk_text": list(chunked_text_dict.values()),
+                    "chunk_embedding": [
+                        chunk_embeddings_dict[chunk_number]
+                        for chunk_number in chunked_text_dict
+                    ],
+                },
+                columns=["chunk_number", "chunk_text", "chunk_embedding"],
+            ),
+            os.path.join(temporary_path, "chunks"),
+            dtype=np.float64,
+        )
+    else:
+        save_metadata_df(pd.DataFrame([result]), temporary_path, dtype=np.float64)
+
+    os.replace(temporary_path, checkpoint_path)
+
+
+def get_file_sha256(path: str) -> str:
+    """
+    Returns the SHA-256 hash of a file's content.
+    """
+
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def get_ingestion_settings(
+    generative_multimodal_model: Any,
+    image_description_prompt: str,
+    embedding_size: int,
+    generation_config: Optional[GenerationConfig] = None,
+    safety_settings: Optional[dict] = None,
+) -> Dict[str, Any]:
+    """
+    Returns the settings an ingestion's metadata depends on, recorded in the manifest of an
+    incremental run (see `plan_document_ingestion`): the models, the image description
+    request and the embedding and chunking parameters.
+    """
+
+    def get_model_name(model: Any) -> Optional[str]:
+        return (
+            getattr(model, "_model_name", None)
+            or getattr(model, "_model_id", None)
+            or getattr(model, "_model_resource_name", None)
+        )
+
+    settings = {
+        "generative_model": get_model_name(generative_multimodal_model),
+        "text_embedding_model": get_model_name(get_text_embedding_model()),
+        "multimodal_embedding_model": get_model_name(get_multimodal_embedding_model()),
+        "image_description_prompt": image_description_prompt,
+        "generation_config": (
+            generation_config.to_dict() if generation_config is not None else None
+        ),
+        "safety_settings": {
+            str(category): str(threshold)
+            for category, threshold in (safety_settings or {}).items()
+        },
+        "embedding_size": embedding_size,
+        "character_limit": TEXT_CHUNK_CHARACTER_LIMIT,
+        "overlap": TEXT_CHUNK_OVERLAP,
+    }
+
+    # Normalize the settings as they are read back from the manifest
+    return json.loads(json.dumps(settings, sort_keys=True, default=str))
+
+
+def load_ingestion_manifest(metadata_path: str) -> Dict[str, Dict]:
+    """
+    Loads the manifest of the files ingested into `metadata_path` by `get_document_metadata`.
+
+    Returns:
+        A dictionary with the ingestion "settings" (see `get_ingestion_settings`) and the
+        "files", mapping file names to their size, modification time and SHA-256 hash.
+    """
+
+    manifest_path = os.path.join(metadata_path, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return {}
+
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_ingestion_manifest(metadata_path: str, manifest: Dict[str, Dict]) -> None:
+    """
+    Saves the manifest of the files ingested into `metadata_path` by `get_document_metadata`.
+    """
+
+    manifest_path = os.path.join(metadata_path, "manifest.json")
+    with open(manifest_path + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def plan_document_ingestion(
+    pdf_folder_path: str,
+    metadata_path: Optional[str] = None,
+    ingestion_settings: Optional[Dict[str, Any]] = None,
+) -> Tuple[
+    List[Tuple[str, str, Optional[str], bool]],
+    Dict[str, Dict],
+    Dict[str, pd.DataFrame],
+    Dict[str, pd.DataFrame],
+]:
+    """
+    Lists the PDF files to ingest and, for an incremental run, compares them with the
+    manifest and loads the persisted metadata of the unchanged files.
+
+    Files are only skipped when the manifest was written with the same ingestion settings:
+    when they changed, every file is processed again.
+
+    Args:
+        pdf_folder_path: The folder containing the PDF documents.
+        metadata_path: Optional directory of an incremental ingestion, see `get_document_metadata`.
+        ingestion_settings: The settings of this run, see `get_ingestion_settings`.
+
+    Returns:
+        A tuple containing:
+            * One (pdf_path, file_name, checkpoint_dir, unchanged) tuple per file. The checkpoint
+              directory is created, and is None when `metadata_path` is not set.
+            * The new manifest.
+            * The persisted text and image metadata DataFrames of the unchanged files, by file name.
+    """
+
+    ingestion_settings = ingestion_settings or {}
+    ingestion_plan: List[Tuple[str, str, Optional[str], bool]] = []
+    manifest: Dict[str, Dict] = {}
+    new_manifest: Dict[str, Dict] = {"settings": ingestion_settings, "files": {}}
+    persisted_text_metadata: Dict[str, pd.DataFrame] = {}
+    persisted_image_metadata: Dict[str, pd.DataFrame] = {}
+
+    # Checkpoints are only reused by a run with the same settings
+    settings_hash = hashlib.sha256(
+        json.dumps(ingestion_settings, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+    if metadata_path is not None:
+        previous_manifest = load_ingestion_manifest(metadata_path)
+        if (
+            previous_manifest
+            and previous_manifest.get("settings") != ingestion_settings
+        ):
+            # Also the case of the manifests of earlier versions, which have no settings
+            print(
+                "The ingestion settings changed since the last run, processing every file again."
+            )
+        elif previous_manifest:
+            manifest = previous_manifest["files"]
+            text_metadata_df, image_metadata_df = load_document_metadata(metadata_path)
+            for persisted, metadata_df in (
+                (persisted_text_metadata, text_metadata_df),
+                (persisted_image_metadata, image_metadata_df),
+            ):
+                if len(metadata_df):
+                    persisted.update(
+                        (file_name, file_df.reset_index(drop=True))
+                        for file_name, file_df in metadata_df.groupby(
+                            "file_name", sort=False
+                        )
+                    )
+
+    for pdf_path in glob.glob(pdf_folder_path + "/*.pdf"):
+        file_name = pdf_path.split("/")[-1]
+        checkpoint_dir = None
+
+        if metadata_path is not None:
+            file_stat = os.stat(pdf_path)
+            file_state: Dict[str, Any] = {
+                "size": file_stat.st_size,
+                "mtime": file_stat.st_mtime,
+            }
+            manifest_entry = manifest.get(file_name, {})
+
+            # Only hash the file when its size or modification time changed
+            if {k: manifest_entry.get(k) for k in file_state} == file_state:
+                file_state["sha256"] = manifest_entry["sha256"]
+            else:
+                file_state["sha256"] = get_file_sha256(pdf_path)
+            new_manifest["files"][file_name] = file_state
+
+            if manifest_entry.get("sha256") == file_state["sha256"]:
+                print("Skipping the unchanged file:", pdf_path)
+                ingestion_plan.append((pdf_path, file_name, None, True))
+                continue
+
+            checkpoint_dir = os.path.join(
+                metadata_path,
+                "checkpoints",
+                f"{file_name}-{file_state['sha256'][:16]}-{settings_hash[:16]}",
+            )
+            os.makedirs(checkpoint_dir, exist_ok=True)
+
+        ingestion_plan.append((pdf_path, file_name, checkpoint_dir, False))
+
+    return (
+        ingestion_plan,
+        new_manifest,
+        persisted_text_metadata,
+        persisted_image_metadata,
+    )
+
+
+def get_file_metadata_dfs(
+    file_name: str,
+    text_futures: Optional[Dict],
+    image_futures: Optional[Dict],
+    persisted_text_metadata: Dict[str, pd.DataFrame],
+    persisted_image_metadata: Dict[str, pd.DataFrame],
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Builds the text and image metadata DataFrames of a single file from the results of
+    its ingestion tasks.
+
+    Args:
+        file_name: The file name.
+        text_futures: The futures (or completed asyncio tasks) of the file's pages, keyed by
+                      page number, or None for an unchanged file of an incremental run.
+        image_futures: The futures of the file's images, keyed by page number and image number.
+        persisted_text_metadata: The persisted text metadata of the unchanged files, by file name.
+                                 The file's entry is removed once used.
+        persisted_image_metadata: The persisted image metadata of the unchanged files, by file name.
+                                  The file's entry is removed once used.
+
+    Returns:
+        A tuple containing the file's text metadata DataFrame and image metadata DataFrame.
+    """
+
+    if text_futures is None:
+        # Unchanged file of an incremental run
+        text_metadata_df = persisted_text_metadata.pop(file_name, pd.DataFrame())
+        image_metadata_df = persisted_image_metadata.pop(file_name, pd.DataFrame())
+    else:
+        text_metadata = {}
+        for page_num, future in text_futures.items():
+            (
+                text,
+                page_text_embeddings_dict,
+                chunked_text_dict,
+                chunk_embeddings_dict,
+            ) = future.result()
+            text_metadata[page_num] = {
+                "text": text,
+                "page_text_embeddings": page_text_embeddings_dict,
+                "chunked_text_dict": chunked_text_dict,
+                "chunk_embeddings_dict": chunk_embeddings_dict,
+            }
+
+        image_metadata = {
+            page_num: {
+                image_number: future.result()
+                for image_number, future in page_futures.items()
+            }
+            for page_num, page_futures in (image_futures or {}).items()
+        }
+
+        text_metadata_df = get_text_metadata_df(file_name, text_metadata)
+        image_metadata_df = get_image_metadata_df(file_name, image_metadata)
+
+    # Files without images have no "img_desc" column
+    if len(image_metadata_df):
+        image_metadata_df = image_metadata_df.drop_duplicates(subset=["img_desc"])
+
+    return text_metadata_df, image_metadata_df
+
+
+def get_document_metadata_dfs(
+    file_metadata: Iterable[Tuple[str, Optional[Dict], Optional[Dict]]],
+    persisted_text_metadata: Dict[str, pd.DataFrame],
+    persisted_image_metadata: Dict[str, pd.DataFrame],
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Builds the text and image metadata DataFrames from the results of the ingestion tasks.
+
+    The DataFrames of the files are collected and concatenated once, so the embedding
+    columns are only copied once whatever the number of files.
+
+    Args:
+        file_metadata: One (file_name, text_futures, image_futures) tuple per file, in order,
+                       see `get_file_metadata_dfs`.
+        persisted_text_metadata: The persisted text metadata of the unchanged files, by file name.
+        persisted_image_metadata: The persisted image metadata of the unchanged files, by file name.
+
+    Returns:
+        A tuple containing the text metadata DataFrame and the image metadata DataFrame.
+        The BM25 index of the chunk text (see `get_lexical_search_index`) is built file by file
+        and registered for the text metadata DataFrame.
+    """
+
+    text_metadata_dfs: List[pd.DataFrame] = []
+    image_metadata_dfs: List[pd.DataFrame] = []
+    lexical_index = BM25Index()
+
+    for file_name, text_futures, image_futures in file_metadata:
+        text_metadata_df, image_metadata_df = get_file_metadata_dfs(
+            file_name,
+            text_futures,
+            image_futures,
+            persisted_text_metadata,
+            persisted_image_metadata,
+        )
+
+        if len(text_metadata_df):
+            lexical_index.add(text_metadata_df["chunk_text"])
+
+        text_metadata_dfs.append(text_metadata_df)
+        image_metadata_dfs.append(image_metadata_df)
+
+    text_metadata_df_final = (
+        pd.concat(text_metadata_dfs, axis=0).reset_index(drop=True)
+        if text_metadata_dfs
+        else pd.DataFrame()
+    )
+    image_metadata_df_final = (
+        pd.concat(image_metadata_dfs, axis=0).reset_index(drop=True)
+        if image_metadata_dfs
+        else pd.DataFrame()
+    )
+
+    if len(text_metadata_df_final):
+        _set_cached_index(
+            text_metadata_df_final,
+            ("lexical", "chunk_text"),
+            ["chunk_text"],
+            lexical_index,
+        )
+
+    return text_metadata_df_final, image_metadata_df_final
+
+
+def write_document_metadata_files(
+    document_writer: "DocumentMetadataWriter",
+    file_metadata: Deque[Tuple[str, Optional[Dict], Optional[Dict]]],
+    persisted_text_metadata: Dict[str, pd.DataFrame],
+    persisted_image_metadata: Dict[str, pd.DataFrame],
+    stop_at: Optional[Dict] = None,
+) -> None:
+    """
+    Writes the metadata of the files at the front of `file_metadata` to a DocumentMetadataWriter,
+    waiting for their tasks, and removes them from `file_metadata`.
+
+    Args:
+        document_writer: The DocumentMetadataWriter.
+        file_metadata: The pending (file_name, text_futures, image_futures) tuples, in order.
+        persisted_text_metadata: The persisted text metadata of the unchanged files, by file name.
+        persisted_image_metadata: The persisted image metadata of the unchanged files, by file name.
+        stop_at: If set, the text futures of the first file not to write (the file being processed).
+    """
+
+    while file_metadata and (stop_at is None or file_metadata[0][1] is not stop_at):
+        document_writer.append(
+            *get_file_metadata_dfs(
+                *file_metadata.popleft(),
+                persisted_text_metadata,
+                persisted_image_metadata,
+            )
+        )
+
+
+def finish_document_metadata(
+    text_metadata_df: pd.DataFrame,
+    image_metadata_df: pd.DataFrame,
+    metadata_path: Optional[str] = None,
+    new_manifest: Optional[Dict[str, Dict]] = None,
+    metadata_saved: bool = False,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Persists the metadata DataFrames of an incremental run and reports the cache statistics.
+
+    Args:
+        text_metadata_df: The text metadata DataFrame.
+        image_metadata_df: The image metadata DataFrame.
+        metadata_path: Optional directory of an incremental ingestion, see `get_document_metadata`.
+        new_manifest: The manifest of the ingested files, see `plan_document_ingestion`.
+        metadata_saved: Whether the tables were already written to `metadata_path`
+                        (see `DocumentMetadataWriter`), in which case the DataFrames are ignored.
+
+    Returns:
+        The DataFrames, reloaded from `metadata_path` (memory-mapped) when it is set.
+    """
+
+    if metadata_path is not None:
+        # Persist the tables before the manifest, so the manifest never lists missing rows
+        if not metadata_saved:
+            save_document_metadata(text_metadata_df, image_metadata_df, metadata_path)
+        save_ingestion_manifest(metadata_path, new_manifest or {})
+        shutil.rmtree(os.path.join(metadata_path, "checkpoints"), ignore_errors=True)
+
+        # Return memory-mapped tables, with the same embedding layout for old and new files
+        text_metadata_df, image_metadata_df = load_document_metadata(metadata_path)
+
+    if embedding_cache is not None:
+        print("Embedding cache statistics:", embedding_cache.get_stats())
+    if image_description_cache is not None:
+        print(
+            "Image description cache statistics:",
+            image_description_cache.get_stats(),
+        )
+
+    return text_metadata_df, image_metadata_df
+
+
+def get_document_metadata(
+    generative_multimodal_model: Any,
+    pdf_folder_path: str,
+    image_save_dir: str,
+    image_description_prompt: str,
+    embedding_size: int = 128,
+    generation_config: Optional[GenerationConfig] = GenerationConfig(
+        temperature=0.2, max_output_tokens=2048
+    ),
+    safety_settings: Optional[dict] = GEMINI_SAFETY_SETTINGS,
+    add_sleep_after_page: bool = False,
+    sleep_time_after_page: int = 2,
+    max_workers: int = 1,
+    requests_per_minute: Optional[Dict[str, float]] = None,
+    metadata_path: Optional[str] = None,
+    save_images: bool = True,
+    deduplicate_images: Union[bool, str] = False,
+    max_processes: int = 1,
+    stream_to_metadata_path: bool = False,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    This function takes a PDF path, an image save directory, an image description prompt, an embedding size, and a text embedding text limit as input.
+
+    Args:
+        pdf_path: The path to the PDF document.
+        image_save_dir: The directory where extracted images should be saved.
+        image_description_prompt: A prompt to guide Gemini for generating image descriptions.
+        embedding_size: The dimensionality of the embedding vectors.
+        text_emb_text_limit: The maximum number of tokens for text embedding.
+        add_sleep_after_page: Whether to sleep after each page to avoid quota errors.
+                              Prefer `requests_per_minute`, which also works with `max_workers`.
+        max_workers: Number of worker threads. With more than one worker, the text embeddings,
+                     Gemini image descriptions and multimodal embeddings of different pages
+                     and images are computed concurrently while the PDF is being parsed.
+        requests_per_minute: Optional requests-per-minute limit per model, e.g.
+                             {"gemini": 60, "text_embedding": 600, "multimodal_embedding": 120}.
+                             See `set_requests_per_minute`.
+        metadata_path: Optional directory enabling incremental ingestion. The metadata tables are
+                       persisted there (see `save_document_metadata`) along with a manifest of the
+                       ingested files (size, modification time and SHA-256 hash) and of the ingestion
+                       settings (see `get_ingestion_settings`). Unchanged PDFs are not processed again
+                       unless the settings changed, and the result of every page and image is
+                       checkpointed so an interrupted run resumes where it stopped.
+        save_images: Whether to save the extracted images to `image_save_dir`. Images are written
+                     in the background while the models process them, and a failed write is
+                     raised before the metadata is returned. Without saved images,
+                     `get_similar_image_from_query` raises FileNotFoundError, as it can't load
+                     the matched image objects.
+        deduplicate_images: Whether to reuse the description and embeddings of an image already
+                            seen in this run (same xref within a document, or same image bytes)
+                            instead of calling the models again. Logos and headers are then only
+                            described once. With "near", near-identical images are reused too
+                            (see `ImageDeduplicator`), which can merge charts or tables that only
+                            differ in their details. Defaults to False.
+        max_processes: Number of worker processes parsing the PDFs. With more than one process,
+                       text extraction, chunking and image extraction run on several cores
+                       (see `parse_pdfs_in_processes`), while the model calls stay in this process.
+        stream_to_metadata_path: Whether to write the metadata of each file to `metadata_path` as soon
+                                 as it is complete (see `DocumentMetadataWriter`) instead of collecting
+                                 the whole folder in memory. The returned DataFrames are memory-mapped
+                                 from `metadata_path`.
+
+    Returns:
+        A tuple containing two DataFrames:
+            * One DataFrame containing the extracted text metadata for each page of the PDF, including the page text, chunked text dictionaries, and chunk embedding dictionaries.
+            * Another DataFrame containing the extracted image metadata for each image in the PDF, including the image path, image description, image embeddings (with and without context), and image description text embedding.
+    """
+
+    if stream_to_metadata_path and metadata_path is None:
+        raise ValueError("'stream_to_metadata_path' requires a 'metadata_path'.")
+
+    for model_type, model_requests_per_minute in (requests_per_minute or {}).items():
+        set_requests_per_minute(model_type, model_requests_per_minute)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+    in_flight = threading.BoundedSemaphore(2 * max_workers)
+    image_writer = ThreadPoolExecutor(max_workers=1)
+    image_write_futures: List[Future] = []
+    image_deduplicator = (
+        ImageDeduplicator(near_duplicates=deduplicate_images == "near")
+        if deduplicate_images
+        else None
+    )
+
+    # Per-file page results, as futures until every task has completed.
+    # Unchanged files of an incremental run have no futures.
+    file_metadata: Deque[Tuple[str, Optional[Dict], Optional[Dict]]] = deque()
+
+    (
+        ingestion_plan,
+        new_manifest,
+        persisted_text_metadata,
+        persisted_image_metadata,
+    ) = plan_document_ingestion(
+        pdf_folder_path,
+        metadata_path,
+        get_ingestion_settings(
+            generative_multimodal_model,
+            image_description_prompt,
+            embedding_size,
+            generation_config,
+            safety_settings,
+        ),
+    )
+    document_writer = (
+        DocumentMetadataWriter(metadata_path)
+        if stream_to_metadata_path and metadata_path is not None
+        else None
+    )
+
+    try:
+        # Files to parse and embed, i.e. all of them unless the run is incremental
+        files_to_process: List[Tuple[str, str, Dict, Dict, Optional[str]]] = []
+
+        for pdf_path, file_name, checkpoint_dir, unchanged in ingestion_plan:
+            if unchanged:
+                file_metadata.append((file_name, None, None))
+                continue
+
+            text_futures: Dict[int, Future] = {}
+            image_futures: Dict[int, Dict[int, Future]] = {}
+            file_metadata.append((file_name, text_futures, image_futures))
+            files_to_process.append(
+                (pdf_path, file_name, text_futures, image_futures, checkpoint_dir)
+            )
+
+        pdf_paths = [pdf_path for pdf_path, *_ in files_to_process]
+        if max_processes > 1:
+            # Parse, chunk and extract images in worker processes, a few files ahead
+            parsed_pdfs: Iterable[Iterable[dict]] = parse_pdfs_in_processes(
+                pdf_paths, image_save_dir, save_images, max_processes
+            )
+        else:
+            parsed_pdfs = (
+                iter_pdf_pages(
+                    pdf_path,
+                    image_save_dir,
+                    save_images,
+                    image_writer,
+                    image_write_futures,
+                )
+                for pdf_path in pdf_paths
+            )
+
+        for (
+            pdf_path,
+            file_name,
+            text_futures,
+            image_futures,
+            checkpoint_dir,
+        ), pages in zip(files_to_process, parsed_pdfs):
+            print(
+                "\n\n",
+                "Processing the file: ---------------------------------",
+                pdf_path,
+                "\n\n",
+            )
+
+            for page_num, page in enumerate(pages):
+                print(f"Processing page: {page_num + 1}")
+
+                text_futures[page_num] = submit_task(
+                    executor,
+                    in_flight,
+                    run_checkpointed,
+                    checkpoint_dir and os.path.join(checkpoint_dir, f"text_{page_num}"),
+                    get_chunk_text_metadata_from_text,
+                    page["text"],
+                    chunked_text_dict=page["chunked_text_dict"],
+                )
+
+                image_futures[page_num] = {}
+
+                for image_no, image in enumerate(page["images"]):
+                    image_number = int(image_no + 1)
+                    image_for_gemini = Image.from_bytes(image["image_bytes"])
+                    image_name = image["image_name"]
+
+                    print(
+                        f"Extracting image from page: {page_num + 1}, saved as: {image_name}"
+                    )
+
+                    first_copy_future = (
+                        image_deduplicator.find(
+                            file_name, image["xref"], image["image_bytes"]
+                        )
+                        if image_deduplicator is not None
+                        else None
+                    )
+                    if first_copy_future is not None:
+                        image_futures[page_num][image_number] = reuse_image_metadata(
+                            first_copy_future, image_number, image_name
+                        )
+                        continue
+
+                    image_futures[page_num][image_number] = submit_task(
+                        executor,
+                        in_flight,
+                        run_checkpointed,
+                        checkpoint_dir
+                        and os.path.join(
+                            checkpoint_dir, f"image_{page_num}_{image_number}"
+                        ),
+                        get_image_metadata,
+                        generative_multimodal_model,
+                        image_for_gemini,
+                        image_name,
+                        image_number,
+                        image_description_prompt,
+                        embedding_size=embedding_size,
+                        generation_config=generation_config,
+                        safety_settings=safety_settings,
+                    )
+
+                    if image_deduplicator is not None:
+                        image_deduplicator.add(
+                            file_name,
+                            image["xref"],
+                            image["image_bytes"],
+                            image_futures[page_num][image_number],
+                        )
+
+                # Add sleep to reduce issues with Quota error on API
+                if add_sleep_after_page:
+                    time.sleep(sleep_time_after_page)
+                    print(
+                        "Sleeping for ",
+                        sleep_time_after_page,
+                        """ sec before processing the next page to avoid quota issues. You can disable it: "add_sleep_after_page = False"  """,
+                    )
+
+            if document_writer is not None:
+                # Write the previous files while the pages of this one are processed
+                write_document_metadata_files(
+                    document_writer,
+                    file_metadata,
+                    persisted_text_metadata,
+                    persisted_image_metadata,
+                    stop_at=text_futures,
+                )
+
+        # Raise the errors of the background image writes
+        for image_write_future in image_write_futures:
+            image_write_future.result()
+
+        if document_writer is not None:
+            write_document_metadata_files(
+                document_writer,
+                file_metadata,
+                persisted_text_metadata,
+                persisted_image_metadata,
+            )
+            document_writer.close()
+            text_metadata_df_final, image_metadata_df_final = (
+                pd.DataFrame(),
+                pd.DataFrame(),
+            )
+        else:
+            text_metadata_df_final, image_metadata_df_final = get_document_metadata_dfs(
+                file_metadata, persisted_text_metadata, persisted_image_metadata
+            )
+    except BaseException:
+        if document_writer is not None:
+            document_writer.discard()
+        raise
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+        image_writer.shutdown(wait=True)
+
+    return finish_document_metadata(
+        text_metadata_df_final,
+        image_metadata_df_final,
+        metadata_path,
+        new_manifest,
+        metadata_saved=document_writer is not None,
+    )
+
+
+# Functions for asynchronous ingestion
+
+
+async def get_text_embeddings_from_text_embedding_model_async(
+    texts: List[str],
+    return_array: Optional[bool] = False,
+    max_batch_size: int = TEXT_EMBEDDING_MAX_BATCH_SIZE,
+    max_batch_tokens: int = TEXT_EMBEDDING_MAX_BATCH_TOKENS,
+) -> list:
+    """
+    Asynchronous version of `get_text_embeddings_from_text_embedding_model`:
+    the batches are sent concurrently with the model's `get_embeddings_async`.
+
+    Args:
+        texts: The input text strings to be embedded.
+        return_array: If True, returns each embedding as a NumPy array.
+                      If False, returns each embedding as a list. (Default: False)
+        max_batch_size: Maximum number of texts per request.
+        max_batch_tokens: Maximum (estimated) number of tokens per request.
+
+    Returns:
+        list: One embedding per input text, in the same order as `texts`.
+    """
+
+    cached_embeddings: Dict[str, list] = {}
+    model = get_text_embedding_model()
+    cache, model_name = get_model_embedding_cache(model)
+    if cache is not None:
+        cache_keys = [get_text_embedding_cache_key(text, model_name) for text in texts]
+        cached_embeddings = cache.get_many(cache_keys)
+        # Only embed the texts missing from the cache, once each
+        texts_to_embed = list(
+            dict.fromkeys(
+                text
+                for text, cache_key in zip(texts, cache_keys)
+                if cache_key not in cached_embeddings
+            )
+        )
+    else:
+        texts_to_embed = texts
+
+    async def embed_batch(batch: List[str]) -> List[list]:
+        embeddings = await call_model_async(
+            "text_embedding", model.get_embeddings_async, batch
+        )
+        return [embedding.values for embedding in embeddings]
+
+    batch_embeddings = await asyncio.gather(
+        *(
+            embed_batch(batch)
+            for batch in get_text_embedding_batches(
+                texts_to_embed, max_batch_size, max_batch_tokens
+            )
+        )
+    )
+    text_embeddings = [
+        embedding for embeddings in batch_embeddings for embedding in embeddings
+    ]
+
+    if cache is not None:
+        new_embeddings = {
+            get_text_embedding_cache_key(text, model_name): embedding
+            for text, embedding in zip(texts_to_embed, text_embeddings)
+        }
+        cache.put_many(new_embeddings)
+        cached_embeddings.update(new_embeddings)
+        text_embeddings = [cached_embeddings[cache_key] for cache_key in cache_keys]
+
+    if return_array:
+        return [np.fromiter(embedding, dtype=float) for embedding in text_embeddings]
+
+    return text_embeddings
+
+
+async def get_image_embedding_from_multimodal_embedding_model_async(
+    image_uri: str,
+    embedding_size: int = 512,
+    text: Optional[str] = None,
+    return_array: Optional[bool] = False,
+    image_bytes: Optional[bytes] = None,
+) -> list:
+    """
+    Asynchronous version of `get_image_embedding_from_multimodal_embedding_model`.
+    The multimodal embedding model has no asynchronous method, so the request runs
+    in the event loop's default executor.
+    """
+
+    image_embedding = None
+    cache_key = None
+    if image_bytes is None:
+        with open(image_uri, "rb") as image_file:
+            image_bytes = image_file.read()
+
+    model = get_multimodal_embedding_model()
+    cache, model_name = get_model_embedding_cache(model)
+    if cache is not None:
+        cache_key = get_image_embedding_cache_key(
+            image_bytes, text, embedding_size, model_name
+        )
+        image_embedding = cache.get(cache_key)
+
+    if image_embedding is None:
+        embeddings = await call_model_async(
+            "multimodal_embedding",
+            model.get_embeddings,
+            image=vision_model_Image(image_bytes),
+            contextual_text=text,
+            dimension=embedding_size,
+        )
+        image_embedding = embeddings.image_embedding
+
+        if cache is not None and cache_key is not None:
+            cache.put(cache_key, image_embedding)
+
+    if return_array:
+        return np.fromiter(image_embedding, dtype=float)
+
+    return image_embedding
+
+
+async def get_page_text_embedding_async(text_data: Union[dict, str]) -> dict:
+    """
+    Asynchronous version of `get_page_text_embedding`.
+    """
+
+    if not text_data:
+        return {}
+
+    if isinstance(text_data, dict):
+        chunk_embeddings = await get_text_embeddings_from_text_embedding_model_async(
+            list(text_data.values())
+        )
+        return dict(zip(text_data.keys(), chunk_embeddings))
+
+    text_embeddings = await get_text_embeddings_from_text_embedding_model_async(
+        [text_data]
+    )
+    return {"text_embedding": text_embeddings[0]}
+
+
+async def get_chunk_text_metadata_from_text_async(
+    text: str,
+    character_limit: int = 1000,
+    overlap: int = 100,
+    chunked_text_dict: Optional[dict] = None,
+) -> tuple[str, dict, dict, dict]:
+    """
+    Asynchronous version of `get_chunk_text_metadata_from_text`: the page text and
+    its chunks are embedded concurrently.
+    """
+
+    if chunked_text_dict is None:
+        chunked_text_dict = get_text_overlapping_chunk(text, character_limit, overlap)
+
+    page_text_embeddings_dict, chunk_embeddings_dict = await asyncio.gather(
+        get_page_text_embedding_async(text),
+        get_page_text_embedding_async(chunked_text_dict),
+    )
+
+    return text, page_text_embeddings_dict, chunked_text_dict, chunk_embeddings_dict
+
+
+async def get_image_description_async(
+    generative_multimodal_model: Any,
+    image_for_gemini: Image,
+    image_description_prompt: str,
+    generation_config: Optional[GenerationConfig] = None,
+    safety_settings: Optional[dict] = None,
+) -> str:
+    """
+    Asynchronous version of `get_image_description`.
+    """
+
+    cache = image_description_cache
+    cache_key = None
+    if cache is not None:
+        cache_key = ImageDescriptionCache.get_description_key(
+            generative_multimodal_model,
+            image_for_gemini.data,
+            image_description_prompt,
+            generation_config,
+            safety_settings,
+        )
+        cached_description: Any = cache.get(cache_key)
+        if cached_description is not None:
+            return cached_description
+
+    metrics: Dict[str, Any] = {}
+    description = await call_model_async(
+        "gemini",
+        get_gemini_response_async,
+        generative_multimodal_model,
+        model_input=[image_description_prompt, image_for_gemini],
+        generation_config=generation_config,
+        safety_settings=safety_settings,
+        metrics=metrics,
+    )
+
+    if (
+        cache is not None
+        and cache_key is not None
+        and is_successful_gemini_response(description, metrics)
+    ):
+        cache.put(cache_key, description)
+
+    return description
+
+
+async def get_image_metadata_async(
+    generative_multimodal_model: Any,
+    image_for_gemini: Image,
+    image_name: str,
+    image_number: int,
+    image_description_prompt: str,
+    embedding_size: int = 128,
+    generation_config: Optional[GenerationConfig] = GenerationConfig(
+        temperature=0.2, max_output_tokens=2048
+    ),
+    safety_settings: Optional[dict] = GEMINI_SAFETY_SETTINGS,
+) -> dict:
+    """
+    Asynchronous version of `get_image_metadata`: the image is described and
+    embedded concurrently, then the description is embedded.
+    """
+
+    response, image_embedding = await asyncio.gather(
+        get_image_description_async(
+            generative_multimodal_model,
+            image_for_gemini,
+            image_description_prompt,
+            generation_config=generation_config,
+            safety_settings=safety_settings,
+        ),
+        get_image_embedding_from_multimodal_embedding_model_async(
+            image_uri=image_name,
+            embedding_size=embedding_size,
+            image_bytes=image_for_gemini.data,
+        ),
+    )
+
+    image_description_text_embedding = (
+        await get_text_embeddings_from_text_embedding_model_async([response])
+    )[0]
+
+    return {
+        "img_num": image_number,
+        "img_path": image_name,
+        "img_desc": response,
+        "mm_embedding_from_img_only": image_embedding,
+        "text_embedding_from_image_description": image_description_text_embedding,
+    }
+
+
+async def reuse_image_metadata_async(
+    task: asyncio.Future, image_number: int, image_name: str
+) -> dict:
+    """
+    Asynchronous version of `reuse_image_metadata`.
+    """
+
+    return {**(await task), "img_num": image_number, "img_path": image_name}
+
+
+async def run_checkpointed_async(
+    checkpoint_path: Optional[str],
+    function: Callable[..., Awaitable[Any]],
+    *args: Any,
+    **kwargs: Any,
+) -> Any:
+    """
+    Asynchronous version of `run_checkpointed`, for a coroutine function.
+    """
+
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        return load_checkpoint(checkpoint_path)
+
+    result = await function(*args, **kwargs)
+
+    if checkpoint_path is not None:
+        save_checkpoint(checkpoint_path, result)
+
+    return result
+
+
+async def submit_task_async(
+    in_flight: asyncio.Semaphore, coroutine: Awaitable[Any]
+) -> "asyncio.Task[Any]":
+    """
+    Schedules a coroutine as a task, waiting first while too many tasks are in flight
+    (see `submit_task`).
+
+    Returns:
+        The task.
+    """
+
+    await in_flight.acquire()
+    task = asyncio.ensure_future(coroutine)
+    task.add_done_callback(lambda _: in_flight.release())
+    return task
+
+
+async def get_document_metadata_async(
+    generative_multimodal_model: Any,
+    pdf_folder_path: str,
+    image_save_dir: str,
+    image_description_prompt: str,
+    embedding_size: int = 128,
+    generation_config: Optional[GenerationConfig] = GenerationConfig(
+        temperature=0.2, max_output_tokens=2048
+    ),
+    safety_settings: Optional[dict] = GEMINI_SAFETY_SETTINGS,
+    max_concurrency: int = 16,
+    requests_per_minute: Optional[Dict[str, float]] = None,
+    metadata_path: Optional[str] = None,
+    save_images: bool = True,
+    deduplicate_images: Union[bool, str] = False,
+    stream_to_metadata_path: bool = False,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Asynchronous version of `get_document_metadata`, built on the asynchronous Gemini and
+    text embedding methods, which returns the same DataFrames.
+
+    All pages and images are processed concurrently, within a budget of `max_concurrency`
+    model requests in flight. PDFs are parsed in the event loop's default executor, so the
+    next file is parsed while the model requests of the previous one are running.
+
+    Args:
+        generative_multimodal_model: The Gemini model used to describe the images.
+        pdf_folder_path: The folder containing the PDF documents.
+        image_save_dir: The directory where extracted images should be saved.
+        image_description_prompt: A prompt to guide Gemini for generating image descriptions.
+        embedding_size: The dimensionality of the embedding vectors.
+        max_concurrency: Maximum number of model requests in flight at the same time.
+        requests_per_minute: Optional requests-per-minute limit per model, see `get_document_metadata`.
+        metadata_path: Optional directory enabling incremental ingestion, see `get_document_metadata`.
+        save_images: Whether to save the extracted images to `image_save_dir`.
+        deduplicate_images: Whether to describe and embed identical (or with "near", near-identical)
+                            images only once, see `get_document_metadata`.
+        stream_to_metadata_path: Whether to write the metadata of each file to `metadata_path` as soon
+                                 as it is complete, see `get_document_metadata`.
+
+    Returns:
+        The same tuple of DataFrames as `get_document_metadata`.
+    """
+
+    if stream_to_metadata_path and metadata_path is None:
+        raise ValueError("'stream_to_metadata_path' requires a 'metadata_path'.")
+
+    for model_type, model_requests_per_minute in (requests_per_minute or {}).items():
+        set_requests_per_minute(model_type, model_requests_per_minute)
+
+    loop = asyncio.get_running_loop()
+    # Bounds the extracted pages and images waiting for the models
+    in_flight = asyncio.Semaphore(2 * max_concurrency)
+    image_deduplicator = (
+        ImageDeduplicator(near_duplicates=deduplicate_images == "near")
+        if deduplicate_images
+        else None
+    )
+    tasks: List[asyncio.Future] = []
+
+    # Per-file page results, as tasks until every task has completed
+    file_metadata: Deque[Tuple[str, Optional[Dict], Optional[Dict]]] = deque()
+
+    (
+        ingestion_plan,
+        new_manifest,
+        persisted_text_metadata,
+        persisted_image_metadata,
+    ) = plan_document_ingestion(
+        pdf_folder_path,
+        metadata_path,
+        get_ingestion_settings(
+            generative_multimodal_model,
+            image_description_prompt,
+            embedding_size,
+            generation_config,
+            safety_settings,
+        ),
+    )
+    document_writer = (
+        DocumentMetadataWriter(metadata_path)
+        if stream_to_metadata_path and metadata_path is not None
+        else None
+    )
+
+    semaphore_token = model_request_semaphore.set(asyncio.Semaphore(max_concurrency))
+    try:
+        for pdf_path, file_name, checkpoint_dir, unchanged in ingestion_plan:
+            if unchanged:
+                file_metadata.append((file_name, None, None))
+                continue
+
+            text_tasks: Dict[int, asyncio.Future] = {}
+            image_tasks: Dict[int, Dict[int, asyncio.Future]] = {}
+            file_metadata.append((file_name, text_tasks, image_tasks))
+
+            print(
+                "\n\n",
+                "Processing the file: ---------------------------------",
+                pdf_path,
+                "\n\n",
+            )
+
+            pages = await loop.run_in_executor(
+                None, parse_pdf, pdf_path, image_save_dir, save_images
+            )
+            previous_files_tasks = len(tasks)
+
+            for page_num, page in enumerate(pages):
+                print(f"Processing page: {page_num + 1}")
+
+                text_tasks[page_num] = await submit_task_async(
+                    in_flight,
+                    run_checkpointed_async(
+                        checkpoint_dir
+                        and os.path.join(checkpoint_dir, f"text_{page_num}"),
+                        get_chunk_text_metadata_from_text_async,
+                        page["text"],
+                        chunked_text_dict=page["chunked_text_dict"],
+                    ),
+                )
+                tasks.append(text_tasks[page_num])
+
+                image_tasks[page_num] = {}
+
+                for image_no, image in enumerate(page["images"]):
+                    image_number = int(image_no + 1)
+                    image_name = image["image_name"]
+
+                    print(
+                        f"Extracting image from page: {page_num + 1}, saved as: {image_name}"
+                    )
+
+                    first_copy_task = (
+                        image_deduplicator.find(
+                            file_name, image["xref"], image["image_bytes"]
+                        )
+                        if image_deduplicator is not None
+                        else None
+                    )
+                    if first_copy_task is not None:
+                        image_tasks[page_num][image_number] = asyncio.ensure_future(
+                            reuse_image_metadata_async(
+                                first_copy_task, image_number, image_name
+                            )
+                        )
+                        tasks.append(image_tasks[page_num][image_number])
+                        continue
+
+                    image_tasks[page_num][image_number] = await submit_task_async(
+                        in_flight,
+                        run_checkpointed_async(
+                            checkpoint_dir
+                            and os.path.join(
+                                checkpoint_dir, f"image_{page_num}_{image_number}"
+                            ),
+                            get_image_metadata_async,
+                            generative_multimodal_model,
+                            Image.from_bytes(image["image_bytes"]),
+                            image_name,
+                            image_number,
+                            image_description_prompt,
+                            embedding_size=embedding_size,
+                            generation_config=generation_config,
+                            safety_settings=safety_settings,
+                        ),
+                    )
+                    tasks.append(image_tasks[page_num][image_number])
+
+                    if image_deduplicator is not None:
+                        image_deduplicator.add(
+                            file_name,
+                            image["xref"],
+                            image["image_bytes"],
+                            image_tasks[page_num][image_number],
+                        )
+
+            if document_writer is not None:
+                # Write the previous files while the pages of this one are processed
+                await asyncio.gather(*tasks[:previous_files_tasks])
+                write_document_metadata_files(
+                    document_writer,
+                    file_metadata,
+                    persisted_text_metadata,
+                    persisted_image_metadata,
+                    stop_at=text_tasks,
+                )
+                del tasks[:previous_files_tasks]
+
+        await asyncio.gather(*tasks)
+
+        if document_writer is not None:
+            write_document_metadata_files(
+                document_writer,
+                file_metadata,
+                persisted_text_metadata,
+                persisted_image_metadata,
+            )
+            document_writer.close()
+    except BaseException:
+        if document_writer is not None:
+            document_writer.discard()
+        raise
+    finally:
+        model_request_semaphore.reset(semaphore_token)
+
+        # Cancel the remaining tasks if a file or a task failed
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    if document_writer is not None:
+        text_metadata_df, image_metadata_df = pd.DataFrame(), pd.DataFrame()
+    else:
+        text_metadata_df, image_metadata_df = get_document_metadata_dfs(
+            file_metadata, persisted_text_metadata, persisted_image_metadata
+        )
+
+    return finish_document_metadata(
+        text_metadata_df,
+        image_metadata_df,
+        metadata_path,
+        new_manifest,
+        metadata_saved=document_writer is not None,
+    )
+
+
+# Helper Functions
+
+
+def get_user_query_text_embeddings(user_query: str) -> np.ndarray:
+    """
+    Extracts text embeddings for the user query using a text embedding model.
+
+    Args:
+        user_query: The user query text.
+        embedding_size: The desired embedding size.
+
+    Returns:
+        A NumPy array representing the user query text embedding.
+    """
+
+    return get_text_embedding_from_text_embedding_model(user_query)
+
+
+def get_user_query_image_embeddings(
+    image_query_path: str, embedding_size: int
+) -> np.ndarray:
+    """
+    Extracts image embeddings for the user query image using a multimodal embedding model.
+
+    Args:
+        image_query_path: The path to the user query image.
+        embedding_size: The desired embedding size.
+
+    Returns:
+        A NumPy array representing the user query image embedding.
+    """
+
+    return get_image_embedding_from_multimodal_embedding_model(
+        image_uri=image_query_path, embedding_size=embedding_size
+    )
+
+
+def get_cosine_score(
+    dataframe: pd.DataFrame, column_name: str, input_text_embed: np.ndarray
+) -> float:
+    """
+    Calculates the cosine similarity between the user query embedding and the dataframe embedding for a specific column.
+
+    Args:
+        dataframe: The pandas DataFrame containing the data to compare against.
+        column_name: The name of the column containing the embeddings to compare with.
+        input_text_embed: The NumPy array representing the user query embedding.
+
+    Returns:
+        The cosine similarity score (rounded to two decimal places) between the user query embedding and the dataframe embedding.
+    """
+
+    return round(np.dot(dataframe[column_name], input_text_embed), 2)
+
+
+def get_top_n_indices(
+    scores: np.ndarray, top_n: int, max_score: Optional[float] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Selects the positions and values of the top N scores using `np.argpartition`.
+
+    Ties are broken by position, so the result matches `pd.Series.nlargest(top_n)`
+    on the same scores.
+
+    Args:
+        scores: A 1-D NumPy array of scores.
+        top_n: The number of scores to select.
+        max_score: If set, only scores strictly lower than this value are considered.
+
+    Returns:
+        A tuple of two NumPy arrays: the selected positions and their scores, sorted by descending score.
+    """
+
+    positions = np.arange(len(scores))
+
+    if max_score is not None:
+        keep = scores < max_score
+        scores, positions = scores[keep], positions[keep]
+
+    top_n = max(0, min(top_n, len(scores)))
+    if top_n == 0:
+        return positions[:0], scores[:0]
+
+    if top_n < len(scores):
+        # Keep every score tied with the N-th largest one so ties can be broken by position
+        threshold = scores[np.argpartition(-scores, top_n - 1)[:top_n]].min()
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(len(scores))
+
+    # Sort by descending score, then by ascending position
+    selected = candidates[np.lexsort((candidates, -scores[candidates]))[:top_n]]
+
+    return positions[selected], scores[selected]
+
+
+class SearchIndex(Protocol):
+    """
+    Interface of the embedding search indexes registered for a DataFrame column:
+    `EmbeddingSearchIndex`, `IVFFlatIndex` and `QuantizedEmbeddingIndex`.
+    """
+
+    embeddings: np.ndarray
+
+    def __len__(self) -> int:
+        ...
+
+    def search(
+        self,
+        query_embedding: Union[list, np.ndarray],
+        top_n: int,
+        max_score: Optional[float] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        ...
+
+
+class EmbeddingSearchIndex:
+    """
+    Exact cosine-similarity search over an embedding column of a metadata DataFrame.
+
+    The embedding column (a column of Python lists) is stacked once into a contiguous
+    matrix, so every query is scored with a single matrix-vector product instead of a
+    row-wise `DataFrame.apply(get_cosine_score, axis=1)`. Like `get_cosine_score`, scores
+    are computed in float64 and rounded to two decimal places, so rankings only differ
+    from it for scores within floating-point error of a rounding boundary.
+
+    Float32 matrices (e.g. memory-mapped by `load_metadata_df`) are kept in float32 and
+    converted to float64 block by block while scoring.
+    """
+
+    # Rows of a float32 matrix converted to float64 at once while scoring
+    block_rows = 65536
+
+    def __init__(self, embeddings: np.ndarray):
+        """
+        Args:
+            embeddings: A 2-D array with one embedding per row.
+        """
+        embeddings = np.asarray(embeddings)
+        self.embeddings = np.ascontiguousarray(
+            embeddings,
+            dtype=np.float32 if embeddings.dtype == np.float32 else np.float64,
+        )
+
+    @classmethod
+    def from_dataframe(
+        cls, dataframe: pd.DataFrame, column_name: str
+    ) -> "EmbeddingSearchIndex":
+        """
+        Stacks the embeddings stored in a DataFrame column into a search index.
+
+        Args:
+            dataframe: The pandas DataFrame containing the embeddings.
+            column_name: The name of the column containing the embeddings.
+
+        Returns:
+            An EmbeddingSearchIndex with one row per DataFrame row, in positional order.
+        """
+
+        if len(dataframe) == 0:
+            return cls(np.empty((0, 0), dtype=np.float32))
+
+        return cls(np.vstack(dataframe[column_name].to_numpy()))
+
+    def __len__(self) -> int:
+        return self.embeddings.shape[0]
+
+    def get_scores(self, query_embedding: Union[list, np.ndarray]) -> np.ndarray:
+        """
+        Calculates the cosine similarity between a query embedding and every row of the index.
+
+        Args:
+            query_embedding: The query embedding.
+
+        Returns:
+            A NumPy array of scores (rounded to two decimal places), one per row.
+        """
+
+        if len(self) == 0:
+            return np.empty(0, dtype=np.float64)
+
+        query = np.asarray(query_embedding, dtype=np.float64)
+        return np.round(self.get_score_matrix(query[None, :])[0], 2)
+
+    def get_score_matrix(self, query_embeddings: np.ndarray) -> np.ndarray:
+        """
+        Calculates the unrounded float64 scores of several query embeddings.
+
+        Args:
+            query_embeddings: A 2-D float64 array with one query embedding per row.
+
+        Returns:
+            A (queries, rows) float64 NumPy array of scores.
+        """
+
+        if self.embeddings.dtype == np.float64:
+            return query_embeddings @ self.embeddings.T
+
+        scores: np.ndarray = np.empty(
+            (len(query_embeddings), len(self)), dtype=np.float64
+        )
+        for start in range(0, len(self), self.block_rows):
+            end = start + self.block_rows
+            scores[:, start:end] = (
+                query_embeddings @ self.embeddings[start:end].astype(np.float64).T
+            )
+        return scores
+
+    def search(
+        self,
+        query_embedding: Union[list, np.ndarray],
+        top_n: int,
+        max_score: Optional[float] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the top N rows most similar to a query embedding.
+
+        Args:
+            query_embedding: The query embedding.
+            top_n: The number of rows to return.
+            max_score: If set, only rows scoring strictly lower than this value are returned.
+
+        Returns:
+            A tuple of two NumPy arrays: the row positions and their cosine scores, sorted by descending score.
+        """
+
+        return get_top_n_indices(self.get_scores(query_embedding), top_n, max_score)
+
+    def search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        top_n: int,
+        max_score: Optional[float] = None,
+        max_block_size: int = 2**25,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Finds the top N rows most similar to each of several query embeddings.
+
+        The queries are scored with matrix-matrix products, in blocks of queries whose
+        score matrix has at most `max_block_size` elements.
+
+        Args:
+            query_embeddings: A 2-D array with one query embedding per row.
+            top_n: The number of rows to return per query.
+            max_score: If set, only rows scoring strictly lower than this value are returned.
+            max_block_size: The maximum number of scores computed at once.
+
+        Returns:
+            One tuple of row positions and cosine scores per query, like `search`.
+        """
+
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float64)
+        if len(self) == 0:
+            return [
+                get_top_n_indices(np.empty(0), top_n, max_score)
+                for _ in range(len(query_embeddings))
+            ]
+
+        results: List[Tuple[np.ndarray, np.ndarray]] = []
+        block_size = max(1, max_block_size // len(self))
+        for start in range(0, len(query_embeddings), block_size):
+            end = start + block_size
+            scores = np.round(self.get_score_matrix(query_embeddings[start:end]), 2)
+            results.extend(
+                get_top_n_indices(query_scores, top_n, max_score)
+                for query_scores in scores
+            )
+
+        return results
+
+
+# Indexes built for a DataFrame (`get_embedding_search_index`, `get_lexical_search_index`...),
+# keyed by DataFrame id and then by (kind of index, column name), with the sampled cells of
+# the columns they were built from
+_embedding_search_indexes: Dict[
+    int,
+    Tuple[weakref.ref, Dict[Tuple[str, str], Any], Dict[Tuple[str, str], List[Any]]],
+] = {}
+
+# Number of cells of each indexed column checked before reusing a cached index
+SEARCH_INDEX_SAMPLED_CELLS = 64
+
+
+def get_embedding_search_index(
+    dataframe: pd.DataFrame, column_name: str
+) -> SearchIndex:
+    """
+    Returns the search index for an embedding column, building it on first use.
+
+    The index is cached for as long as the DataFrame is alive. It is rebuilt when the
+    number of rows changes or the column is replaced (assigned, sorted, filtered...),
+    which is detected by checking that `SEARCH_INDEX_SAMPLED_CELLS` cells of the column
+    are still the objects the index was built from. Only editing individual cells in
+    place can go unnoticed: call `clear_embedding_search_indexes` (or
+    `set_embedding_search_index`) after doing so.
+
+    Args:
+        dataframe: The pandas DataFrame containing the embeddings.
+        column_name: The name of the column containing the embeddings.
+
+    Returns:
+        The search index registered for the column, or an EmbeddingSearchIndex.
+    """
+
+    search_index = _get_cached_index(
+        dataframe, ("embedding", column_name), [column_name]
+    )
+    if search_index is None:
+        search_index = EmbeddingSearchIndex.from_dataframe(dataframe, column_name)
+        _set_cached_index(
+            dataframe, ("embedding", column_name), [column_name], search_index
+        )
+
+    return search_index
+
+
+def set_embedding_search_index(
+    dataframe: pd.DataFrame,
+    column_name: str,
+    search_index: SearchIndex,
+) -> None:
+    """
+    Registers a prebuilt search index for an embedding column, so that
+    `get_embedding_search_index` doesn't stack the column again.
+
+    Args:
+        dataframe: The pandas DataFrame containing the embeddings.
+        column_name: The name of the column containing the embeddings.
+        search_index: The search index, with one row per DataFrame row.
+    """
+
+    _set_cached_index(
+        dataframe, ("embedding", column_name), [column_name], search_index
+    )
+
+
+def _get_cached_index(
+    dataframe: pd.DataFrame, key: Tuple[str, str], column_names: List[str]
+) -> Optional[Any]:
+    # The cached index, unless the number of rows changed or one of the columns
+    # was replaced since it was built
+    index = _get_cached_search_indexes(dataframe).get(key)
+    indexed_cells = _get_cached_search_index_cells(dataframe).get(key)
+    if index is None or indexed_cells is None or len(index) != len(dataframe):
+        return None
+
+    cells = _get_sampled_cells(dataframe, column_names)
+    if len(cells) != len(indexed_cells) or not all(
+        # Embeddings are compared by identity, and texts and numbers by value as
+        # pandas may box them again on every access
+        cell is indexed_cell or (np.isscalar(cell) and cell == indexed_cell)
+        for cell, indexed_cell in zip(cells, indexed_cells)
+    ):
+        return None
+
+    return index
+
+
+def _set_cached_index(
+    dataframe: pd.DataFrame, key: Tuple[str, str], column_names: List[str], index: Any
+) -> None:
+    _get_cached_search_indexes(dataframe)[key] = index
+    _get_cached_search_index_cells(dataframe)[key] = _get_sampled_cells(
+        dataframe, column_names
+    )
+
+
+def _get_sampled_cells(dataframe: pd.DataFrame, column_names: List[str]) -> List[Any]:
+    # Evenly spaced cells of each column, including the first and last ones
+    positions = np.linspace(
+        0,
+        len(dataframe) - 1,
+        min(len(dataframe), SEARCH_INDEX_SAMPLED_CELLS),
+        dtype=int,
+    )
+    return [
+        cell
+        for column_name in column_names
+        for cell in dataframe[column_name].iloc[positions].tolist()
+    ]
+
+
+def _get_search_index_cache_entry(
+    dataframe: pd.DataFrame,
+) -> Tuple[weakref.ref, Dict[Tuple[str, str], Any], Dict[Tuple[str, str], List[Any]]]:
+    key = id(dataframe)
+    entry = _embedding_search_indexes.get(key)
+
+    if entry is None or entry[0]() is not dataframe:
+        entry = (
+            weakref.ref(
+                dataframe, lambda _, key=key: _embedding_search_indexes.pop(key, None)
+            ),
+            {},
+            {},
+        )
+        _embedding_search_indexes[key] = entry
+
+    return entry
+
+
+def _get_cached_search_indexes(
+    dataframe: pd.DataFrame,
+) -> Dict[Tuple[str, str], Any]:
+    return _get_search_index_cache_entry(dataframe)[1]
+
+
+def _get_cached_search_index_cells(
+    dataframe: pd.DataFrame,
+) -> Dict[Tuple[str, str], List[Any]]:
+    return _get_search_index_cache_entry(dataframe)[2]
+
+
+def clear_embedding_search_indexes() -> None:
+    """
+    Drops every search index cached by `get_embedding_search_index`.
+    """
+
+    _embedding_search_indexes.clear()
+
+
+def search_embeddings_batch(
+    search_index: Any,
+    query_embeddings: np.ndarray,
+    top_n: int,
+    max_score: Optional[float] = None,
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Searches a search index for several query embeddings at once, with the index's
+    `search_batch` method when it has one (see `EmbeddingSearchIndex.search_batch`),
+    and one `search` per query otherwise.
+
+    Args:
+        search_index: The search index.
+        query_embeddings: A 2-D array with one query embedding per row.
+        top_n: The number of rows to return per query.
+        max_score: If set, only rows scoring strictly lower than this value are returned.
+
+    Returns:
+        One tuple of row positions and scores per query.
+    """
+
+    if hasattr(search_index, "search_batch") and len(query_embeddings) > 1:
+        return search_index.search_batch(query_embeddings, top_n, max_score)
+
+    return [
+        search_index.search(query_embedding, top_n, max_score)
+        for query_embedding in query_embeddings
+    ]
+
+
+class PageTextIndex:
+    """
+    Looks up the text of a page by (file_name, page_num) in a text metadata DataFrame
+    (or a pages DataFrame), with a dictionary instead of boolean masks over every row.
+    """
+
+    def __init__(self, text_metadata_df: pd.DataFrame):
+        """
+        Args:
+            text_metadata_df: A DataFrame with "file_name", "page_num" and "text" columns.
+        """
+
+        self.size = len(text_metadata_df)
+
+        if self.size == 0:
+            self.empty = np.unique(np.empty(0, dtype=object))
+            self.page_texts: Dict[Tuple[str, int], np.ndarray] = {}
+            return
+
+        self.empty = np.unique(text_metadata_df["text"].to_numpy()[:0])
+        self.page_texts = {
+            key: np.unique(texts.to_numpy())
+            for key, texts in text_metadata_df.groupby(PAGE_KEY_COLUMNS, sort=False)[
+                "text"
+            ]
+        }
+
+    def __len__(self) -> int:
+        return self.size
+
+    def get(self, file_name: str, page_num: int) -> np.ndarray:
+        """
+        Args:
+            file_name: The file name.
+            page_num: The page number.
+
+        Returns:
+            The distinct texts of the page (normally one), as a NumPy array.
+        """
+
+        return self.page_texts.get((file_name, page_num), self.empty)
+
+
+def get_page_text_index(text_metadata_df: pd.DataFrame) -> PageTextIndex:
+    """
+    Returns the page text index of a DataFrame, building it on first use.
+    Like the search indexes, it is cached for as long as the DataFrame is alive
+    and rebuilt when the number of rows changes or one of its columns is replaced.
+
+    Args:
+        text_metadata_df: A DataFrame with "file_name", "page_num" and "text" columns.
+
+    Returns:
+        The PageTextIndex.
+    """
+
+    columns = PAGE_KEY_COLUMNS + ["text"]
+    page_text_index = _get_cached_index(
+        text_metadata_df, ("page_text", "text"), columns
+    )
+    if page_text_index is None:
+        page_text_index = PageTextIndex(text_metadata_df)
+        _set_cached_index(
+            text_metadata_df, ("page_text", "text"), columns, page_text_index
+        )
+
+    return page_text_index
+
+
+class BM25Index:
+    """
+    Inverted index over a text column with BM25 scoring, for lexical search without
+    calling the embedding model.
+
+    Rows can be appended with `add` (e.g. file by file during ingestion). New postings are
+    buffered and merged into the per-term arrays on the next search.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            k1: The term frequency saturation parameter.
+            b: The document length normalization parameter.
+        """
+
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths: np.ndarray = np.empty(0, dtype=np.int32)
+        # Row positions and term frequencies of each term, sorted by position
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.pending_postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self.pending_doc_lengths: List[int] = []
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        """
+        Splits a text into lowercase word tokens.
+        """
+
+        return re.findall(r"\w+", text.lower())
+
+    @classmethod
+    def from_dataframe(
+        cls, dataframe: pd.DataFrame, column_name: str = "chunk_text"
+    ) -> "BM25Index":
+        """
+        Indexes a text column of a DataFrame.
+
+        Args:
+            dataframe: The pandas DataFrame containing the texts.
+            column_name: The name of the column containing the texts.
+
+        Returns:
+            A BM25Index with one document per DataFrame row, in positional order.
+        """
+
+        index = cls()
+        if len(dataframe):
+            index.add(dataframe[column_name])
+        return index
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths) + len(self.pending_doc_lengths)
+
+    def add(self, texts: Iterable[str]) -> None:
+        """
+        Appends documents to the index.
+
+        Args:
+            texts: The texts of the new rows, in order.
+        """
+
+        position = len(self)
+        for text in texts:
+            tokens = self.tokenize(text or "")
+            for term, count in Counter(tokens).items():
+                positions, counts = self.pending_postings.setdefault(term, ([], []))
+                positions.append(position)
+                counts.append(count)
+            self.pending_doc_lengths.append(len(tokens))
+            position += 1
+
+    def _merge_pending(self) -> None:
+        if not self.pending_doc_lengths:
+            return
+
+        for term, (positions, counts) in self.pending_postings.items():
+            new_postings = (
+                np.asarray(positions, dtype=np.int64),
+                np.asarray(counts, dtype=np.int32),
+            )
+            if term in self.postings:
+                new_postings = (
+                    np.concatenate([self.postings[term][0], new_postings[0]]),
+                    np.concatenate([self.postings[term][1], new_postings[1]]),
+                )
+            self.postings[term] = new_postings
+
+        self.doc_lengths = np.concatenate(
+            [self.doc_lengths, np.asarray(self.pending_doc_lengths, dtype=np.int32)]
+        )
+        self.pending_postings = {}
+        self.pending_doc_lengths = []
+
+    def get_scores(self, query: str) -> np.ndarray:
+        """
+        Calculates the BM25 score of every row for a query.
+
+        Args:
+            query: The query text.
+
+        Returns:
+            A NumPy array of scores, one per row (0 for rows sharing no term with the query).
+        """
+
+        self._merge_pending()
+        scores: np.ndarray = np.zeros(len(self.doc_lengths), dtype=np.float64)
+        if len(self.doc_lengths) == 0:
+            return scores
+
+        average_length = max(float(self.doc_lengths.mean()), 1.0)
+        for term in set(self.tokenize(query)):
+            if term not in self.postings:
+                continue
+
+            positions, counts = self.postings[term]
+            idf = np.log(
+                1
+                + (len(self.doc_lengths) - len(positions) + 0.5)
+                / (len(positions) + 0.5)
+            )
+            normalization = self.k1 * (
+                1 - self.b + self.b * self.doc_lengths[positions] / average_length
+            )
+            scores[positions] += idf * counts * (self.k1 + 1) / (counts + normalization)
+
+        return scores
+
+    def search(
+        self, query: str, top_n: int, max_score: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the top N rows matching a query. Rows sharing no term with the query are never returned.
+
+        Args:
+            query: The query text.
+            top_n: The number of rows to return.
+            max_score: If set, only rows scoring strictly lower than this value are returned.
+
+        Returns:
+            A tuple of two NumPy arrays: the row positions and their BM25 scores, sorted by descending score.
+        """
+
+        scores = self.get_scores(query)
+        matching_positions = np.flatnonzero(scores > 0)
+        positions, top_scores = get_top_n_indices(
+            scores[matching_positions], top_n, max_score
+        )
+        return matching_positions[positions], top_scores
+
+    def save(self, path: str) -> None:
+        """
+        Saves the index to a `.npz` file.
+
+        Args:
+            path: The path of the file.
+        """
+
+        self._merge_pending()
+        terms = list(self.postings)
+        with open(path + ".tmp", "wb") as index_file:
+            np.savez(
+                index_file,
+                terms=np.array(terms, dtype=str),
+                posting_sizes=np.array(
+                    [len(self.postings[term][0]) for term in terms], dtype=np.int64
+                ),
+                positions=np.concatenate(
+                    [self.postings[term][0] for term in terms] or [np.empty(0)]
+                ).astype(np.int64),
+                counts=np.concatenate(
+                    [self.postings[term][1] for term in terms] or [np.empty(0)]
+                ).astype(np.int32),
+                doc_lengths=self.doc_lengths,
+                parameters=np.array([self.k1, self.b]),
+            )
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """
+        Loads an index saved with `save`.
+
+        Args:
+            path: The path of the file.
+
+        Returns:
+            The BM25Index.
+        """
+
+        with np.load(path) as data:
+            k1, b = data["parameters"].tolist()
+            index = cls(k1, b)
+            index.doc_lengths = data["doc_lengths"]
+            boundaries = np.cumsum(data["posting_sizes"])[:-1]
+            index.postings = dict(
+                zip(
+                    data["terms"].tolist(),
+                    zip(
+                        np.split(data["positions"], boundaries),
+                        np.split(data["counts"], boundaries),
+                    ),
+                )
+            )
+        return index
+
+
+def get_lexical_search_index(
+    dataframe: pd.DataFrame, column_name: str = "chunk_text"
+) -> BM25Index:
+    """
+    Returns the BM25 index of a text column, building it on first use.
+    Like the search indexes, it is cached for as long as the DataFrame is alive
+    and rebuilt when the number of rows changes or the column is replaced.
+
+    Args:
+        dataframe: The pandas DataFrame containing the texts.
+        column_name: The name of the column containing the texts.
+
+    Returns:
+        The BM25Index.
+    """
+
+    lexical_index = _get_cached_index(
+        dataframe, ("lexical", column_name), [column_name]
+    )
+    if lexical_index is None:
+        lexical_index = BM25Index.from_dataframe(dataframe, column_name)
+        _set_cached_index(
+            dataframe, ("lexical", column_name), [column_name], lexical_index
+        )
+
+    return lexical_index
+
+
+def reciprocal_rank_fusion(
+    rankings: List[np.ndarray], top_n: int, k: int = 60
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fuses several rankings of rows with reciprocal rank fusion: a row scores
+    `sum(1 / (k + rank))` over the rankings it appears in (ranks starting at 1).
+
+    Args:
+        rankings: The row positions of each ranking, best first.
+        top_n: The number of rows to return.
+        k: The RRF constant, which dampens the weight of the top ranks.
+
+    Returns:
+        A tuple of two NumPy arrays: the row positions and their fused scores, sorted by descending score.
+    """
+
+    fused_scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking.tolist(), start=1):
+            fused_scores[position] = fused_scores.get(position, 0.0) + 1 / (k + rank)
+
+    positions = np.array(sorted(fused_scores), dtype=np.int64)
+    scores = np.array([fused_scores[position] for position in positions.tolist()])
+    selected, top_scores = get_top_n_indices(scores, top_n)
+
+    return positions[selected], top_scores
+
+
+class IVFFlatIndex:
+    """
+    Approximate cosine-similarity search with an inverted file index (IVF-flat).
+
+    The rows are clustered around `n_lists` centroids trained with spherical k-means.
+    A query is only scored against the rows of the `n_probe` clusters whose centroids are
+    the most similar to it: a larger `n_probe` gives a better recall and a higher latency.
+    Scores are exact for the scanned rows, and rounded and ranked like `EmbeddingSearchIndex`.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        centroids: np.ndarray,
+        lists: List[np.ndarray],
+        n_probe: int = 8,
+    ):
+        """
+        Args:
+            embeddings: A 2-D array with one embedding per row.
+            centroids: A 2-D array with one centroid per list.
+            lists: The row positions assigned to each list.
+            n_probe: The default number of lists scanned per query.
+        """
+
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.lists = lists
+        self.n_probe = n_probe
+
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        n_lists: Optional[int] = None,
+        n_probe: int = 8,
+        n_iter: int = 10,
+        sample_size_per_list: int = 256,
+        seed: int = 0,
+    ) -> "IVFFlatIndex":
+        """
+        Trains the centroids on a sample of the embeddings and assigns every row to a list.
+
+        Args:
+            embeddings: A 2-D array with one embedding per row.
+            n_lists: The number of lists. Defaults to the square root of the number of rows.
+            n_probe: The default number of lists scanned per query.
+            n_iter: The number of k-means iterations.
+            sample_size_per_list: The number of rows sampled per list to train the centroids.
+            seed: The random seed of the sampling.
+
+        Returns:
+            An IVFFlatIndex over `embeddings`.
+        """
+
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        n_rows = embeddings.shape[0]
+        if n_rows == 0:
+            raise ValueError("Cannot build an IVF index without embeddings.")
+
+        n_lists = max(1, min(n_lists or int(np.sqrt(n_rows)), n_rows))
+        rng = np.random.default_rng(seed)
+
+        sample = embeddings[
+            np.sort(
+                rng.choice(
+                    n_rows, min(n_rows, n_lists * sample_size_per_list), replace=False
+                )
+            )
+        ]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+        for _ in range(n_iter):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            # Sum the rows of each list: sort them by list, then reduce each run
+            order = np.argsort(assignments, kind="stable")
+            counts = np.bincount(assignments, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            sums[counts > 0] = np.add.reduceat(
+                sample[order], (np.cumsum(counts) - counts)[counts > 0]
+            )
+            norms = np.linalg.norm(sums, axis=1)
+            # Lists without rows keep their previous centroid
+            non_empty = norms > 0
+            centroids[non_empty] = sums[non_empty] / norms[non_empty, None]
+
+        index = cls(embeddings[:0], centroids, [], n_probe)
+        index.lists = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        index.add(embeddings)
+        return index
+
+    def __len__(self) -> int:
+        return self.embeddings.shape[0]
+
+    def add(self, embeddings: np.ndarray) -> None:
+        """
+        Appends rows to the index, assigning each one to the list of its most similar centroid.
+        The centroids are not retrained.
+
+        Args:
+            embeddings: A 2-D array with one embedding per new row.
+        """
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        first_position = len(self)
+
+        # Assign in blocks to bound the size of the similarity matrix
+        assignments = np.concatenate(
+            [
+                np.argmax(block @ self.centroids.T, axis=1)
+                for block in np.array_split(
+                    embeddings, max(1, len(embeddings) // 65536 + 1)
+                )
+            ]
+        )
+        order = np.argsort(assignments, kind="stable")
+        boundaries = np.asarray(
+            np.searchsorted(assignments[order], np.arange(len(self.lists) + 1))
+        )
+        for list_number in range(len(self.lists)):
+            start, end = boundaries[list_number], boundaries[list_number + 1]
+            if end > start:
+                self.lists[list_number] = np.concatenate(
+                    [self.lists[list_number], first_position + order[start:end]]
+                )
+
+        if first_position == 0:
+            self.embeddings = np.ascontiguousarray(embeddings)
+        else:
+            self.embeddings = np.vstack([self.embeddings, embeddings])
+
+    def search(
+        self,
+        query_embedding: Union[list, np.ndarray],
+        top_n: int,
+        max_score: Optional[float] = None,
+        n_probe: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds (approximately) the top N rows most similar to a query embedding.
+
+        Args:
+            query_embedding: The query embedding.
+            top_n: The number of rows to return.
+            max_score: If set, only rows scoring strictly lower than this value are returned.
+            n_probe: The number of lists to scan. Defaults to the index's `n_probe`.
+
+        Returns:
+            A tuple of two NumPy arrays: the row positions and their cosine scores, sorted by descending score.
+        """
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        n_probe = max(1, min(n_probe or self.n_probe, len(self.lists)))
+
+        probed_lists = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        # Sorted positions keep ties broken by position
+        candidates = np.sort(
+            np.concatenate([self.lists[list_number] for list_number in probed_lists])
+        )
+
+        scores = np.round((self.embeddings[candidates] @ query).astype(np.float64), 2)
+        positions, top_scores = get_top_n_indices(scores, top_n, max_score)
+
+        return candidates[positions], top_scores
+
+    def save(self, path: str) -> None:
+        """
+        Saves the centroids and lists (not the embeddings) to a `.npz` file.
+
+        Args:
+            path: The path of the file.
+        """
+
+        with open(path + ".tmp", "wb") as index_file:
+            np.savez(
+                index_file,
+                centroids=self.centroids,
+                list_sizes=np.array([len(rows) for rows in self.lists]),
+                list_positions=np.concatenate(self.lists),
+                n_probe=self.n_probe,
+                n_rows=len(self),
+            )
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str, embeddings: np.ndarray) -> "IVFFlatIndex":
+        """
+        Loads an index saved with `save`.
+
+        Args:
+            path: The path of the file.
+            embeddings: The embeddings the index was built on (e.g. a memory-mapped matrix).
+
+        Returns:
+            The IVFFlatIndex.
+
+        Raises:
+            ValueError: If the number of embeddings doesn't match the saved index.
+        """
+
+        with np.load(path) as data:
+            if int(data["n_rows"]) != len(embeddings):
+                raise ValueError(
+                    f"The index {path} was built on {int(data['n_rows'])} rows, "
+                    f"got {len(embeddings)} embeddings."
+                )
+            lists = np.split(data["list_positions"], np.cumsum(data["list_sizes"])[:-1])
+            return cls(embeddings, data["centroids"], lists, int(data["n_probe"]))
+
+
+def build_ivf_index(
+    dataframe: pd.DataFrame,
+    column_name: str,
+    n_lists: Optional[int] = None,
+    n_probe: int = 8,
+    path: Optional[str] = None,
+) -> IVFFlatIndex:
+    """
+    Builds an approximate (IVF-flat) search index for an embedding column and registers it,
+    so `get_similar_text_from_query` and `get_similar_image_from_query` use it for this DataFrame.
+
+    Args:
+        dataframe: The pandas DataFrame containing the embeddings.
+        column_name: The name of the column containing the embeddings.
+        n_lists: The number of lists. Defaults to the square root of the number of rows.
+        n_probe: The default number of lists scanned per query.
+        path: Optional directory written by `save_metadata_df`. If set, the index is saved there
+              as `<column_name>.ivf.npz` and `load_metadata_df` loads it with the table.
+
+    Returns:
+        The IVFFlatIndex.
+    """
+
+    search_index = IVFFlatIndex.build(
+        get_embedding_search_index(dataframe, column_name).embeddings,
+        n_lists=n_lists,
+        n_probe=n_probe,
+    )
+    set_embedding_search_index(dataframe, column_name, search_index)
+
+    if path is not None:
+        search_index.save(os.path.join(path, f"{column_name}.ivf.npz"))
+
+    return search_index
+
+
+def evaluate_search_recall(
+    search_index: Any,
+    exact_search_index: EmbeddingSearchIndex,
+    query_embeddings: np.ndarray,
+    top_n: int = 10,
+    **search_kwargs: Any,
+) -> Dict[str, float]:
+    """
+    Benchmarks an approximate search index against exact search.
+
+    Args:
+        search_index: The approximate index (e.g. an IVFFlatIndex).
+        exact_search_index: The exact index over the same embeddings.
+        query_embeddings: A 2-D array with one query embedding per row.
+        top_n: The number of results per query.
+        **search_kwargs: Extra arguments for `search_index.search` (e.g. `n_probe`).
+
+    Returns:
+        A dictionary with the mean recall@top_n and the mean and p99 latencies (in milliseconds)
+        of both indexes.
+    """
+
+    recalls, latencies, exact_latencies = [], [], []
+
+    for query_embedding in query_embeddings:
+        start = time.perf_counter()
+        exact_positions, _ = exact_search_index.search(query_embedding, top_n)
+        exact_latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        positions, _ = search_index.search(query_embedding, top_n, **search_kwargs)
+        latencies.append(time.perf_counter() - start)
+
+        if len(exact_positions):
+            recalls.append(
+                len(np.intersect1d(positions, exact_positions)) / len(exact_positions)
+            )
+
+    return {
+        f"recall@{top_n}": float(np.mean(recalls)) if recalls else 1.0,
+        "latency_ms": float(np.mean(latencies) * 1000),
+        "latency_p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "exact_latency_ms": float(np.mean(exact_latencies) * 1000),
+        "exact_latency_p99_ms": float(np.percentile(exact_latencies, 99) * 1000),
+    }
+
+
+QUANTIZATION_MODES = ("float16", "int8")
+
+
+class QuantizedEmbeddingIndex:
+    """
+    Cosine-similarity search over a compact (float16 or int8) copy of the embeddings.
+
+    Every row is scored against the quantized matrix, then the `top_n * rescore_multiplier`
+    best rows are rescored with the full-precision embeddings. When those are memory-mapped
+    (see `load_metadata_df`), only the quantized matrix needs to be in memory: 2 bytes per
+    value in "float16" mode, 1 byte per value plus one float32 scale per row in "int8" mode.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        mode: str = "int8",
+        rescore_multiplier: int = 4,
+        block_size: int = 16384,
+    ):
+        """
+        Args:
+            embeddings: A 2-D array with one full-precision embedding per row.
+            mode: The quantization mode, "float16" or "int8".
+            rescore_multiplier: The shortlist is `top_n * rescore_multiplier` rows.
+            block_size: The number of rows dequantized at once during the scan.
+        """
+
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(
+                f"Unknown quantization mode {mode!r}, expected one of {QUANTIZATION_MODES}."
+            )
+
+        self.embeddings = embeddings
+        self.mode = mode
+        self.rescore_multiplier = rescore_multiplier
+        self.block_size = block_size
+        self.scales: Optional[np.ndarray] = None
+
+        if mode == "float16":
+            self.quantized = np.asarray(embeddings, dtype=np.float16)
+        else:
+            # Symmetric scalar quantization, with one scale per row
+            self.quantized = np.empty(embeddings.shape, dtype=np.int8)
+            self.scales = np.empty(len(embeddings), dtype=np.float32)
+            for start in range(0, len(embeddings), block_size):
+                end = start + block_size
+                block = np.asarray(embeddings[start:end], dtype=np.float32)
+                scales = np.abs(block).max(axis=1) / 127
+                scales[scales == 0] = 1
+                self.quantized[start:end] = np.round(block / scales[:, None])
+                self.scales[start:end] = scales
+
+    def __len__(self) -> int:
+        return self.quantized.shape[0]
+
+    def get_memory_usage(self) -> int:
+        """
+        Returns:
+            The number of bytes used by the quantized matrix and its scales.
+        """
+
+        return self.quantized.nbytes + (
+            0 if self.scales is None else self.scales.nbytes
+        )
+
+    def get_approximate_scores(
+        self, query_embedding: Union[list, np.ndarray]
+    ) -> np.ndarray:
+        """
+        Calculates the approximate cosine similarity of a query embedding with every row.
+
+        Args:
+            query_embedding: The query embedding.
+
+        Returns:
+            A float32 NumPy array of unrounded scores, one per row.
+        """
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        scores: np.ndarray = np.empty(len(self), dtype=np.float32)
+
+        # Dequantize block by block to bound the size of the temporary float32 matrix
+        for start in range(0, len(self), self.block_size):
+            end = start + self.block_size
+            scores[start:end] = self.quantized[start:end].astype(np.float32) @ query
+
+        if self.scales is not None:
+            scores *= self.scales
+
+        return scores
+
+    def search(
+        self,
+        query_embedding: Union[list, np.ndarray],
+        top_n: int,
+        max_score: Optional[float] = None,
+        rescore_multiplier: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the top N rows most similar to a query embedding.
+
+        Args:
+            query_embedding: The query embedding.
+            top_n: The number of rows to return.
+            max_score: If set, only rows scoring strictly lower than this value are returned.
+            rescore_multiplier: Overrides the index's shortlist size multiplier.
+
+        Returns:
+            A tuple of two NumPy arrays: the row positions and their (exact) cosine scores,
+            sorted by descending score.
+        """
+
+        if len(self) == 0:
+            return get_top_n_indices(np.empty(0), top_n, max_score)
+
+        shortlist_size = top_n * (rescore_multiplier or self.rescore_multiplier)
+        approximate_scores = self.get_approximate_scores(query_embedding)
+        if shortlist_size < len(self):
+            # Sorted positions keep ties broken by position
+            shortlist = np.sort(
+                np.argpartition(-approximate_scores, shortlist_size - 1)[
+                    :shortlist_size
+                ]
+            )
+        else:
+            shortlist = np.arange(len(self))
+
+        exact_scores = np.asarray(self.embeddings[shortlist], dtype=np.float32) @ (
+            np.asarray(query_embedding, dtype=np.float32)
+        )
+        positions, scores = get_top_n_indices(
+            np.round(exact_scores.astype(np.float64), 2), top_n, max_score
+        )
+
+        return shortlist[positions], scores
+
+
+def build_quantized_index(
+    dataframe: pd.DataFrame,
+    column_name: str,
+    mode: str = "int8",
+    rescore_multiplier: int = 4,
+) -> QuantizedEmbeddingIndex:
+    """
+    Builds a quantized search index for an embedding column and registers it, so
+    `get_similar_text_from_query` and `get_similar_image_from_query` use it for this DataFrame.
+
+    Args:
+        dataframe: The pandas DataFrame containing the embeddings.
+        column_name: The name of the column containing the embeddings.
+        mode: The quantization mode, "float16" or "int8".
+        rescore_multiplier: The shortlist is `top_n * rescore_multiplier` rows.
+
+    Returns:
+        The QuantizedEmbeddingIndex.
     """
-    This function takes a PDF path, an image save directory, an image description prompt, an embedding size, and a text embedding text limit as input.
+
+    search_index = QuantizedEmbeddingIndex(
+        get_embedding_search_index(dataframe, column_name).embeddings,
+        mode=mode,
+        rescore_multiplier=rescore_multiplier,
+    )
+    set_embedding_search_index(dataframe, column_name, search_index)
+
+    return search_index
+
+
+def compare_quantization_modes(
+    dataframe: pd.DataFrame,
+    column_name: str,
+    query_embeddings: np.ndarray,
+    top_n: int = 10,
+    rescore_multiplier: int = 4,
+) -> pd.DataFrame:
+    """
+    Reports the memory use, recall@top_n and latency of every quantization mode,
+    compared with exact search over a float32 matrix.
 
     Args:
-        pdf_path: The path to the PDF document.
-        image_save_dir: The directory where extracted images should be saved.
-        image_description_prompt: A prompt to guide Gemini for generating image descriptions.
-        embedding_size: The dimensionality of the embedding vectors.
-        text_emb_text_limit: The maximum number of tokens for text embedding.
+        dataframe: The pandas DataFrame containing the embeddings.
+        column_name: The name of the column containing the embeddings.
+        query_embeddings: A 2-D array with one query embedding per row.
+        top_n: The number of results per query.
+        rescore_multiplier: The shortlist is `top_n * rescore_multiplier` rows.
 
     Returns:
-        A tuple containing two DataFrames:
-            * One DataFrame containing the extracted text metadata for each page of the PDF, including the page text, chunked text dictionaries, and chunk embedding dictionaries.
-            * Another DataFrame containing the extracted image metadata for each image in the PDF, including the image path, image description, image embeddings (with and without context), and image description text embedding.
+        A DataFrame with one row per mode ("float32" being the exact search).
     """
 
-    text_metadata_df_final, image_metadata_df_final = pd.DataFrame(), pd.DataFrame()
-
-    for pdf_path in glob.glob(pdf_folder_path + "/*.pdf"):
-        print(
-            "\n\n",
-            "Processing the file: ---------------------------------",
-            pdf_path,
-            "\n\n",
+    exact_search_index = EmbeddingSearchIndex.from_dataframe(dataframe, column_name)
+    results = [
+        {
+            "mode": "float32",
+            "memory_bytes": exact_search_index.embeddings.nbytes,
+            **evaluate_search_recall(
+                exact_search_index, exact_search_index, query_embeddings, top_n
+            ),
+        }
+    ]
+
+    for mode in QUANTIZATION_MODES:
+        search_index = QuantizedEmbeddingIndex(
+            exact_search_index.embeddings, mode, rescore_multiplier
+        )
+        results.append(
+            {
+                "mode": mode,
+                "memory_bytes": search_index.get_memory_usage(),
+                **evaluate_search_recall(
+                    search_index, exact_search_index, query_embeddings, top_n
+                ),
+            }
         )
 
-        # Open the PDF file
-        doc: fitz.Document = fitz.open(pdf_path)
+    return pd.DataFrame(results)
 
-        file_name = pdf_path.split("/")[-1]
 
-        text_metadata: Dict[Union[int, str], Dict] = {}
-        image_metadata: Dict[Union[int, str], Dict] = {}
+# Functions for saving and loading metadata DataFrames
 
-        for page_num, page in enumerate(doc):
-            print(f"Processing page: {page_num + 1}")
 
-            text = page.get_text()
-            (
-                text,
-                page_text_embeddings_dict,
-                chunked_text_dict,
-                chunk_embeddings_dict,
-            ) = get_chunk_text_metadata(page, embedding_size=embedding_size)
+def save_metadata_df(
+    dataframe: pd.DataFrame,
+    path: str,
+    embedding_columns: Optional[List[str]] = None,
+    dtype: type = np.float32,
+) -> None:
+    """
+    Saves a text or image metadata DataFrame to a directory in a columnar layout.
 
-            text_metadata[page_num] = {
-                "text": text,
-                "page_text_embeddings": page_text_embeddings_dict,
-                "chunked_text_dict": chunked_text_dict,
-                "chunk_embeddings_dict": chunk_embeddings_dict,
-            }
+    The non-embedding columns are written to `metadata.parquet` (requires `pyarrow`
+    or `fastparquet`) and each embedding column to a contiguous `<column>.npy` matrix,
+    which `load_metadata_df` can memory-map.
 
-            images = page.get_images()
-            image_metadata[page_num] = {}
+    Args:
+        dataframe: The text or image metadata DataFrame returned by `get_document_metadata`.
+        path: The directory to write to. It is created if it doesn't exist.
+        embedding_columns: The embedding columns. Defaults to every column whose name contains "embedding".
+        dtype: The dtype of the saved embedding matrices (defaults to float32).
+    """
 
-            for image_no, image in enumerate(images):
-                image_number = int(image_no + 1)
-                image_metadata[page_num][image_number] = {}
+    if embedding_columns is None:
+        embedding_columns = [
+            column for column in dataframe.columns if "embedding" in column
+        ]
 
-                image_for_gemini, image_name = get_image_for_gemini(
-                    doc, image, image_no, image_save_dir, file_name, page_num
-                )
+    os.makedirs(path, exist_ok=True)
 
-                print(
-                    f"Extracting image from page: {page_num + 1}, saved as: {image_name}"
-                )
+    # Every file is written to a temporary file and then renamed: processes that
+    # memory-mapped the previous version keep reading it instead of crashing.
+    metadata_path = os.path.join(path, "metadata.parquet")
+    dataframe.drop(columns=embedding_columns).to_parquet(
+        metadata_path + ".tmp", index=False
+    )
+    os.replace(metadata_path + ".tmp", metadata_path)
 
-                response = get_gemini_response(
-                    generative_multimodal_model,
-                    model_input=[image_description_prompt, image_for_gemini],
-                    generation_config=generation_config,
-                    safety_settings=safety_settings,
-                    stream=True,
-                )
+    for column in embedding_columns:
+        if len(dataframe) == 0:
+            matrix: np.ndarray = np.empty((0, 0), dtype=dtype)
+        else:
+            matrix = np.vstack(dataframe[column].to_numpy()).astype(dtype, copy=False)
+
+        matrix_path = os.path.join(path, f"{column}.npy")
+        with open(matrix_path + ".tmp", "wb") as matrix_file:
+            np.save(matrix_file, np.ascontiguousarray(matrix))
+        os.replace(matrix_path + ".tmp", matrix_path)
+
+    columns_path = os.path.join(path, "metadata.json")
+    with open(columns_path + ".tmp", "w") as columns_file:
+        json.dump(
+            {
+                "columns": dataframe.columns.tolist(),
+                "embedding_columns": embedding_columns,
+            },
+            columns_file,
+        )
+    os.replace(columns_path + ".tmp", columns_path)
 
-                image_embedding = get_image_embedding_from_multimodal_embedding_model(
-                    image_uri=image_name,
-                    embedding_size=embedding_size,
-                )
 
-                image_description_text_embedding = (
-                    get_text_embedding_from_text_embedding_model(text=response)
-                )
+def load_metadata_df(
+    path: str, mmap: bool = True, quantization: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Loads a metadata DataFrame saved with `save_metadata_df`.
 
-                image_metadata[page_num][image_number] = {
-                    "img_num": image_number,
-                    "img_path": image_name,
-                    "img_desc": response,
-                    # "mm_embedding_from_text_desc_and_img": image_embedding_with_description,
-                    "mm_embedding_from_img_only": image_embedding,
-                    "text_embedding_from_image_description": image_description_text_embedding,
-                }
-
-            # Add sleep to reduce issues with Quota error on API
-            if add_sleep_after_page:
-                time.sleep(sleep_time_after_page)
-                print(
-                    "Sleeping for ",
-                    sleep_time_after_page,
-                    """ sec before processing the next page to avoid quota issues. You can disable it: "add_sleep_after_page = False"  """,
-                )
+    With `mmap=True` the embedding matrices are memory-mapped instead of read: loading is
+    nearly instant and processes loading the same files share the pages. Each embedding
+    cell is a read-only NumPy view into its matrix, and the matrices are registered as
+    search indexes, so similarity search doesn't copy them either.
 
-        text_metadata_df = get_text_metadata_df(file_name, text_metadata)
-        image_metadata_df = get_image_metadata_df(file_name, image_metadata)
+    Args:
+        path: The directory written by `save_metadata_df`.
+        mmap: Whether to memory-map the embedding matrices (defaults to True).
+        quantization: If set ("float16" or "int8"), similarity search scans a quantized copy
+                      of each embedding matrix and only reads the full-precision rows of a
+                      shortlist, see `QuantizedEmbeddingIndex`. Otherwise, the approximate
+                      index saved by `build_ivf_index`, if any, is used.
 
-        text_metadata_df_final = pd.concat(
-            [text_metadata_df_final, text_metadata_df], axis=0
-        )
-        image_metadata_df_final = pd.concat(
-            [
-                image_metadata_df_final,
-                image_metadata_df.drop_duplicates(subset=["img_desc"]),
-            ],
-            axis=0,
+    Returns:
+        The metadata DataFrame, with the same columns as the saved one.
+    """
+
+    with open(os.path.join(path, "metadata.json")) as metadata_file:
+        metadata = json.load(metadata_file)
+
+    dataframe = pd.read_parquet(os.path.join(path, "metadata.parquet"))
+
+    matrices: Dict[str, np.ndarray] = {}
+    for column in metadata["embedding_columns"]:
+        # np.asarray() drops the np.memmap subclass, whose row views are slow to create
+        matrix = np.asarray(
+            np.load(
+                os.path.join(path, f"{column}.npy"), mmap_mode="r" if mmap else None
+            )
         )
+        matrices[column] = matrix
+        dataframe[column] = list(matrix) if len(dataframe) else []
 
-        text_metadata_df_final = text_metadata_df_final.reset_index(drop=True)
-        image_metadata_df_final = image_metadata_df_final.reset_index(drop=True)
+    dataframe = dataframe[metadata["columns"]]
 
-    return text_metadata_df_final, image_metadata_df_final
+    for column, matrix in matrices.items():
+        if len(dataframe) == 0:
+            continue
 
+        search_index: SearchIndex = (
+            EmbeddingSearchIndex(matrix)
+            if quantization is None
+            else QuantizedEmbeddingIndex(matrix, quantization)
+        )
 
-# Helper Functions
+        # Use the approximate index saved by `build_ivf_index`, unless it is stale
+        # or a quantization mode was requested
+        ivf_index_path = os.path.join(path, f"{column}.ivf.npz")
+        if os.path.exists(ivf_index_path) and quantization is not None:
+            print(
+                f"Ignoring the approximate search index of '{column}', "
+                f"as quantization='{quantization}' was requested."
+            )
+        elif os.path.exists(ivf_index_path):
+            try:
+                search_index = IVFFlatIndex.load(ivf_index_path, matrix)
+            except ValueError as e:
+                print("Ignoring the approximate search index:", e)
+
+        set_embedding_search_index(dataframe, column, search_index)
+
+    # Text columns with a BM25 index saved by `save_document_metadata`
+    for column in metadata["columns"]:
+        lexical_index_path = os.path.join(path, f"{column}.bm25.npz")
+        if len(dataframe) and os.path.exists(lexical_index_path):
+            lexical_index = BM25Index.load(lexical_index_path)
+            if len(lexical_index) == len(dataframe):
+                _set_cached_index(
+                    dataframe, ("lexical", column), [column], lexical_index
+                )
 
+    return dataframe
 
-def get_user_query_text_embeddings(user_query: str) -> np.ndarray:
+
+def save_document_metadata(
+    text_metadata_df: pd.DataFrame, image_metadata_df: pd.DataFrame, path: str
+) -> None:
     """
-    Extracts text embeddings for the user query using a text embedding model.
+    Saves the DataFrames returned by `get_document_metadata` under `path`.
+    The text metadata is normalized into the `pages` and `chunks` subdirectories
+    (see `get_pages_and_chunks_df`), so each page text and embedding is stored once,
+    and the image metadata is saved in the `image_metadata` subdirectory.
 
     Args:
-        user_query: The user query text.
-        embedding_size: The desired embedding size.
-
-    Returns:
-        A NumPy array representing the user query text embedding.
+        text_metadata_df: The text metadata DataFrame.
+        image_metadata_df: The image metadata DataFrame.
+        path: The directory to write to.
     """
 
-    return get_text_embedding_from_text_embedding_model(user_query)
+    pages_df, chunks_df = get_pages_and_chunks_df(text_metadata_df)
+    save_metadata_df(pages_df, os.path.join(path, "pages"))
+    save_metadata_df(chunks_df, os.path.join(path, "chunks"))
 
+    # Save the BM25 index built during ingestion, if any, for `load_metadata_df`
+    lexical_index = _get_cached_index(
+        text_metadata_df, ("lexical", "chunk_text"), ["chunk_text"]
+    )
+    lexical_index_path = os.path.join(path, "chunks", "chunk_text.bm25.npz")
+    if isinstance(lexical_index, BM25Index):
+        lexical_index.save(lexical_index_path)
+    elif os.path.exists(lexical_index_path):
+        os.remove(lexical_index_path)
+    save_metadata_df(image_metadata_df, os.path.join(path, "image_metadata"))
 
-def get_user_query_image_embeddings(
-    image_query_path: str, embedding_size: int
-) -> np.ndarray:
+    # Drop the denormalized text table of earlier versions
+    shutil.rmtree(os.path.join(path, "text_metadata"), ignore_errors=True)
+
+
+def load_document_metadata(
+    path: str, mmap: bool = True, quantization: Optional[str] = None
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
-    Extracts image embeddings for the user query image using a multimodal embedding model.
+    Loads the DataFrames saved with `save_document_metadata`.
 
     Args:
-        image_query_path: The path to the user query image.
-        embedding_size: The desired embedding size.
+        path: The directory written by `save_document_metadata`.
+        mmap: Whether to memory-map the embedding matrices (defaults to True).
+        quantization: Optional quantization mode of the search indexes, see `load_metadata_df`.
 
     Returns:
-        A NumPy array representing the user query image embedding.
+        A tuple containing the text metadata DataFrame and the image metadata DataFrame.
     """
 
-    return get_image_embedding_from_multimodal_embedding_model(
-        image_uri=image_query_path, embedding_size=embedding_size
+    if os.path.exists(os.path.join(path, "pages")):
+        text_metadata_df = get_text_metadata_df_from_pages(
+            load_metadata_df(
+                os.path.join(path, "pages"), mmap=mmap, quantization=quantization
+            ),
+            load_metadata_df(
+                os.path.join(path, "chunks"), mmap=mmap, quantization=quantization
+            ),
+        )
+    else:
+        text_metadata_df = load_metadata_df(
+            os.path.join(path, "text_metadata"), mmap=mmap, quantization=quantization
+        )
+
+    return (
+        text_metadata_df,
+        load_metadata_df(
+            os.path.join(path, "image_metadata"), mmap=mmap, quantization=quantization
+        ),
     )
 
 
-def get_cosine_score(
-    dataframe: pd.DataFrame, column_name: str, input_text_embed: np.ndarray
-) -> float:
+class MetadataTableWriter:
     """
-    Calculates the cosine similarity between the user query embedding and the dataframe embedding for a specific column.
+    Writes a metadata table in the layout of `save_metadata_df` one DataFrame at a time,
+    so only the current DataFrame is held in memory.
 
-    Args:
-        dataframe: The pandas DataFrame containing the data to compare against.
-        column_name: The name of the column containing the embeddings to compare with.
-        input_text_embed: The NumPy array representing the user query embedding.
+    The non-embedding columns are appended to `metadata.parquet` as row groups
+    (requires `pyarrow`) and the embedding rows to the `<column>.npy` matrices. The files
+    only replace the previous version of the table when the writer is closed.
+    """
 
-    Returns:
-        The cosine similarity score (rounded to two decimal places) between the user query embedding and the dataframe embedding.
+    def __init__(
+        self,
+        path: str,
+        embedding_columns: Optional[List[str]] = None,
+        dtype: type = np.float32,
+    ):
+        """
+        Args:
+            path: The directory to write to. It is created if it doesn't exist.
+            embedding_columns: The embedding columns. Defaults to every column whose name contains "embedding".
+            dtype: The dtype of the saved embedding matrices (defaults to float32).
+        """
+
+        os.makedirs(path, exist_ok=True)
+
+        self.path = path
+        self.embedding_columns = embedding_columns
+        self.dtype = np.dtype(dtype)
+        self.columns: Optional[List[str]] = None
+        self.num_rows = 0
+        self.parquet_writer: Any = None
+        self.matrix_files: Dict[str, Any] = {}
+        self.dimensions: Dict[str, int] = {}
+
+    def append(self, dataframe: pd.DataFrame) -> None:
+        """
+        Appends the rows of a DataFrame to the table.
+
+        Args:
+            dataframe: A DataFrame with the same columns as the previous ones.
+
+        Raises:
+            ValueError: If the columns or the embedding dimensions differ from the previous ones.
+        """
+
+        if len(dataframe) == 0:
+            return
+
+        import pyarrow
+        import pyarrow.parquet
+
+        if self.columns is None:
+            self.columns = dataframe.columns.tolist()
+            if self.embedding_columns is None:
+                self.embedding_columns = [
+                    column for column in self.columns if "embedding" in column
+                ]
+            table = pyarrow.Table.from_pandas(
+                dataframe.drop(columns=self.embedding_columns), preserve_index=False
+            )
+            self.parquet_writer = pyarrow.parquet.ParquetWriter(
+                os.path.join(self.path, "metadata.parquet.tmp"), table.schema
+            )
+            for column in self.embedding_columns:
+                self.matrix_files[column] = open(
+                    os.path.join(self.path, f"{column}.npy.rows"), "wb"
+                )
+        elif dataframe.columns.tolist() != self.columns:
+            raise ValueError(
+                f"Expected the columns {self.columns}, got {dataframe.columns.tolist()}."
+            )
+        else:
+            table = pyarrow.Table.from_pandas(
+                dataframe.drop(columns=self.embedding_columns),
+                schema=self.parquet_writer.schema,
+                preserve_index=False,
+            )
+
+        for column in self.embedding_columns or []:
+            matrix = np.vstack(dataframe[column].to_numpy()).astype(
+                self.dtype, copy=False
+            )
+            if self.dimensions.setdefault(column, matrix.shape[1]) != matrix.shape[1]:
+                raise ValueError(
+                    f"Expected {self.dimensions[column]} dimensions in '{column}', "
+                    f"got {matrix.shape[1]}."
+                )
+            self.matrix_files[column].write(np.ascontiguousarray(matrix).tobytes())
+
+        self.parquet_writer.write_table(table)
+        self.num_rows += len(dataframe)
+
+    def close(self) -> None:
+        """
+        Finishes the files and replaces the previous version of the table with them.
+        """
+
+        if self.columns is None:
+            # Nothing was appended
+            save_metadata_df(pd.DataFrame(), self.path)
+            return
+
+        metadata_path = os.path.join(self.path, "metadata.parquet")
+        self.parquet_writer.close()
+        os.replace(metadata_path + ".tmp", metadata_path)
+
+        for column, rows_file in self.matrix_files.items():
+            rows_file.close()
+
+            # Prepend the .npy header, now that the number of rows is known
+            matrix_path = os.path.join(self.path, f"{column}.npy")
+            with open(matrix_path + ".tmp", "wb") as matrix_file, open(
+                matrix_path + ".rows", "rb"
+            ) as rows_file:
+                np.lib.format.write_array_header_1_0(
+                    matrix_file,
+                    {
+                        "descr": np.lib.format.dtype_to_descr(self.dtype),
+                        "fortran_order": False,
+                        "shape": (self.num_rows, self.dimensions[column]),
+                    },
+                )
+                shutil.copyfileobj(rows_file, matrix_file, 16 * 1024**2)
+            os.remove(matrix_path + ".rows")
+            os.replace(matrix_path + ".tmp", matrix_path)
+
+        columns_path = os.path.join(self.path, "metadata.json")
+        with open(columns_path + ".tmp", "w") as columns_file:
+            json.dump(
+                {"columns": self.columns, "embedding_columns": self.embedding_columns},
+                columns_file,
+            )
+        os.replace(columns_path + ".tmp", columns_path)
+
+    def discard(self) -> None:
+        """
+        Removes the files written so far, leaving the previous version of the table untouched.
+        """
+
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+            os.remove(os.path.join(self.path, "metadata.parquet.tmp"))
+
+        for column, rows_file in self.matrix_files.items():
+            rows_file.close()
+            os.remove(os.path.join(self.path, f"{column}.npy.rows"))
+
+        self.columns = None
+        self.parquet_writer = None
+        self.matrix_files = {}
+
+
+class DocumentMetadataWriter:
+    """
+    Writes the tables of `save_document_metadata` file by file, while the documents are
+    ingested (see the `stream_to_metadata_path` argument of `get_document_metadata`), so
+    peak memory is proportional to one file instead of the whole folder.
     """
 
-    return round(np.dot(dataframe[column_name], input_text_embed), 2)
+    def __init__(self, path: str):
+        """
+        Args:
+            path: The directory to write to, see `save_document_metadata`.
+        """
+
+        self.path = path
+        self.pages_writer = MetadataTableWriter(os.path.join(path, "pages"))
+        self.chunks_writer = MetadataTableWriter(os.path.join(path, "chunks"))
+        self.image_metadata_writer = MetadataTableWriter(
+            os.path.join(path, "image_metadata")
+        )
+        self.lexical_index = BM25Index()
+
+    def append(
+        self, text_metadata_df: pd.DataFrame, image_metadata_df: pd.DataFrame
+    ) -> None:
+        """
+        Appends the text and image metadata of a file.
+
+        Args:
+            text_metadata_df: The file's text metadata DataFrame.
+            image_metadata_df: The file's image metadata DataFrame.
+        """
+
+        if len(text_metadata_df):
+            # Pages never span files, so normalizing file by file gives the same tables
+            pages_df, chunks_df = get_pages_and_chunks_df(text_metadata_df)
+            self.pages_writer.append(pages_df)
+            self.chunks_writer.append(chunks_df)
+            self.lexical_index.add(chunks_df["chunk_text"])
+
+        self.image_metadata_writer.append(image_metadata_df)
+
+    def close(self) -> None:
+        """
+        Finishes the tables, replacing the previous version, and saves the BM25 index of the chunk text.
+        """
+
+        self.pages_writer.close()
+        self.chunks_writer.close()
+
+        lexical_index_path = os.path.join(self.path, "chunks", "chunk_text.bm25.npz")
+        if len(self.lexical_index):
+            self.lexical_index.save(lexical_index_path)
+        elif os.path.exists(lexical_index_path):
+            os.remove(lexical_index_path)
+        self.image_metadata_writer.close()
+
+        # Drop the denormalized text table of earlier versions
+        shutil.rmtree(os.path.join(self.path, "text_metadata"), ignore_errors=True)
+
+    def discard(self) -> None:
+        """
+        Removes the files written so far, leaving the previous tables untouched.
+        """
+
+        self.pages_writer.discard()
+        self.chunks_writer.discard()
+        self.image_metadata_writer.discard()
 
 
 def print_text_to_image_citation(
@@ -699,7 +5237,7 @@ def get_similar_image_from_query(
     Finds the top N most similar images from a metadata DataFrame based on a text query or an image query.
 
     Args:
-        text_metadata_df: A Pandas DataFrame containing text metadata associated with the images.
+        text_metadata_df: A Pandas DataFrame containing text metadata associated with the images (or the pages DataFrame of `get_pages_and_chunks_df`).
         image_metadata_df: A Pandas DataFrame containing image metadata (paths, descriptions, etc.).
         query: The text query used for finding similar images (if image_emb is False).
         image_query_path: The path to the image used for finding similar images (if image_emb is True).
@@ -714,27 +5252,20 @@ def get_similar_image_from_query(
     # Check if image embedding is used
     if image_emb:
         # Calculate cosine similarity between query image and metadata images
-        user_query_image_embedding = get_user_query_image_embeddings(
+        user_query_embedding = get_user_query_image_embeddings(
             image_query_path, embedding_size
         )
-        cosine_scores = image_metadata_df.apply(
-            lambda x: get_cosine_score(x, column_name, user_query_image_embedding),
-            axis=1,
-        )
     else:
         # Calculate cosine similarity between query text and metadata image captions
-        user_query_text_embedding = get_user_query_text_embeddings(query)
-        cosine_scores = image_metadata_df.apply(
-            lambda x: get_cosine_score(x, column_name, user_query_text_embedding),
-            axis=1,
-        )
+        user_query_embedding = get_user_query_text_embeddings(query)
 
-    # Remove same image comparison score when user image is matched exactly with metadata image
-    cosine_scores = cosine_scores[cosine_scores < 1.0]
-
-    # Get top N cosine scores and their indices
-    top_n_cosine_scores = cosine_scores.nlargest(top_n).index.tolist()
-    top_n_cosine_values = cosine_scores.nlargest(top_n).values.tolist()
+    # Get top N cosine scores and their indices, removing same image comparison
+    # score when user image is matched exactly with metadata image
+    top_n_cosine_scores, top_n_cosine_values = get_embedding_search_index(
+        image_metadata_df, column_name
+    ).search(user_query_embedding, top_n, max_score=1.0)
+    top_n_cosine_scores = top_n_cosine_scores.tolist()
+    top_n_cosine_values = top_n_cosine_values.tolist()
 
     # Create a dictionary to store matched images and their information
     final_images: Dict[int, Dict[str, Any]] = {}
@@ -768,19 +5299,12 @@ def get_similar_image_from_query(
             "page_num"
         ]
 
-        final_images[matched_imageno]["page_text"] = np.unique(
-            text_metadata_df[
-                (
-                    text_metadata_df["page_num"].isin(
-                        [final_images[matched_imageno]["page_num"]]
-                    )
-                )
-                & (
-                    text_metadata_df["file_name"].isin(
-                        [final_images[matched_imageno]["file_name"]]
-                    )
-                )
-            ]["text"].values
+        # Store page text
+        final_images[matched_imageno]["page_text"] = get_page_text_index(
+            text_metadata_df
+        ).get(
+            final_images[matched_imageno]["file_name"],
+            final_images[matched_imageno]["page_num"],
         )
 
         # Store image description
@@ -791,85 +5315,185 @@ def get_similar_image_from_query(
     return final_images
 
 
-def get_similar_text_from_query(
-    query: str,
+def search_text_metadata(
+    queries: List[str],
     text_metadata_df: pd.DataFrame,
-    column_name: str = "",
+    column_name: str,
     top_n: int = 3,
     chunk_text: bool = True,
-    print_citation: bool = False,
-) -> Dict[int, Dict[str, Any]]:
+    search_mode: str = "vector",
+    hybrid_candidates: int = 50,
+    rrf_k: int = 60,
+) -> List[Tuple[np.ndarray, np.ndarray]]:
     """
-    Finds the top N most similar text passages from a metadata DataFrame based on a text query.
+    Ranks the rows of a text metadata DataFrame for several text queries.
+
+    The queries are embedded in as few requests as possible (see
+    `get_text_embeddings_from_text_embedding_model`) and scored together
+    (see `search_embeddings_batch`).
 
     Args:
-        query: The text query used for finding similar passages.
+        queries: The text queries.
         text_metadata_df: A Pandas DataFrame containing the text metadata to search.
-        column_name: The column name in the text_metadata_df containing the text embeddings or text itself.
-        top_n: The number of most similar text passages to return.
-        embedding_size: The dimensionality of the text embeddings (only used if text embeddings are stored in the column specified by `column_name`).
-        chunk_text: Whether to return individual text chunks (True) or the entire page text (False).
-        print_citation: Whether to immediately print formatted citations for the matched text passages (True) or just return the dictionary (False).
+        column_name: The column name in the text_metadata_df containing the text embeddings.
+        top_n: The number of rows to return per query.
+        chunk_text: Whether the lexical search runs over the chunk text (True) or the page text (False).
+        search_mode: "vector", "lexical" or "hybrid", see `get_similar_text_from_query`.
+        hybrid_candidates: The number of candidates of each ranking fused in "hybrid" mode.
+        rrf_k: The reciprocal rank fusion constant, see `reciprocal_rank_fusion`.
 
     Returns:
-        A dictionary containing information about the top N most similar text passages, including cosine scores, page numbers, chunk numbers (optional), and chunk text or page text (depending on `chunk_text`).
+        One tuple of row positions and scores per query, sorted by descending score.
 
     Raises:
-        KeyError: If the specified `column_name` is not present in the `text_metadata_df`.
+        ValueError: If `search_mode` is unknown.
     """
 
-    if column_name not in text_metadata_df.columns:
-        raise KeyError(f"Column '{column_name}' not found in the 'text_metadata_df'")
+    if search_mode not in ("vector", "lexical", "hybrid"):
+        raise ValueError(
+            f"Unknown search mode '{search_mode}', expected 'vector', 'lexical' or 'hybrid'."
+        )
 
-    query_vector = get_user_query_text_embeddings(query)
+    rankings_size = top_n if search_mode != "hybrid" else hybrid_candidates
 
-    # Calculate cosine similarity between query text and metadata text
-    cosine_scores = text_metadata_df.apply(
-        lambda row: get_cosine_score(
-            row,
-            column_name,
-            query_vector,
-        ),
-        axis=1,
+    if search_mode != "lexical":
+        if len(queries) == 1:
+            query_vectors = [get_user_query_text_embeddings(queries[0])]
+        else:
+            query_vectors = get_text_embeddings_from_text_embedding_model(queries)
+
+        # Calculate cosine similarity between query text and metadata text,
+        # and get top N cosine scores and their indices
+        vector_rankings = search_embeddings_batch(
+            get_embedding_search_index(text_metadata_df, column_name),
+            np.asarray(query_vectors, dtype=np.float64),
+            rankings_size,
+        )
+        if search_mode == "vector":
+            return vector_rankings
+
+    # Keyword search: no embedding request in "lexical" mode
+    lexical_index = get_lexical_search_index(
+        text_metadata_df, "chunk_text" if chunk_text else "text"
     )
+    lexical_rankings = [lexical_index.search(query, rankings_size) for query in queries]
+    if search_mode == "lexical":
+        return lexical_rankings
+
+    return [
+        reciprocal_rank_fusion([vector_indices, lexical_indices], top_n, k=rrf_k)
+        for (vector_indices, _), (lexical_indices, _) in zip(
+            vector_rankings, lexical_rankings
+        )
+    ]
+
+
+def get_text_search_results(
+    text_metadata_df: pd.DataFrame,
+    top_n_indices: np.ndarray,
+    top_n_scores: np.ndarray,
+    chunk_text: bool = True,
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Builds the result dictionary of `get_similar_text_from_query` from ranked rows.
+
+    Args:
+        text_metadata_df: The searched text metadata DataFrame.
+        top_n_indices: The row positions, best first.
+        top_n_scores: The scores of the rows.
+        chunk_text: Whether to return individual text chunks (True) or the entire page text (False).
+
+    Returns:
+        The result dictionary, see `get_similar_text_from_query`.
+    """
 
-    # Get top N cosine scores and their indices
-    top_n_indices = cosine_scores.nlargest(top_n).index.tolist()
-    top_n_scores = cosine_scores.nlargest(top_n).values.tolist()
+    top_n_indices = top_n_indices.tolist()
+    top_n_scores = top_n_scores.tolist()
 
     # Create a dictionary to store matched text and their information
     final_text: Dict[int, Dict[str, Any]] = {}
 
     for matched_textno, index in enumerate(top_n_indices):
+        # Look up the matched row once
+        row = text_metadata_df.iloc[index]
+
         # Create a sub-dictionary for each matched text
         final_text[matched_textno] = {}
 
         # Store page number
-        final_text[matched_textno]["file_name"] = text_metadata_df.iloc[index][
-            "file_name"
-        ]
+        final_text[matched_textno]["file_name"] = row["file_name"]
 
         # Store page number
-        final_text[matched_textno]["page_num"] = text_metadata_df.iloc[index][
-            "page_num"
-        ]
+        final_text[matched_textno]["page_num"] = row["page_num"]
 
         # Store cosine score
         final_text[matched_textno]["cosine_score"] = top_n_scores[matched_textno]
 
         if chunk_text:
             # Store chunk number
-            final_text[matched_textno]["chunk_number"] = text_metadata_df.iloc[index][
-                "chunk_number"
-            ]
+            final_text[matched_textno]["chunk_number"] = row["chunk_number"]
 
             # Store chunk text
-            final_text[matched_textno]["chunk_text"] = text_metadata_df["chunk_text"][
-                index
-            ]
+            final_text[matched_textno]["chunk_text"] = row["chunk_text"]
         else:
             # Store page text
-            final_text[matched_textno]["text"] = text_metadata_df["text"][index]
+            final_text[matched_textno]["text"] = row["text"]
+
+    return final_text
+
+
+def get_similar_text_from_query(
+    query: str,
+    text_metadata_df: pd.DataFrame,
+    column_name: str = "",
+    top_n: int = 3,
+    chunk_text: bool = True,
+    print_citation: bool = False,
+    search_mode: str = "vector",
+    hybrid_candidates: int = 50,
+    rrf_k: int = 60,
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Finds the top N most similar text passages from a metadata DataFrame based on a text query.
+
+    Args:
+        query: The text query used for finding similar passages.
+        text_metadata_df: A Pandas DataFrame containing the text metadata to search.
+        column_name: The column name in the text_metadata_df containing the text embeddings or text itself.
+        top_n: The number of most similar text passages to return.
+        embedding_size: The dimensionality of the text embeddings (only used if text embeddings are stored in the column specified by `column_name`).
+        chunk_text: Whether to return individual text chunks (True) or the entire page text (False).
+        print_citation: Whether to immediately print formatted citations for the matched text passages (True) or just return the dictionary (False).
+        search_mode: "vector" (cosine similarity of the embeddings), "lexical" (BM25 over the chunk or page
+                     text, without calling the embedding model) or "hybrid" (reciprocal rank fusion of both).
+                     The "cosine_score" of the results holds the BM25 score in "lexical" mode and the
+                     fused score in "hybrid" mode.
+        hybrid_candidates: The number of candidates of each ranking fused in "hybrid" mode.
+        rrf_k: The reciprocal rank fusion constant, see `reciprocal_rank_fusion`.
+
+    Returns:
+        A dictionary containing information about the top N most similar text passages, including cosine scores, page numbers, chunk numbers (optional), and chunk text or page text (depending on `chunk_text`).
+
+    Raises:
+        KeyError: If the specified `column_name` is not present in the `text_metadata_df`.
+    """
+
+    if column_name not in text_metadata_df.columns:
+        raise KeyError(f"Column '{column_name}' not found in the 'text_metadata_df'")
+
+    (top_n_indices, top_n_scores), *_ = search_text_metadata(
+        [query],
+        text_metadata_df,
+        column_name,
+        top_n=top_n,
+        chunk_text=chunk_text,
+        search_mode=search_mode,
+        hybrid_candidates=hybrid_candidates,
+        rrf_k=rrf_k,
+    )
+    final_text = get_text_search_results(
+        text_metadata_df, top_n_indices, top_n_scores, chunk_text
+    )
 
     # Optionally print citations immediately
     if print_citation:
@@ -878,6 +5502,75 @@ def get_similar_text_from_query(
     return final_text
 
 
+def get_similar_text_from_queries(
+    queries: List[str],
+    text_metadata_df: pd.DataFrame,
+    column_name: str = "",
+    top_n: int = 3,
+    chunk_text: bool = True,
+    print_citation: bool = False,
+    search_mode: str = "vector",
+    hybrid_candidates: int = 50,
+    rrf_k: int = 60,
+) -> List[Dict[int, Dict[str, Any]]]:
+    """
+    Finds the top N most similar text passages for each of several text queries.
+
+    Equivalent to calling `get_similar_text_from_query` once per query, but the queries are
+    embedded in batches and scored against the whole DataFrame with matrix-matrix products.
+
+    Args:
+        queries: The text queries.
+        text_metadata_df: A Pandas DataFrame containing the text metadata to search.
+        column_name: The column name in the text_metadata_df containing the text embeddings.
+        top_n: The number of most similar text passages to return per query.
+        chunk_text: Whether to return individual text chunks (True) or the entire page text (False).
+        print_citation: Whether to immediately print formatted citations for the matched text passages.
+        search_mode: "vector", "lexical" or "hybrid", see `get_similar_text_from_query`.
+        hybrid_candidates: The number of candidates of each ranking fused in "hybrid" mode.
+        rrf_k: The reciprocal rank fusion constant, see `reciprocal_rank_fusion`.
+
+    Returns:
+        One dictionary per query, in the same order as `queries` and in the format
+        returned by `get_similar_text_from_query`.
+
+    Raises:
+        KeyError: If the specified `column_name` is not present in the `text_metadata_df`.
+    """
+
+    if column_name not in text_metadata_df.columns:
+        raise KeyError(f"Column '{column_name}' not found in the 'text_metadata_df'")
+
+    if not queries:
+        return []
+
+    rankings = search_text_metadata(
+        list(queries),
+        text_metadata_df,
+        column_name,
+        top_n=top_n,
+        chunk_text=chunk_text,
+        search_mode=search_mode,
+        hybrid_candidates=hybrid_candidates,
+        rrf_k=rrf_k,
+    )
+
+    results = []
+    for query, (top_n_indices, top_n_scores) in zip(queries, rankings):
+        final_text = get_text_search_results(
+            text_metadata_df, top_n_indices, top_n_scores, chunk_text
+        )
+
+        # Optionally print citations immediately
+        if print_citation:
+            print(f"Query: {query}")
+            print_text_to_text_citation(final_text, chunk_text=chunk_text)
+
+        results.append(final_text)
+
+    return results
+
+
 def display_images(
     images: Iterable[Union[str, PIL.Image.Image]], resize_ratio: float = 0.5
 ) -> None:
@@ -2,9 +2,18 @@
 
 from __future__ import annotations
 
+from abc import ABC, abstractmethod
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import datetime
+import hashlib
+import itertools
 import json
 import logging
-from typing import Any, Iterable, List, Optional, Type
+import os
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple, Type
 import uuid
 
 import google.auth
@@ -17,9 +26,264 @@ from langchain.embeddings import TensorflowHubEmbeddings
 from langchain.embeddings.base import Embeddings
 from langchain.vectorstores.base import VectorStore
 import requests
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger()
 
+# Credentials are refreshed when they expire in less than this
+CREDENTIALS_REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+# Maximum number of queries sent in one findNeighbors request
+MAX_QUERIES_PER_REQUEST = 100
+
+
+class DocumentCache(ABC):
+    """Interface of the document caches of :class:`MatchingEngine`.
+
+    A cache maps a GCS location (e.g. documents/{id}) to the content of the
+    document stored there. Implementations must be thread-safe.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the cached content of a document, or None if missing."""
+
+    @abstractmethod
+    def set(self, key: str, value: bytes) -> None:
+        """Stores the content of a document."""
+
+    @abstractmethod
+    def invalidate(self, key: str) -> None:
+        """Removes a document from the cache."""
+
+    @abstractmethod
+    def get_stats(self) -> Dict[str, Any]:
+        """Returns the hit and miss counters of the cache."""
+
+
+class LRUDocumentCache(DocumentCache):
+    """In-process LRU document cache with an optional on-disk tier.
+
+    Both tiers are bounded in bytes and entries expire after ttl_seconds.
+    Documents evicted from memory stay on disk, and documents found on disk
+    are promoted back to memory, keeping the expiry of the disk entry.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024**2,
+        ttl_seconds: Optional[float] = 3600,
+        disk_path: Optional[str] = None,
+        max_disk_bytes: int = 1024**3,
+    ):
+        """In-process LRU document cache with an optional on-disk tier.
+
+        Attributes:
+            max_bytes: The maximum total size of the documents kept in memory.
+            ttl_seconds: The number of seconds a document stays valid, or None
+            to keep documents until they are evicted.
+            disk_path (Optional): The directory of the on-disk tier. It is
+            created if it doesn't exist.
+            max_disk_bytes: The maximum total size of the on-disk tier.
+        """
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.max_disk_bytes = max_disk_bytes
+
+        self._entries: OrderedDict[str, Tuple[bytes, float]] = OrderedDict()
+        self._size_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        # Incremented by every write, so a document read from disk is not
+        # promoted to memory if it was replaced or invalidated meanwhile
+        self._version = 0
+
+        self._disk_size_bytes = 0
+        if disk_path is not None:
+            os.makedirs(disk_path, exist_ok=True)
+            self._disk_size_bytes = sum(
+                entry.stat().st_size for entry in self._scan_disk()
+            )
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the cached content of a document, or None if missing or expired.
+
+        Args:
+            key: The GCS location of the document.
+
+        Returns:
+            The content of the document or None.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return value
+                self._remove(key)
+            version = self._version
+
+        disk_entry = self._get_from_disk(key, now)
+        with self._lock:
+            if disk_entry is None:
+                self._stats["misses"] += 1
+                return None
+            value, expires_at = disk_entry
+            self._stats["disk_hits"] += 1
+            if self._version == version:
+                self._set_in_memory(key, value, expires_at)
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        """Stores the content of a document in both tiers.
+
+        Args:
+            key: The GCS location of the document.
+            value: The content of the document.
+        """
+        now = time.time()
+        with self._lock:
+            self._version += 1
+            self._set_in_memory(key, value, self._get_expiry(now))
+        self._set_on_disk(key, value)
+
+    def invalidate(self, key: str) -> None:
+        """Removes a document from both tiers.
+
+        Args:
+            key: The GCS location of the document.
+        """
+        with self._lock:
+            self._version += 1
+            self._remove(key)
+            if self.disk_path is not None:
+                self._remove_from_disk(self._get_disk_file(self.disk_path, key))
+
+    def clear(self) -> None:
+        """Removes every document and resets the counters."""
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._size_bytes = 0
+            self._stats = dict.fromkeys(self._stats, 0)
+            if self.disk_path is not None:
+                # Files being written by set() are not counted in the size yet
+                for entry in self._scan_disk():
+                    self._remove_from_disk(entry.path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Returns the hit and miss counters and the size of the cache.
+
+        Returns:
+            A dictionary with the memory_hits, disk_hits, misses, hit_rate,
+            evictions, entries, size_bytes and disk_size_bytes of the cache.
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            hits = stats["memory_hits"] + stats["disk_hits"]
+            lookups = hits + stats["misses"]
+            stats["hit_rate"] = hits / lookups if lookups else 0.0
+            stats["entries"] = len(self._entries)
+            stats["size_bytes"] = self._size_bytes
+            stats["disk_size_bytes"] = self._disk_size_bytes
+            return stats
+
+    def _get_expiry(self, now: float) -> float:
+        return now + self.ttl_seconds if self.ttl_seconds is not None else float("inf")
+
+    def _set_in_memory(self, key: str, value: bytes, expires_at: float) -> None:
+        self._remove(key)
+        if len(value) > self.max_bytes:
+            return
+
+        self._entries[key] = (value, expires_at)
+        self._size_bytes += len(value)
+        while self._size_bytes > self.max_bytes:
+            _, (evicted_value, _) = self._entries.popitem(last=False)
+            self._size_bytes -= len(evicted_value)
+            self._stats["evictions"] += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size_bytes -= len(entry[0])
+
+    @staticmethod
+    def _get_disk_file(disk_path: str, key: str) -> str:
+        return os.path.join(disk_path, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def _get_from_disk(self, key: str, now: float) -> Optional[Tuple[bytes, float]]:
+        if self.disk_path is None:
+            return None
+
+        disk_file = self._get_disk_file(self.disk_path, key)
+        try:
+            with open(disk_file, "rb") as f:
+                # The modification time is the time the document was written
+                modified_at = os.fstat(f.fileno()).st_mtime
+                expires_at = self._get_expiry(modified_at)
+                value = f.read() if expires_at > now else None
+        except FileNotFoundError:
+            return None
+
+        if value is None:
+            with self._lock:
+                self._remove_from_disk(disk_file)
+            return None
+
+        # Keep recently read documents from being evicted first
+        try:
+            os.utime(disk_file, (now, modified_at))
+        except FileNotFoundError:
+            # Invalidated or evicted meanwhile
+            return None
+        return value, expires_at
+
+    def _set_on_disk(self, key: str, value: bytes) -> None:
+        if self.disk_path is None or len(value) > self.max_disk_bytes:
+            return
+
+        disk_file = self._get_disk_file(self.disk_path, key)
+        temporary_file = f"{disk_file}.{threading.get_ident()}.tmp"
+        with open(temporary_file, "wb") as f:
+            f.write(value)
+
+        with self._lock:
+            self._remove_from_disk(disk_file)
+            os.replace(temporary_file, disk_file)
+            self._disk_size_bytes += len(value)
+            if self._disk_size_bytes > self.max_disk_bytes:
+                self._evict_from_disk()
+
+    def _scan_disk(self) -> List[os.DirEntry]:
+        # Files being written by set() are not part of the cache yet
+        return [
+            entry
+            for entry in os.scandir(self.disk_path)
+            if entry.is_file() and not entry.name.endswith(".tmp")
+        ]
+
+    def _remove_from_disk(self, disk_file: str) -> None:
+        try:
+            size = os.stat(disk_file).st_size
+            os.remove(disk_file)
+        except FileNotFoundError:
+            return
+        self._disk_size_bytes -= size
+
+    def _evict_from_disk(self) -> None:
+        # Least recently read first, down to 90% of the bound
+        entries = sorted(self._scan_disk(), key=lambda entry: entry.stat().st_atime)
+        for entry in entries:
+            if self._disk_size_bytes <= 0.9 * self.max_disk_bytes:
+                break
+            self._remove_from_disk(entry.path)
+            self._stats["evictions"] += 1
+
 
 class MatchingEngine(VectorStore):
     """Vertex AI Matching Engine implementation of the vector store.
@@ -48,6 +312,8 @@ class MatchingEngine(VectorStore):
         index_endpoint_client: aiplatform_v1.IndexEndpointServiceClient,
         gcs_bucket_name: str,
         credentials: Credentials = None,
+        max_download_workers: int = 16,
+        document_cache: Optional[DocumentCache] = None,
     ):
         """Vertex AI Matching Engine implementation of the vector store.
 
@@ -75,6 +341,10 @@ class MatchingEngine(VectorStore):
             multilingual TensorFlow Universal Sentence Encoder will be used.
             gcs_client: The Google Cloud Storage client.
             credentials (Optional): Created Google Cloud credentials.
+            max_download_workers: The maximum number of documents downloaded
+            concurrently from GCS by a search.
+            document_cache (Optional): A :class:`DocumentCache` in front of
+            the document downloads, e.g. a :class:`LRUDocumentCache`.
         """
         super().__init__()
         self._validate_google_libraries_installation()
@@ -90,6 +360,17 @@ class MatchingEngine(VectorStore):
         self.gcs_client = gcs_client
         self.credentials = credentials
         self.gcs_bucket_name = gcs_bucket_name
+        self.max_download_workers = max_download_workers
+        self.document_cache = document_cache
+
+        self._bucket = None
+        self._bucket_lock = threading.Lock()
+        self._download_executor: Optional[ThreadPoolExecutor] = None
+        self._download_executor_lock = threading.Lock()
+
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
+        self._credentials_lock = threading.Lock()
 
     def _validate_google_libraries_installation(self) -> None:
         """Validates that Google libraries that are needed are installed."""
@@ -103,59 +384,239 @@ class MatchingEngine(VectorStore):
                 "to use the MatchingEngine Vectorstore."
             )
 
+    def close(self) -> None:
+        """Releases the threads used to download documents and the HTTP session.
+
+        The instance can still be used afterwards, the threads and the session
+        are created again when needed.
+        """
+        with self._download_executor_lock:
+            download_executor = self._download_executor
+            self._download_executor = None
+        if download_executor is not None:
+            download_executor.shutdown(wait=True)
+
+        with self._session_lock:
+            session = self._session
+            self._session = None
+        if session is not None:
+            session.close()
+
+    def __enter__(self) -> MatchingEngine:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
     def add_texts(
         self,
         texts: Iterable[str],
-        metadatas: Optional[Iterable[dict]],
+        metadatas: Optional[Iterable[dict]] = None,
+        batch_size: int = 100,
+        max_upload_workers: int = 16,
+        max_pending_batches: int = 4,
         **kwargs: Any,
     ) -> List[str]:
         """Run more texts through the embeddings and add to the vectorstore.
 
+        The texts are loaded in a pipeline of fixed-size batches: while a
+        batch is upserted, the next ones are embedded and their documents
+        uploaded to GCS concurrently. The documents of a batch are only
+        uploaded once its embeddings succeed, and the batch is only upserted
+        once all its documents are uploaded. If the load fails, the uploaded
+        documents of the batches that were not upserted are deleted. At most
+        max_pending_batches batches are held in memory, so texts can be a
+        lazy iterable of any length. The time spent in each stage is stored
+        in last_add_texts_stats: the busy time of the embedding and upsert
+        stages, and the wall-clock time from the first upload to the last
+        one for the concurrent upload stage.
+
         Args:
             texts: Iterable of strings to add to the vectorstore.
             metadatas: Optional list of metadatas associated with the texts.
+            batch_size: The number of texts per embedding request and per
+            upsert request.
+            max_upload_workers: The maximum number of concurrent GCS uploads.
+            max_pending_batches: The maximum number of batches being embedded
+            or uploaded while a batch is upserted.
             kwargs: vectorstore specific parameters.
 
         Returns:
             List of ids from adding the texts into the vectorstore.
         """
-        logger.debug("Embedding documents.")
-        embeddings = self.embedding.embed_documents(list(texts))
-        insert_datapoints_payload = []
-        ids = []
-
-        # Streaming index update
-        for idx, (embedding, text, metadata) in enumerate(
-            zip(embeddings, texts, metadatas or [])
-        ):
-            id = uuid.uuid4()
-            ids.append(str(id))
-            self._upload_to_gcs(text, f"documents/{id}")
-
-            insert_datapoints_payload.append(
-                aiplatform_v1.IndexDatapoint(
-                    datapoint_id=str(id),
-                    feature_vector=embedding,
-                    restricts=metadata if metadata else [],
-                )
-            )
-            if idx % 100 == 0:
-                upsert_request = aiplatform_v1.UpsertDatapointsRequest(
-                    index=self.index.name, datapoints=insert_datapoints_payload
-                )
-                self.index_client.upsert_datapoints(request=upsert_request)
-                insert_datapoints_payload = []
-        if len(insert_datapoints_payload) > 0:
-            upsert_request = aiplatform_v1.UpsertDatapointsRequest(
-                index=self.index.name, datapoints=insert_datapoints_payload
+        stats: Dict[str, Dict[str, float]] = {
+            stage: {"documents": 0, "seconds": 0.0}
+            for stage in ("embedding", "upload", "upsert")
+        }
+        # (first start, last end) of the uploads
+        upload_span: List[float] = []
+        stats_lock = threading.Lock()
+
+        def timed(stage: str, documents: int, function: Callable, *args: Any) -> Any:
+            started_at = time.perf_counter()
+            result = function(*args)
+            finished_at = time.perf_counter()
+            with stats_lock:
+                stats[stage]["documents"] += documents
+                stats[stage]["seconds"] += finished_at - started_at
+                if stage == "upload":
+                    upload_span[:] = (
+                        (
+                            min(upload_span[0], started_at),
+                            max(upload_span[1], finished_at),
+                        )
+                        if upload_span
+                        else (started_at, finished_at)
+                    )
+            return result
+
+        def upload(embeddings: Future, text: str, gcs_location: str) -> None:
+            # A failed embedding request leaves no orphaned documents in GCS
+            embeddings.result()
+            timed("upload", 1, self._upload_to_gcs, text, gcs_location)
+
+        records = zip(
+            texts, metadatas if metadatas is not None else itertools.repeat(None)
+        )
+        # (ids, metadatas, embeddings future, upload futures) of each batch
+        pending: Deque[
+            Tuple[List[str], List[Optional[dict]], Future, List[Future]]
+        ] = deque()
+        ids: List[str] = []
+        started_at = time.perf_counter()
+
+        with ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="matching-engine-embedding"
+        ) as embedding_executor, ThreadPoolExecutor(
+            max_workers=max_upload_workers,
+            thread_name_prefix="matching-engine-upload",
+        ) as upload_executor:
+            try:
+                for batch in iter(
+                    lambda: list(itertools.islice(records, batch_size)), []
+                ):
+                    batch_texts = [text for text, _ in batch]
+                    batch_ids = [str(uuid.uuid4()) for _ in batch]
+
+                    logger.debug(f"Embedding {len(batch_texts)} documents.")
+                    embeddings = embedding_executor.submit(
+                        timed,
+                        "embedding",
+                        len(batch_texts),
+                        self.embedding.embed_documents,
+                        batch_texts,
+                    )
+                    uploads = [
+                        upload_executor.submit(
+                            upload, embeddings, text, f"documents/{id}"
+                        )
+                        for id, text in zip(batch_ids, batch_texts)
+                    ]
+                    pending.append(
+                        (
+                            batch_ids,
+                            [metadata for _, metadata in batch],
+                            embeddings,
+                            uploads,
+                        )
+                    )
+
+                    while len(pending) > max_pending_batches:
+                        ids.extend(self._upsert_batch(*pending[0], timed))
+                        pending.popleft()
+
+                while pending:
+                    ids.extend(self._upsert_batch(*pending[0], timed))
+                    pending.popleft()
+            except BaseException:
+                # Don't start the remaining uploads of a failed load, and
+                # delete the documents of the batches that were not upserted
+                for *_, uploads in pending:
+                    for upload_future in uploads:
+                        upload_future.cancel()
+                for batch_ids, _, _, uploads in pending:
+                    for id, upload_future in zip(batch_ids, uploads):
+                        if (
+                            not upload_future.cancelled()
+                            and upload_future.exception() is None
+                        ):
+                            self._delete_from_gcs(f"documents/{id}")
+                raise
+
+        stats["total"] = {
+            "documents": len(ids),
+            "seconds": time.perf_counter() - started_at,
+        }
+        if upload_span:
+            # The uploads run concurrently: their busy time overlaps
+            stats["upload"]["seconds"] = upload_span[1] - upload_span[0]
+        for stage_stats in stats.values():
+            stage_stats["documents_per_second"] = (
+                stage_stats["documents"] / stage_stats["seconds"]
+                if stage_stats["seconds"]
+                else 0.0
             )
-            _ = self.index_client.upsert_datapoints(request=upsert_request)
+        self.last_add_texts_stats = stats
 
         logger.debug("Updated index with new configuration.")
         logger.info(f"Indexed {len(ids)} documents to Matching Engine.")
+        logger.info(
+            "Throughput per stage (documents per second): "
+            + ", ".join(
+                f"{stage}: {stage_stats['documents_per_second']:.1f}"
+                for stage, stage_stats in stats.items()
+            )
+        )
 
         return ids
 
+    def _upsert_batch(
+        self,
+        ids: List[str],
+        metadatas: List[Optional[dict]],
+        embeddings: Future,
+        uploads: List[Future],
+        timed: Callable,
+    ) -> List[str]:
+        """Upserts a batch of add_texts once its documents are uploaded.
+
+        Args:
+            ids: The ids of the documents.
+            metadatas: The metadatas of the documents.
+            embeddings: The Future of the embeddings of the documents.
+            uploads: The Futures of the uploads of the documents.
+            timed: The function measuring the stages of add_texts.
+
+        Returns:
+            The ids of the documents.
+        """
+        insert_datapoints_payload = [
+            aiplatform_v1.IndexDatapoint(
+                datapoint_id=id,
+                feature_vector=embedding,
+                restricts=metadata if metadata else [],
+            )
+            for id, embedding, metadata in zip(ids, embeddings.result(), metadatas)
+        ]
+        for upload in uploads:
+            upload.result()
+
+        upsert_request = aiplatform_v1.UpsertDatapointsRequest(
+            index=self.index.name, datapoints=insert_datapoints_payload
+        )
+        timed("upsert", len(ids), self._upsert_datapoints, upsert_request)
+        return ids
+
+    def _upsert_datapoints(
+        self, upsert_request: aiplatform_v1.UpsertDatapointsRequest
+    ) -> None:
+        """Sends an upsert request to the index.
+
+        Args:
+            upsert_request: The request.
+        """
+        self.index_client.upsert_datapoints(request=upsert_request)
+
     def _upload_to_gcs(self, data: str, gcs_location: str) -> None:
         """Uploads data to gcs_location.
 
@@ -163,9 +624,24 @@ class MatchingEngine(VectorStore):
             data: The data that will be stored.
             gcs_location: The location where the data will be stored.
         """
-        bucket = self.gcs_client.get_bucket(self.gcs_bucket_name)
+        bucket = self._get_bucket()
         blob = bucket.blob(gcs_location)
         blob.upload_from_string(data)
+        if self.document_cache is not None:
+            self.document_cache.invalidate(gcs_location)
+
+    def _delete_from_gcs(self, gcs_location: str) -> None:
+        """Deletes the data stored at gcs_location, logging failures.
+
+        Args:
+            gcs_location: The location of the data.
+        """
+        try:
+            self._get_bucket().blob(gcs_location).delete()
+        except Exception as e:
+            logger.warning(f"Failed to delete {gcs_location}: {e}")
+        if self.document_cache is not None:
+            self.document_cache.invalidate(gcs_location)
 
     def get_matches(
         self,
@@ -201,11 +677,63 @@ class MatchingEngine(VectorStore):
 
         logger.debug(f"Querying Matching Engine Index Endpoint {rpc_address}")
 
-        request = google.auth.transport.requests.Request()
-        self.credentials.refresh(request)
-        header = {"Authorization": "Bearer " + self.credentials.token}
+        session = self._get_session()
+        header = {"Authorization": "Bearer " + self._get_access_token()}
+        response = session.post(rpc_address, data=endpoint_json_data, headers=header)
 
-        return requests.post(rpc_address, data=endpoint_json_data, headers=header)
+        if response.status_code == 401:
+            # The token was revoked or expired early: refresh it once
+            header = {"Authorization": "Bearer " + self._get_access_token(force=True)}
+            response = session.post(
+                rpc_address, data=endpoint_json_data, headers=header
+            )
+
+        return response
+
+    def _get_session(self) -> requests.Session:
+        """Gets the HTTP session of the index endpoint queries.
+
+        The session is created once per instance and keeps its connections
+        alive, so queries after the first one skip the TLS handshake.
+
+        Returns:
+            The requests Session.
+        """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=1, pool_maxsize=self.max_download_workers
+                    )
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def _get_access_token(self, force: bool = False) -> str:
+        """Gets an access token, only refreshing the credentials near expiry.
+
+        Args:
+            force: Whether to refresh the credentials in any case.
+
+        Returns:
+            The access token.
+        """
+        with self._credentials_lock:
+            expiry = getattr(self.credentials, "expiry", None)
+            if expiry is not None:
+                # google-auth stores the expiry as a naive UTC datetime
+                if expiry.tzinfo is None:
+                    expiry = expiry.replace(tzinfo=datetime.timezone.utc)
+                now = datetime.datetime.now(datetime.timezone.utc)
+                expires_soon = expiry - now < CREDENTIALS_REFRESH_MARGIN
+            else:
+                expires_soon = False
+
+            if force or not self.credentials.token or expires_soon:
+                request = google.auth.transport.requests.Request()
+                self.credentials.refresh(request)
+            return self.credentials.token
 
     def similarity_search(
         self,
@@ -226,8 +754,42 @@ class MatchingEngine(VectorStore):
             A list of k matching documents.
         """
 
-        logger.debug(f"Embedding query {query}.")
-        embedding_query = self.embedding.embed_documents([query])
+        return self.similarity_search_batch(
+            [query], k=k, search_distance=search_distance, filters=filters
+        )[0]
+
+    def similarity_search_batch(
+        self,
+        queries: List[str],
+        k: int = 4,
+        search_distance: float = 0.65,
+        filters: dict = {},
+        max_queries_per_request: int = MAX_QUERIES_PER_REQUEST,
+        **kwargs: Any,
+    ) -> List[List[Document]]:
+        """Return docs most similar to each of several queries.
+
+        The queries are embedded in one call and sent in as few findNeighbors
+        requests as possible. The documents of all the neighbors are then
+        downloaded in one concurrent pass, once each even if several queries
+        share them.
+
+        Args:
+            queries: The strings that will be used to search for similar documents.
+            k: The amount of neighbors that will be retrieved per query.
+            search_distance: filter search results by search distance by adding a threshold value
+            filters: The restricts of the queries.
+            max_queries_per_request: The maximum number of queries per
+            findNeighbors request.
+
+        Returns:
+            One list of k matching documents per query, in the order of queries.
+        """
+        if len(queries) == 0:
+            return []
+
+        logger.debug(f"Embedding {len(queries)} queries.")
+        embedding_queries = self.embedding.embed_documents(list(queries))
         deployed_index_id = self._get_index_id()
         logger.debug(f"Deployed Index ID = {deployed_index_id}")
 
@@ -238,44 +800,67 @@ class MatchingEngine(VectorStore):
         #     num_neighbors=k,
         # )
 
-        response = self.get_matches(embedding_query, k, self.endpoint, filters)
-
-        if response.status_code == 200:
-            response = response.json()["nearestNeighbors"]
-        else:
-            raise Exception(f"Failed to query index {str(response)}")
+        # Neighbors of each query, in the order of queries
+        neighbors: List[List[dict]] = []
+        for start in range(0, len(embedding_queries), max_queries_per_request):
+            end = start + max_queries_per_request
+            request_queries = embedding_queries[start:end]
+            response = self.get_matches(request_queries, k, self.endpoint, filters)
 
-        if len(response) == 0:
-            return []
+            if response.status_code == 200:
+                response = response.json().get("nearestNeighbors", [])
+            else:
+                raise Exception(f"Failed to query index {str(response)}")
 
-        logger.debug(f"Found {len(response)} matches for the query {query}.")
+            # The response lists the queries by the datapoint ids get_matches
+            # gave them, i.e. their position in the request
+            request_neighbors: List[List[dict]] = [[] for _ in request_queries]
+            for position, query_neighbors in enumerate(response):
+                query_position = int(query_neighbors.get("id", position))
+                request_neighbors[query_position] = query_neighbors.get("neighbors", [])
+            neighbors.extend(request_neighbors)
 
-        results = []
+        logger.debug(
+            f"Found {sum(map(len, neighbors))} matches for {len(queries)} queries."
+        )
 
-        # I'm only getting the first one because queries receives an array
-        # and the similarity_search method only receives one query. This
-        # means that the match method will always return an array with only
-        # one element.
-        for doc in response[0]["neighbors"]:
-            page_content = self._download_from_gcs(
+        # Only download the documents that pass the distance threshold, once
+        gcs_locations = list(
+            dict.fromkeys(
                 f"documents/{doc['datapoint']['datapointId']}"
+                for query_neighbors in neighbors
+                for doc in query_neighbors
+                if doc.get("distance", search_distance) >= search_distance
             )
-            metadata = {}
-            if "restricts" in doc["datapoint"]:
-                metadata = {
-                    item["namespace"]: item["allowList"][0]
-                    for item in doc["datapoint"]["restricts"]
-                }
-            if "distance" in doc:
-                metadata["score"] = doc["distance"]
-                if doc["distance"] >= search_distance:
-                    results.append(
-                        Document(page_content=page_content, metadata=metadata)
-                    )
-            else:
-                results.append(Document(page_content=page_content, metadata=metadata))
+        )
+        page_contents = dict(
+            zip(gcs_locations, self._download_documents(gcs_locations))
+        )
+
+        results: List[List[Document]] = []
+        for query_neighbors in neighbors:
+            query_results = []
+            for doc in query_neighbors:
+                metadata = {}
+                if "restricts" in doc["datapoint"]:
+                    metadata = {
+                        item["namespace"]: item["allowList"][0]
+                        for item in doc["datapoint"]["restricts"]
+                    }
+                if "distance" in doc:
+                    metadata["score"] = doc["distance"]
+                    if doc["distance"] < search_distance:
+                        continue
+
+                page_content = page_contents[
+                    f"documents/{doc['datapoint']['datapointId']}"
+                ]
+                query_results.append(
+                    Document(page_content=page_content, metadata=metadata)
+                )
+            results.append(query_results)
 
-        logger.debug("Downloaded documents for query.")
+        logger.debug("Downloaded documents for queries.")
 
         return results
 
@@ -305,13 +890,59 @@ class MatchingEngine(VectorStore):
         Returns:
             The string contents of the file.
         """
-        bucket = self.gcs_client.get_bucket(self.gcs_bucket_name)
+        if self.document_cache is not None:
+            cached = self.document_cache.get(gcs_location)
+            if cached is not None:
+                return cached.decode("utf-8")
+
+        bucket = self._get_bucket()
         try:
             blob = bucket.blob(gcs_location)
-            return blob.download_as_string()
+            content = blob.download_as_string()
         except Exception:
             return ""
 
+        if self.document_cache is not None:
+            self.document_cache.set(gcs_location, content)
+        return content.decode("utf-8")
+
+    def _download_documents(self, gcs_locations: List[str]) -> List[str]:
+        """Downloads several documents from GCS concurrently.
+
+        Args:
+            gcs_locations: The locations of the files.
+
+        Returns:
+            The string contents of the files, in the order of gcs_locations.
+        """
+        if len(gcs_locations) <= 1:
+            return [self._download_from_gcs(location) for location in gcs_locations]
+
+        # The downloads are submitted under the lock, so close() can only shut the
+        # executor down before or after them, and then waits for them to finish
+        with self._download_executor_lock:
+            download_executor = self._download_executor
+            if download_executor is None:
+                download_executor = self._download_executor = ThreadPoolExecutor(
+                    max_workers=self.max_download_workers,
+                    thread_name_prefix="matching-engine-download",
+                )
+            contents = download_executor.map(self._download_from_gcs, gcs_locations)
+
+        return list(contents)
+
+    def _get_bucket(self) -> storage.Bucket:
+        """Gets the GCS bucket of the documents, only looking it up once.
+
+        Returns:
+            The GCS bucket.
+        """
+        if self._bucket is None:
+            with self._bucket_lock:
+                if self._bucket is None:
+                    self._bucket = self.gcs_client.get_bucket(self.gcs_bucket_name)
+        return self._bucket
+
     @classmethod
     def from_texts(
         cls: Type["MatchingEngine"],
@@ -352,6 +983,8 @@ class MatchingEngine(VectorStore):
         endpoint_id: str,
         credentials_path: Optional[str] = None,
         embedding: Optional[Embeddings] = None,
+        max_download_workers: int = 16,
+        document_cache: Optional[DocumentCache] = None,
     ) -> "MatchingEngine":
         """Takes the object creation out of the constructor.
 
@@ -367,6 +1000,10 @@ class MatchingEngine(VectorStore):
             the local file system.
             embedding: The :class:`Embeddings` that will be used for
             embedding the texts.
+            max_download_workers: The maximum number of documents downloaded
+            concurrently from GCS by a search.
+            document_cache (Optional): A :class:`DocumentCache` in front of
+            the document downloads, e.g. a :class:`LRUDocumentCache`.
 
         Returns:
             A configured MatchingEngine with the texts added to the index.
@@ -404,6 +1041,8 @@ class MatchingEngine(VectorStore):
             index_endpoint_client=index_endpoint_client,
             credentials=credentials,
             gcs_bucket_name=gcs_bucket_name,
+            max_download_workers=max_download_workers,
+            document_cache=document_cache,
         )
 
     @classmethod